@@ -0,0 +1,86 @@
+"""
+
+    Benchmarks the CPU vs bytes trade-off of the compressors on representative
+    cached payloads.
+
+    Usage::
+
+        python benchmarks/compression.py
+
+    For every payload and compressor, prints the stored size, the ratio to the
+    uncompressed payload, and the time it takes to encode and decode it.
+
+"""
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pycacher import serializers
+from pycacher.serializers import PickleSerializer
+from pycacher.compression import ZlibCompressor, LZMACompressor
+
+def build_payloads():
+    rnd = random.Random(42)
+
+    return [
+        #cache_list chunks and "all ids of X" lists
+        ('sequential ids x10k', list(range(1000000, 1010000))),
+        ('random ids x10k', [rnd.randint(0, 2 ** 40) for i in range(10000)]),
+        #model rows
+        ('rows x500', [{'id': i, 'username': 'user%s' % i, 'email': 'user%s@example.com' % i,
+                        'active': i % 3 == 0, 'score': rnd.random()} for i in range(500)]),
+        #rendered fragments
+        ('html 50KB', ('<li class="item"><a href="/items/%s">Item %s</a></li>' * 1000)
+                          % tuple(i for j in range(1000) for i in (j, j))),
+        #small values, below any sensible threshold
+        ('small dict', {'id': 1, 'name': 'test'}),
+    ]
+
+COMPRESSORS = [
+    ('none', None),
+    ('zlib-1', ZlibCompressor(level=1, threshold=0)),
+    ('zlib-6', ZlibCompressor(level=6, threshold=0)),
+    ('zlib-9', ZlibCompressor(level=9, threshold=0)),
+    ('lzma-0', LZMACompressor(preset=0, threshold=0)),
+    ('lzma-6', LZMACompressor(preset=6, threshold=0)),
+]
+
+def measure(fn, number):
+    """Returns the best per-call time of `fn` in microseconds."""
+    return min(timeit.repeat(fn, number=number, repeat=3)) / number * 1e6
+
+def run(number=20):
+    serializer = PickleSerializer()
+    results = []
+
+    for payload_name, payload in build_payloads():
+        raw_size = len(serializers.dumps(payload, serializer))
+
+        for compressor_name, compressor in COMPRESSORS:
+            data = serializers.dumps(payload, serializer, compressor)
+
+            results.append({
+                'payload': payload_name,
+                'compressor': compressor_name,
+                'bytes': len(data),
+                'ratio': float(len(data)) / raw_size,
+                'encode_us': measure(lambda: serializers.dumps(payload, serializer, compressor), number),
+                'decode_us': measure(lambda: serializers.loads(data), number),
+            })
+
+    return results
+
+def main():
+    print('%-20s %-8s %10s %7s %12s %12s' % ('payload', 'codec', 'bytes', 'ratio',
+                                              'encode (us)', 'decode (us)'))
+
+    for result in run():
+        print('%(payload)-20s %(compressor)-8s %(bytes)10d %(ratio)7.2f '
+              '%(encode_us)12.1f %(decode_us)12.1f' % result)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+
+    Benchmarks the cache key functions, which run on every call of a cached
+    function.
+
+    Usage::
+
+        python benchmarks/key_func.py
+
+    For every key function and set of args, prints the time it takes to
+    build a key. The `legacy` row is the key function pycacher used before
+    kwargs support and long key hashing, as a reference; it takes no kwargs,
+    so it has no row for the calls with kwargs.
+
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pycacher.utils import default_cache_key_func, canonical_cache_key_func
+
+def legacy_cache_key_func(func, *args):
+    return func.__module__ + '.' + func.__name__ + ':' + ':'.join([str(arg) for arg in args])
+
+def get_user_activity_ids(*args, **kwargs):
+    pass
+
+CALLS = [
+    ('one int', (1,), {}),
+    ('three args', (1, 'board', 42), {}),
+    ('args and kwargs', (1,), {'fields': 'name', 'active': True}),
+    ('long key', ('x' * 300,), {}),
+]
+
+KEY_FUNCS = [
+    ('legacy', legacy_cache_key_func),
+    ('default', default_cache_key_func),
+    ('canonical', canonical_cache_key_func),
+]
+
+def measure(fn, number):
+    """Returns the best per-call time of `fn` in microseconds."""
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+def run(number=100000):
+    results = []
+
+    for call_name, args, kwargs in CALLS:
+        for key_func_name, key_func in KEY_FUNCS:
+            if kwargs and key_func is legacy_cache_key_func:
+                continue
+
+            results.append({
+                'call': call_name,
+                'key_func': key_func_name,
+                'us': measure(lambda: key_func(get_user_activity_ids, *args, **kwargs), number),
+            })
+
+    return results
+
+def main():
+    print('%-20s %-10s %10s' % ('call', 'key func', 'time (us)'))
+
+    for result in run():
+        print('%(call)-20s %(key_func)-10s %(us)10.3f' % result)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+
+    Benchmarks the hot paths of pycacher against a `LocalBackend` and against
+    a `MemcacheBackend` talking to the in-repo fake memcache server over TCP.
+
+    Usage::
+
+        python benchmarks/suite.py
+        python benchmarks/suite.py --output results.json
+        python benchmarks/suite.py --baseline benchmarks/baseline.json
+        python benchmarks/suite.py --save-baseline benchmarks/baseline.json
+
+    Every benchmark reports the best per-operation time, in microseconds, of
+    a few repeats. Results are printed as a table and, with `--output`,
+    written as JSON. With `--baseline`, they're compared to a stored run: the
+    ones slower than the baseline by more than `--tolerance` are listed as
+    regressions, and the exit status is 1 if there are any.
+
+    Timings only compare across runs on the same machine, so the stored
+    baseline should be refreshed with `--save-baseline` on the machine the
+    comparisons run on.
+
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pycacher import Cacher
+from pycacher.backends import LocalBackend, MemcacheBackend
+from pycacher.fakememcache import FakeMemcacheServer
+from pycacher.utils import default_cache_key_func
+
+BATCH_SIZES = (10, 100, 10000)
+
+#items of the cached list, and size of the pages read
+LIST_LENGTH = 1000
+PAGE_SIZE = 20
+
+def measure(fn, number, repeat=5):
+    """Returns the best per-call time of `fn` in microseconds."""
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e6
+
+def get_user_activity_ids(*args, **kwargs):
+    pass
+
+def bench_key_func(number):
+    return measure(lambda: default_cache_key_func(get_user_activity_ids, 1, 'board', 42), number * 10)
+
+def bench_hit(cacher, number):
+
+    @cacher.cache()
+    def get_user(uid):
+        return {'id': uid, 'username': 'user%s' % uid}
+
+    get_user(1)
+
+    return measure(lambda: get_user(1), number)
+
+def bench_miss(cacher, number):
+
+    @cacher.cache()
+    def get_user(uid):
+        return {'id': uid, 'username': 'user%s' % uid}
+
+    #every call gets a key that was never cached
+    uids = itertools.count()
+
+    return measure(lambda: get_user(next(uids)), number)
+
+def bench_batch(cacher, size, number):
+    keys = ['bench-batch-%s-%s' % (size, i) for i in range(size)]
+
+    cacher.backend.multi_set(dict((key, i) for i, key in enumerate(keys)))
+
+    def batch():
+        batcher = cacher.create_batcher()
+        batcher.add(keys)
+        batcher.batch()
+
+    return measure(batch, max(number // size, 1))
+
+def bench_list_pagination(cacher, number):
+
+    @cacher.cache_list(range=100)
+    def get_follower_ids(uid, skip=0, limit=10):
+        return list(range(LIST_LENGTH))[skip:skip + limit]
+
+    pages = itertools.cycle(range(0, LIST_LENGTH, PAGE_SIZE))
+
+    #warm every chunk
+    for skip in range(0, LIST_LENGTH, PAGE_SIZE):
+        get_follower_ids(1, skip=skip, limit=PAGE_SIZE)
+
+    return measure(lambda: get_follower_ids(1, skip=next(pages), limit=PAGE_SIZE), number)
+
+def run_backend(backend_name, backend, number):
+    cacher = Cacher(backend=backend)
+    results = {}
+
+    results['hit/%s' % backend_name] = bench_hit(cacher, number)
+    results['miss/%s' % backend_name] = bench_miss(cacher, number)
+
+    for size in BATCH_SIZES:
+        results['batch_%s/%s' % (size, backend_name)] = bench_batch(cacher, size, number)
+
+    results['list_page/%s' % backend_name] = bench_list_pagination(cacher, number)
+
+    return results
+
+def run(number=2000):
+    """Runs every benchmark, returning the per-operation times in
+    microseconds keyed by `<benchmark>/<backend>`."""
+
+    results = {'key_func': bench_key_func(number)}
+    results.update(run_backend('local', LocalBackend(), number))
+
+    with FakeMemcacheServer() as server:
+        #the network round trips make these a lot slower
+        results.update(run_backend('memcache', MemcacheBackend(host=server.host, port=server.port),
+                                   max(number // 10, 1)))
+
+    return results
+
+def compare(results, baseline, tolerance):
+    """Returns `(name, baseline us, us, ratio)` tuples of the results slower
+    than the baseline by more than `tolerance` (a fraction)."""
+
+    regressions = []
+
+    for name, us in sorted(results.items()):
+        if name not in baseline:
+            continue
+
+        ratio = us / baseline[name]
+
+        if ratio > 1 + tolerance:
+            regressions.append((name, baseline[name], us, ratio))
+
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the pycacher benchmarks.")
+    parser.add_argument('--number', type=int, default=2000,
+                        help="calls per repeat of the cheapest benchmarks")
+    parser.add_argument('--output', help="file the JSON results are written to")
+    parser.add_argument('--baseline', help="JSON results to compare the results to")
+    parser.add_argument('--save-baseline', help="file the results are stored to as the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="slowdown over the baseline reported as a regression")
+
+    options = parser.parse_args()
+
+    results = run(options.number)
+
+    baseline = None
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)['results']
+
+    print('%-24s %12s %12s %8s' % ('benchmark', 'time (us)', 'baseline', 'ratio'))
+
+    for name, us in sorted(results.items()):
+        if baseline and name in baseline:
+            print('%-24s %12.2f %12.2f %8.2f' % (name, us, baseline[name], us / baseline[name]))
+        else:
+            print('%-24s %12.2f' % (name, us))
+
+    document = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': int(time.time()),
+        'results': results,
+    }
+
+    for path in (options.output, options.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(document, f, indent=2, sort_keys=True)
+                f.write('\n')
+
+    if baseline:
+        regressions = compare(results, baseline, options.tolerance)
+
+        for name, baseline_us, us, ratio in regressions:
+            print('REGRESSION %s: %.2fus -> %.2fus (x%.2f)' % (name, baseline_us, us, ratio))
+
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,10 @@
+"""
+
+    Asyncio flavour of pycacher: `AsyncCacher` and its cached functions,
+    batchers and backends never block the event loop.
+
+"""
+
+from .cacher import AsyncCacher
+
+__all__ = ['AsyncCacher']
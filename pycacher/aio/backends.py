@@ -0,0 +1,123 @@
+"""
+
+    This module contains the asyncio counterparts of `pycacher.backends`.
+    They implement the same methods, as coroutines.
+
+"""
+
+from ..backends import LocalBackend
+from .client import MemcacheClient
+
+class AsyncBackend(object):
+
+    async def get(self, key):
+        raise NotImplementedError("Backend subclasses should always implement `get` method")
+
+    async def set(self, key, value, expires=None):
+        raise NotImplementedError("Backend subclasses should always implement `set` method")
+
+    async def add(self, key, value, expires=None):
+        raise NotImplementedError("Backend subclasses should implement `add` to support leases")
+
+    async def incr(self, key, delta=1):
+        raise NotImplementedError("Backend subclasses should implement `incr` to support namespaces")
+
+    async def exists(self, key):
+        return (await self.get(key)) is not None
+
+    async def multi_set(self, mapping, expires=None):
+        failed = []
+
+        for key, value in mapping.items():
+            if (await self.set(key, value, expires=expires)) is False:
+                failed.append(key)
+
+        return failed
+
+    async def multi_delete(self, keys):
+        for key in keys:
+            await self.delete(key)
+
+        return True
+
+class AsyncLocalBackend(AsyncBackend):
+    """Asyncio wrapper around a (possibly bounded) `LocalBackend`. The keyword
+    arguments are passed to `LocalBackend`.
+
+    Example usage::
+
+        backend = AsyncLocalBackend(max_items=10000)
+    """
+
+    def __init__(self, **kwargs):
+        self.local = LocalBackend(**kwargs)
+
+    async def get(self, key):
+        return self.local.get(key)
+
+    async def set(self, key, value, expires=None):
+        return self.local.set(key, value, expires=expires)
+
+    async def add(self, key, value, expires=None):
+        return self.local.add(key, value, expires=expires)
+
+    async def incr(self, key, delta=1):
+        return self.local.incr(key, delta)
+
+    async def delete(self, key):
+        return self.local.delete(key)
+
+    async def multi_get(self, keys):
+        return self.local.multi_get(keys)
+
+    async def multi_set(self, mapping, expires=None):
+        return self.local.multi_set(mapping, expires=expires)
+
+    async def multi_delete(self, keys):
+        return self.local.multi_delete(keys)
+
+class AsyncMemcacheBackend(AsyncBackend):
+    """Memcached backend built on the pure-asyncio `MemcacheClient`.
+
+    Example usage::
+
+        backend = AsyncMemcacheBackend(host='127.0.0.1', port=11211, pool_size=8)
+    """
+
+    def __init__(self, client=None, host='127.0.0.1', port=11211, pool_size=4):
+
+        if client:
+            self.client = client
+        else:
+            self.client = MemcacheClient(host, port, pool_size=pool_size)
+
+    async def get(self, key):
+        return await self.client.get(key)
+
+    async def set(self, key, value, expires=None):
+        return await self.client.set(key, value, expires=expires)
+
+    async def add(self, key, value, expires=None):
+        return await self.client.add(key, value, expires=expires)
+
+    async def incr(self, key, delta=1):
+        return await self.client.incr(key, delta)
+
+    async def delete(self, key):
+        return await self.client.delete(key)
+
+    async def multi_get(self, keys):
+
+        #The client returns byte keys, map them back to the requested ones.
+        keys = dict((key.encode('utf-8') if not isinstance(key, bytes) else key, key)
+                    for key in keys)
+
+        values = await self.client.get_multi(list(keys))
+
+        return dict((keys[key], value) for key, value in values.items())
+
+    async def multi_set(self, mapping, expires=None):
+        return await self.client.set_multi(mapping, expires=expires)
+
+    async def multi_delete(self, keys):
+        return await self.client.delete_multi(keys)
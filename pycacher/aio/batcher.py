@@ -0,0 +1,171 @@
+import asyncio
+
+from ..batcher import Batcher
+
+class AsyncBatcher(Batcher):
+    """Asyncio counterpart of `Batcher`: `batch` and `flush` are coroutines.
+
+    Example usage::
+
+        batcher = cacher.create_batcher()
+
+        async with batcher:
+            cached_func.register(1, 2)
+            cached_func.register(3, 4)
+
+        await batcher.batch()
+
+        async with batcher:
+            await cached_func(1, 2) #will look for its value from the batcher
+
+    Only `async with` is supported, since autobatching and write-back both do
+    I/O when the context exits::
+
+        async with batcher.autobatch():
+            cached_func.register(1, 2)
+
+    """
+
+    async def batch(self):
+        self._last_batched_values = await self.cacher.backend.multi_get(self._keys)
+        self._batched_keys = set(self._keys)
+
+        return self._last_batched_values
+
+    async def flush(self):
+
+        groups = {}
+
+        for key, (value, expires) in self._pending_writes.items():
+            groups.setdefault(expires, {})[key] = value
+
+        self._pending_writes = {}
+
+        failed = []
+
+        for expires, mapping in groups.items():
+            failed.extend(await self.cacher.backend.multi_set(mapping, expires=expires) or [])
+
+        return failed
+
+    def __enter__(self):
+        raise TypeError("AsyncBatcher must be used with 'async with'")
+
+    def __exit__(self, type, value, traceback):
+        raise TypeError("AsyncBatcher must be used with 'async with'")
+
+    async def __aenter__(self):
+        self.cacher.push_batcher(self)
+
+    async def __aexit__(self, type, value, traceback):
+
+        self.cacher.pop_batcher()
+
+        if self._autobatch_flag:
+            await self.batch()
+            self._autobatch_flag = False
+
+        if self._pending_writes:
+            await self.flush()
+
+class AutoBatcher(AsyncBatcher):
+    """Batcher that batches implicitly, like a DataLoader.
+
+    Inside an auto-batching context, cached functions don't look their keys
+    up one by one. Instead, every key looked up during the same event loop
+    tick is collected, and all of them are fetched with a single `multi_get`
+    once the tick is over (or after `delay` seconds, if given, or as soon as
+    `max_batch_size` keys are queued, or when `dispatch` is called).
+
+    Example usage::
+
+        async with cacher.create_autobatcher():
+            #a single multi_get round-trip for all three keys
+            await asyncio.gather(get_user(1), get_user(2), get_user(3))
+
+    Values that were already fetched within the context are reused, so every
+    key is fetched at most once per context.
+    """
+
+    def __init__(self, cacher=None, write_back=False, delay=None, max_batch_size=None):
+        super(AutoBatcher, self).__init__(cacher, write_back=write_back)
+
+        self.delay = delay
+        self.max_batch_size = max_batch_size
+
+        self._last_batched_values = {}
+        self._futures = {}
+        self._queue = {}
+        self._scheduled = None
+
+        #in-flight fetches, referenced until they're done
+        self._tasks = set()
+
+    def load(self, key):
+        """Returns a future resolving to the raw value of `key` (or None)."""
+
+        #Queued, in flight or already fetched within this context.
+        if key in self._futures:
+            return self._futures[key]
+
+        loop = asyncio.get_running_loop()
+
+        future = self._futures[key] = self._queue[key] = loop.create_future()
+        self.add(key)
+
+        if self.max_batch_size is not None and len(self._queue) >= self.max_batch_size:
+            self.dispatch()
+        elif self._scheduled is None:
+            if self.delay is None:
+                self._scheduled = loop.call_soon(self.dispatch)
+            else:
+                self._scheduled = loop.call_later(self.delay, self.dispatch)
+
+        return future
+
+    def forget(self, key):
+        super(AutoBatcher, self).forget(key)
+
+        #Queued keys haven't been fetched yet, so their awaiters will get the
+        #current value anyway.
+        if key not in self._queue:
+            self._futures.pop(key, None)
+
+    def dispatch(self):
+        """Fetches all the queued keys right away, with a single `multi_get`."""
+
+        if self._scheduled is not None:
+            self._scheduled.cancel()
+            self._scheduled = None
+
+        queue, self._queue = self._queue, {}
+
+        if queue:
+            task = asyncio.ensure_future(self._fetch(queue))
+
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _fetch(self, queue):
+
+        try:
+            values = await self.cacher.backend.multi_get(list(queue))
+        except Exception as e:
+            for key, future in queue.items():
+                #let the keys be fetched again later on
+                if self._futures.get(key) is future:
+                    del self._futures[key]
+
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for key, future in queue.items():
+            value = values.get(key)
+
+            #keys forgotten while they were in flight may be stale
+            if self._futures.get(key) is future:
+                self.record(key, value)
+
+            if not future.done():
+                future.set_result(value)
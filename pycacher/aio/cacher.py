@@ -0,0 +1,215 @@
+import time
+
+from ..cacher import Cacher
+from ..tags import new_tag_version
+from ..utils import default_cache_key_func
+from .backends import AsyncMemcacheBackend
+from .batcher import AsyncBatcher, AutoBatcher
+from .decorators import AsyncCachedFunctionDecorator
+from .stampede import AsyncSingleFlight
+
+class AsyncCacher(Cacher):
+
+    """
+
+    Asyncio counterpart of `Cacher`. Its backend, cached functions and batchers
+    are all non-blocking.
+
+    Example usage::
+
+        from pycacher.aio import AsyncCacher
+
+        cacher = AsyncCacher('localhost', 11211)
+
+        @cacher.cache(expires=60)
+        async def expensive_function(a, b):
+            pass
+
+        await expensive_function(1, 2)
+
+    By default, AsyncCacher is instantiated with `AsyncMemcacheBackend`. Any
+    other asyncio backend, such as `AsyncLocalBackend`, can be passed in::
+
+        from pycacher.aio.backends import AsyncLocalBackend
+
+        cacher = AsyncCacher(backend=AsyncLocalBackend())
+
+    Cached list functions (`Cacher.cache_list`) aren't supported by
+    AsyncCacher.
+
+    `get`, `set`, `delete`, `invalidate_namespace` and `invalidate_tags` are
+    coroutines.
+
+    """
+
+    def __init__(self, host='localhost', port=11211, client=None,
+                       backend=None, default_expires=None,
+                       cache_key_func=default_cache_key_func,
+                       expires_jitter=None, serializer='pickle', compressor=None,
+                       metrics=None):
+
+        if not backend:
+            backend = AsyncMemcacheBackend(client=client, host=host, port=port)
+
+        super(AsyncCacher, self).__init__(backend=backend, default_expires=default_expires,
+                                          cache_key_func=cache_key_func,
+                                          expires_jitter=expires_jitter,
+                                          serializer=serializer,
+                                          compressor=compressor,
+                                          metrics=metrics)
+
+        self.flights = AsyncSingleFlight()
+
+    def meter_backend(self, backend):
+        #Only the cached functions are metered for now, `MeteredBackend` is
+        #synchronous.
+        return backend
+
+    def cache(self, expires=None, jitter=None, serializer=None, compressor=None,
+                    negative_expires=None):
+        """Decorates a coroutine function to be cacheable.
+
+        Example usage::
+
+            @cacher.cache(expires=60)
+            async def expensive_function(a, b):
+                pass
+
+        """
+
+        def decorator(f):
+            return AsyncCachedFunctionDecorator(f, cacher=self, expires=expires,
+                                                   cache_key_func=self.cache_key_func,
+                                                   jitter=jitter, serializer=serializer,
+                                                   compressor=compressor,
+                                                   negative_expires=negative_expires)
+
+        return decorator
+
+    @property
+    def cache_list(self):
+        #The list decorator is synchronous, so it isn't inherited.
+        raise AttributeError("AsyncCacher doesn't support cached list functions")
+
+    def create_batcher(self, write_back=False):
+        """Simply creates an AsyncBatcher instance."""
+        return AsyncBatcher(self, write_back=write_back)
+
+    def create_autobatcher(self, write_back=False, delay=None, max_batch_size=None):
+        """Creates an AutoBatcher: inside its context, the cached functions
+        awaited during the same event loop tick are looked up together.
+
+        Example usage::
+
+            async with cacher.create_autobatcher():
+                users = await asyncio.gather(*[get_user(uid) for uid in uids])
+
+        """
+        return AutoBatcher(self, write_back=write_back, delay=delay,
+                           max_batch_size=max_batch_size)
+
+    async def get(self, key):
+        value = await self.backend.get(key)
+
+        if value is None:
+            return None
+
+        return self.loads(value)
+
+    async def set(self, key, value, expires=None):
+        return await self.backend.set(key, self.dumps(value),
+                                      expires=self.resolve_expires(expires))
+
+    async def delete(self, key):
+        self.forget([key])
+        return await self.backend.delete(key)
+
+    async def _init_generation(self, key):
+        generation = int(time.time() * 1000)
+
+        if await self.backend.add(key, generation):
+            return generation
+
+        #created concurrently by someone else
+        return await self.backend.get(key) or generation
+
+    async def get_generations(self, namespaces, batcher=None):
+        keys = dict((namespace, self.generation_key(namespace)) for namespace in namespaces)
+        generations = {}
+
+        if batcher:
+            for namespace, key in keys.items():
+                generation = batcher.get(key)
+
+                if generation is not None:
+                    generations[namespace] = generation
+
+        missing = [namespace for namespace in keys if namespace not in generations]
+
+        if missing:
+            values = await self.backend.multi_get([keys[namespace] for namespace in missing])
+
+            for namespace in missing:
+                generation = values.get(keys[namespace])
+
+                if generation is None:
+                    generation = await self._init_generation(keys[namespace])
+
+                generations[namespace] = generation
+
+        return generations
+
+    async def invalidate_namespace(self, namespace):
+        """Invalidates every value cached within `namespace`.
+
+        Example usage::
+
+            await cacher.invalidate_namespace('user:42')
+
+        """
+
+        key = self.generation_key(namespace)
+
+        if await self.backend.incr(key) is None:
+            await self._init_generation(key)
+
+        self.forget([key])
+
+        self.trigger_hooks('invalidate', key)
+
+    async def get_tag_versions(self, keys, values=None):
+        if values is None:
+            values = await self.backend.multi_get(keys)
+
+        versions = {}
+
+        for key in keys:
+            version = values.get(key)
+
+            if version is None:
+                version = new_tag_version()
+
+                #created concurrently by someone else
+                if not await self.backend.add(key, version):
+                    version = await self.backend.get(key) or version
+
+            versions[key] = version
+
+        return versions
+
+    async def invalidate_tags(self, *tags):
+        """Invalidates every value cached with any of `tags`.
+
+        Example usage::
+
+            await cacher.invalidate_tags('user:42', 'board:7')
+
+        """
+
+        keys = [self.tag_key(tag) for tag in tags]
+
+        await self.backend.multi_set(dict((key, new_tag_version()) for key in keys))
+        self.forget(keys)
+
+        for key in keys:
+            self.trigger_hooks('invalidate', key)
@@ -0,0 +1,322 @@
+"""
+
+    A pure-asyncio memcached client, speaking both the classic text protocol
+    and the meta protocol.
+
+"""
+
+import asyncio
+
+from ..backends import memcache_expires
+from ..exceptions import MemcacheProtocolException
+
+class MemcacheClient(object):
+    """Asyncio client for a single memcached server, keeping a pool of up to
+    `pool_size` connections.
+
+    Example usage::
+
+        client = MemcacheClient('127.0.0.1', 11211)
+
+        await client.set(b'key', b'value', expires=60)
+        await client.get(b'key')
+        >> b'value'
+
+    Keys may be given as `str` or `bytes`, values are always `bytes`. Every
+    command uses a connection of its own, so concurrent commands run in
+    parallel on up to `pool_size` connections. Multi-key commands are
+    pipelined over a single connection, costing a single round-trip.
+    """
+
+    def __init__(self, host='127.0.0.1', port=11211, pool_size=4, connect_timeout=None):
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+
+        self._idle = []
+        self._semaphore = None
+
+    async def _acquire(self):
+
+        #Created lazily, so that the client can be built outside of a loop.
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.pool_size)
+
+        await self._semaphore.acquire()
+
+        if self._idle:
+            return self._idle.pop()
+
+        try:
+            return await asyncio.wait_for(asyncio.open_connection(self.host, self.port),
+                                          self.connect_timeout)
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+    def _release(self, conn, broken=False):
+
+        if broken:
+            conn[1].close()
+        else:
+            self._idle.append(conn)
+
+        self._semaphore.release()
+
+    async def _execute(self, request, read_response):
+        """Sends `request` over a pooled connection and parses the response
+        with the `read_response(reader)` coroutine."""
+
+        conn = await self._acquire()
+
+        try:
+            conn[1].write(request)
+            await conn[1].drain()
+
+            rv = await read_response(conn[0])
+        except BaseException:
+            #The connection state is unknown, e.g. a response was only partly
+            #read. It can't be reused.
+            self._release(conn, broken=True)
+            raise
+
+        self._release(conn)
+
+        return rv
+
+    async def close(self):
+        while self._idle:
+            reader, writer = self._idle.pop()
+            writer.close()
+
+    #Text protocol
+
+    async def get(self, key):
+        return (await self.get_multi([key])).get(_to_bytes(key))
+
+    async def get_multi(self, keys):
+        """Returns a dict of the found keys (as bytes) and their values."""
+
+        if not keys:
+            return {}
+
+        request = b'get ' + b' '.join(_to_bytes(key) for key in keys) + b'\r\n'
+
+        values = await self._execute(request, _read_values)
+
+        return dict((key, value) for key, (value, cas) in values.items())
+
+    async def gets(self, key):
+        """Returns a `(value, cas_unique)` tuple, or `(None, None)`."""
+
+        request = b'gets ' + _to_bytes(key) + b'\r\n'
+
+        values = await self._execute(request, _read_values)
+
+        return values.get(_to_bytes(key), (None, None))
+
+    async def set(self, key, value, expires=None):
+        return await self._store(b'set', key, value, expires)
+
+    async def add(self, key, value, expires=None):
+        return await self._store(b'add', key, value, expires)
+
+    async def replace(self, key, value, expires=None):
+        return await self._store(b'replace', key, value, expires)
+
+    async def cas(self, key, value, cas_unique, expires=None):
+        """Returns True if stored, False if the key was modified since the
+        `gets`, and None if it doesn't exist anymore."""
+
+        request = _storage_command(b'cas', key, value, expires, cas_unique)
+
+        line = await self._execute(request, _read_line)
+
+        if line == b'STORED':
+            return True
+        elif line == b'EXISTS':
+            return False
+        elif line == b'NOT_FOUND':
+            return None
+
+        raise _unexpected(line)
+
+    async def _store(self, command, key, value, expires):
+
+        line = await self._execute(_storage_command(command, key, value, expires), _read_line)
+
+        if line == b'STORED':
+            return True
+        elif line == b'NOT_STORED':
+            return False
+
+        raise _unexpected(line)
+
+    async def set_multi(self, mapping, expires=None):
+        """Pipelines a `set` per key. Returns the keys that weren't stored."""
+
+        if not mapping:
+            return []
+
+        keys = list(mapping)
+        request = b''.join(_storage_command(b'set', key, mapping[key], expires) for key in keys)
+
+        async def read_responses(reader):
+            return [await _read_line(reader) for key in keys]
+
+        lines = await self._execute(request, read_responses)
+
+        return [key for key, line in zip(keys, lines) if line != b'STORED']
+
+    async def delete(self, key):
+
+        line = await self._execute(b'delete ' + _to_bytes(key) + b'\r\n', _read_line)
+
+        if line in (b'DELETED', b'NOT_FOUND'):
+            return line == b'DELETED'
+
+        raise _unexpected(line)
+
+    async def delete_multi(self, keys):
+        """Pipelines a `delete` per key."""
+
+        if not keys:
+            return True
+
+        keys = list(keys)
+        request = b''.join(b'delete ' + _to_bytes(key) + b'\r\n' for key in keys)
+
+        async def read_responses(reader):
+            return [await _read_line(reader) for key in keys]
+
+        for line in await self._execute(request, read_responses):
+            if line not in (b'DELETED', b'NOT_FOUND'):
+                raise _unexpected(line)
+
+        return True
+
+    async def incr(self, key, delta=1):
+        return await self._incr_decr(b'incr', key, delta)
+
+    async def decr(self, key, delta=1):
+        return await self._incr_decr(b'decr', key, delta)
+
+    async def _incr_decr(self, command, key, delta):
+        """Returns the new value, or None if the key doesn't exist."""
+
+        request = command + b' ' + _to_bytes(key) + b' ' + str(int(delta)).encode('ascii') + b'\r\n'
+
+        line = await self._execute(request, _read_line)
+
+        if line == b'NOT_FOUND':
+            return None
+
+        if not line.isdigit():
+            raise _unexpected(line)
+
+        return int(line)
+
+    #Meta protocol
+
+    async def meta_get(self, key):
+        """Returns `(value, remaining_ttl)`, or `(None, None)` on a miss.
+        A remaining TTL of -1 means the item never expires."""
+
+        line, value = await self._execute(b'mg ' + _to_bytes(key) + b' v t\r\n', _read_meta)
+
+        if line == b'EN':
+            return None, None
+
+        ttl = None
+
+        for flag in line.split()[2:]:
+            if flag.startswith(b't'):
+                ttl = int(flag[1:])
+
+        return value, ttl
+
+    async def meta_set(self, key, value, expires=None):
+
+        request = (b'ms ' + _to_bytes(key) + b' ' + str(len(value)).encode('ascii') +
+                   b' T' + str(memcache_expires(expires)).encode('ascii') + b'\r\n' +
+                   value + b'\r\n')
+
+        line, _ = await self._execute(request, _read_meta)
+
+        if line.startswith(b'HD'):
+            return True
+        elif line.startswith(b'NS'):
+            return False
+
+        raise _unexpected(line)
+
+    async def meta_delete(self, key):
+
+        line, _ = await self._execute(b'md ' + _to_bytes(key) + b'\r\n', _read_meta)
+
+        if line.startswith(b'HD') or line.startswith(b'NF'):
+            return line.startswith(b'HD')
+
+        raise _unexpected(line)
+
+def _to_bytes(key):
+    if isinstance(key, bytes):
+        return key
+
+    return key.encode('utf-8')
+
+def _storage_command(command, key, value, expires, cas_unique=None):
+
+    header = [command, _to_bytes(key), b'0',
+              str(memcache_expires(expires)).encode('ascii'),
+              str(len(value)).encode('ascii')]
+
+    if cas_unique is not None:
+        header.append(str(cas_unique).encode('ascii'))
+
+    return b' '.join(header) + b'\r\n' + value + b'\r\n'
+
+def _unexpected(line):
+    return MemcacheProtocolException("Unexpected memcached response: %r" % line)
+
+async def _read_line(reader):
+    line = await reader.readuntil(b'\r\n')
+    line = line[:-2]
+
+    if line == b'ERROR' or line.startswith(b'CLIENT_ERROR') or line.startswith(b'SERVER_ERROR'):
+        raise MemcacheProtocolException(line.decode('utf-8', 'replace'))
+
+    return line
+
+async def _read_values(reader):
+    """Reads `VALUE <key> <flags> <bytes> [<cas unique>]` blocks up to `END`."""
+
+    values = {}
+
+    while True:
+        line = await _read_line(reader)
+
+        if line == b'END':
+            return values
+
+        parts = line.split()
+
+        if parts[0] != b'VALUE':
+            raise _unexpected(line)
+
+        data = await reader.readexactly(int(parts[3]) + 2)
+        cas_unique = int(parts[4]) if len(parts) > 4 else None
+
+        values[parts[1]] = (data[:-2], cas_unique)
+
+async def _read_meta(reader):
+    """Reads a meta response line, and its data block if it's a `VA` one."""
+
+    line = await _read_line(reader)
+
+    if line.startswith(b'VA'):
+        data = await reader.readexactly(int(line.split()[1]) + 2)
+        return line, data[:-2]
+
+    return line, None
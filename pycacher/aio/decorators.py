@@ -0,0 +1,148 @@
+import inspect
+import time
+
+from ..decorators import CachedFunctionDecorator
+from ..refresh import CachedValue
+from ..tags import TaggedValue
+from ..utils import MISSING
+from .batcher import AutoBatcher
+
+class AsyncCachedFunctionDecorator(CachedFunctionDecorator):
+    """Asyncio counterpart of `CachedFunctionDecorator`, wrapping a coroutine
+    function (plain functions work too).
+
+    Calling the decorated function returns a coroutine. Concurrent awaits
+    missing the same key are coalesced onto a single call of the wrapped
+    function.
+
+    Example usage::
+
+        @cacher.cache(expires=60)
+        async def expensive_function(a, b):
+            pass
+
+        await expensive_function(1, 2)
+
+    """
+
+    async def __call__(self, *args, **kwargs):
+
+        cache_key = self._build_cache_key(*args, **kwargs)
+
+        batcher = self.cacher.get_current_batcher()
+
+        unpickled_value = batcher.get(cache_key) if batcher else None
+
+        #batched and not found, no need to ask the backend again
+        if unpickled_value is None and not (batcher and batcher.is_miss(cache_key)):
+            if isinstance(batcher, AutoBatcher):
+                unpickled_value = await batcher.load(cache_key)
+            else:
+                unpickled_value = await self.cacher.backend.get(cache_key)
+
+        if self.metrics is not None:
+            self._record_lookup(MISSING if unpickled_value is None else unpickled_value)
+
+        if unpickled_value is not None:
+            value = self._unwrap(self._loads(unpickled_value))
+        else:
+            value = await self.cacher.flights.do(cache_key,
+                                                 lambda: self._compute_and_store(cache_key, *args, **kwargs))
+
+        on_call = self.cacher.hooks.on_call
+
+        if on_call is not None:
+            on_call(cache_key)
+
+        if batcher:
+            on_call = batcher.hooks.on_call
+
+            if on_call is not None:
+                on_call(cache_key)
+
+        return value
+
+    async def _call_func(self, *args, **kwargs):
+        value = self.func(*args, **kwargs)
+
+        if inspect.isawaitable(value):
+            value = await value
+
+        return value
+
+    async def _compute_and_store(self, cache_key, *args, **kwargs):
+        start = time.time()
+        value = await self._call_func(*args, **kwargs)
+
+        await self._store(cache_key, value, time.time() - start)
+
+        return value
+
+    async def _store(self, cache_key, value, delta):
+
+        expires = self.get_expires(negative=value is None)
+        value = self._wrap(value, delta, expires)
+
+        batcher = self.cacher.get_current_batcher()
+
+        unpickled_value = self._dumps(value)
+
+        if self.metrics is not None:
+            self.metrics.observe('compute_seconds', delta)
+            self.metrics.incr('bytes_written', len(unpickled_value))
+
+        if batcher and batcher.write_back:
+            return batcher.buffer(cache_key, unpickled_value, expires=expires)
+
+        if batcher:
+            batcher.record(cache_key, unpickled_value)
+
+        return await self.cacher.backend.set(cache_key, unpickled_value, expires=expires)
+
+    def _unwrap(self, value):
+        #Refresh-ahead and tags aren't supported on coroutines yet, but values
+        #written by a synchronous decorator that uses them are still readable.
+        tagged = TaggedValue.load(value)
+
+        if tagged is not None:
+            value = tagged.value
+
+        cached = CachedValue.load(value)
+
+        if cached is not None:
+            return cached.value
+
+        return value
+
+    async def warm(self, *args, **kwargs):
+        cache_key = self._build_cache_key(*args, **kwargs)
+
+        start = time.time()
+        value = await self._call_func(*args, **kwargs)
+
+        return await self._store(cache_key, value, time.time() - start)
+
+    async def warm_multi(self, args_list):
+        expires = self.get_expires()
+        values = {}
+
+        for args in args_list:
+            start = time.time()
+            value = await self._call_func(*args)
+
+            values[self._build_cache_key(*args)] = self._dumps(self._wrap(value, time.time() - start, expires))
+
+        return await self.cacher.backend.multi_set(values, expires=expires)
+
+    async def is_cached(self, *args, **kwargs):
+        return await self.cacher.backend.exists(self._build_cache_key(*args, **kwargs))
+
+    async def invalidate(self, *args, **kwargs):
+
+        key = self._build_cache_key(*args, **kwargs)
+
+        rv = await self.cacher.delete(key)
+
+        self.cacher.trigger_hooks('invalidate', key)
+
+        return rv
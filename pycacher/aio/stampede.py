@@ -0,0 +1,47 @@
+"""
+
+    Asyncio counterpart of `pycacher.stampede.SingleFlight`.
+
+"""
+
+import asyncio
+
+class AsyncSingleFlight(object):
+    """Coalesces concurrent awaits on the same key onto a single computation.
+
+    Example usage::
+
+        flights = AsyncSingleFlight()
+
+        #Concurrent awaiters with the same key share the first one's result.
+        value = await flights.do('some-key', compute)
+
+    `fn` is a function returning an awaitable. Awaiters get the value, or the
+    exception, of the computation that was in flight when they arrived.
+    """
+
+    def __init__(self):
+        self._flights = {}
+
+    async def do(self, key, fn):
+
+        future = self._flights.get(key)
+
+        if future is not None:
+            #shield, so that a cancelled awaiter doesn't cancel the leader
+            return await asyncio.shield(future)
+
+        future = self._flights[key] = asyncio.ensure_future(fn())
+
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if future.done():
+                del self._flights[key]
+            else:
+                #The leader was cancelled, leave the computation running for
+                #the other awaiters and forget it once it's done.
+                future.add_done_callback(lambda f: self._flights.pop(key, None))
+
+    def in_flight(self, key):
+        return key in self._flights
@@ -4,6 +4,16 @@
 
 """
 
+import binascii
+import math
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from .utils import hash_long_key
+
 try:
     import memcache
 except ImportError:
@@ -14,40 +24,357 @@ class Backend(object):
     def get(self, key):
         raise NotImplementedError("Backend subclasses should always implement `get` method")
 
-    def set(self, key, value):
+    def set(self, key, value, expires=None):
         raise NotImplementedError("Backend subclasses should always implement `set` method")
 
-class LocalBackend(object):
+    def add(self, key, value, expires=None):
+        """Stores the value only if the key doesn't exist yet. Returns whether
+        the value was stored."""
+        raise NotImplementedError("Backend subclasses should implement `add` to support leases")
+
+    def incr(self, key, delta=1):
+        """Atomically increments an integer value. Returns the new value, or
+        None if the key doesn't exist."""
+        raise NotImplementedError("Backend subclasses should implement `incr` to support namespaces")
+
+    def multi_set(self, mapping, expires=None):
+        """Stores every key/value pair of `mapping`. Returns the list of keys
+        that couldn't be stored.
+
+        Subclasses should override this with a real bulk operation, this
+        fallback costs one `set` per key."""
+
+        return [key for key, value in mapping.items()
+                if self.set(key, value, expires=expires) is False]
+
+    def multi_delete(self, keys):
+        """Deletes every key in `keys`.
+
+        Subclasses should override this with a real bulk operation, this
+        fallback costs one `delete` per key."""
+
+        for key in keys:
+            self.delete(key)
+
+        return True
+
+class LRUPolicy(object):
+    """Least-recently-used eviction bookkeeping for `LocalBackend`.
+
+    Keys are kept in an `OrderedDict` in access order, so touching and
+    evicting a key are both O(1).
+    """
 
     def __init__(self):
-        
+        self._order = OrderedDict()
+
+    def insert(self, key):
+        self._order[key] = None
+
+    def touch(self, key):
+        self._order.move_to_end(key)
+
+    def remove(self, key):
+        self._order.pop(key, None)
+
+    def victim(self):
+        return next(iter(self._order))
+
+    def clear(self):
+        self._order.clear()
+
+class LFUPolicy(object):
+    """Least-frequently-used eviction bookkeeping for `LocalBackend`.
+
+    Keys are grouped in per-frequency buckets (LRU ordered within a bucket),
+    and the non-empty frequencies are linked in ascending order, so the
+    lowest one is always at the head of the links and every operation is
+    O(1).
+    """
+
+    def __init__(self):
+        self._freqs = {}
+        self._buckets = {}
+
+        #frequency -> next/previous non-empty frequency, with 0 as the
+        #sentinel at both ends
+        self._next = {0: 0}
+        self._prev = {0: 0}
+
+    def _link(self, freq, after):
+        following = self._next[after]
+
+        self._next[after] = freq
+        self._prev[freq] = after
+        self._next[freq] = following
+        self._prev[following] = freq
+
+        self._buckets[freq] = OrderedDict()
+
+    def _discard(self, key, freq):
+        bucket = self._buckets[freq]
+        del bucket[key]
+
+        if not bucket:
+            del self._buckets[freq]
+
+            previous, following = self._prev.pop(freq), self._next.pop(freq)
+            self._next[previous] = following
+            self._prev[following] = previous
+
+    def insert(self, key):
+        if 1 not in self._buckets:
+            self._link(1, 0)
+
+        self._freqs[key] = 1
+        self._buckets[1][key] = None
+
+    def touch(self, key):
+        freq = self._freqs[key]
+
+        if freq + 1 not in self._buckets:
+            self._link(freq + 1, freq)
+
+        self._discard(key, freq)
+
+        self._freqs[key] = freq + 1
+        self._buckets[freq + 1][key] = None
+
+    def remove(self, key):
+        freq = self._freqs.pop(key, None)
+
+        if freq is not None:
+            self._discard(key, freq)
+
+    def victim(self):
+        return next(iter(self._buckets[self._next[0]]))
+
+    def clear(self):
+        self._freqs.clear()
+        self._buckets.clear()
+        self._next = {0: 0}
+        self._prev = {0: 0}
+
+EVICTION_POLICIES = {
+    'lru': LRUPolicy,
+    'lfu': LFUPolicy,
+}
+
+class LocalBackend(Backend):
+    """In-process backend, optionally bounded by item count and/or bytes.
+
+    Example usage::
+
+        from pycacher.backends import LocalBackend
+
+        #unbounded, like a plain dict
+        backend = LocalBackend()
+
+        #at most 10k entries or 64MB of payload, evicting the least
+        #recently used entries first
+        backend = LocalBackend(max_items=10000, max_bytes=64 * 1024 * 1024)
+
+        #least frequently used eviction instead
+        backend = LocalBackend(max_items=10000, policy='lfu')
+
+    The size of an entry is the length of its payload when it's a byte string
+    (which is what the decorators store, since they serialize values before
+    calling `set`), or the length of its pickled form otherwise.
+
+    `expires` is a number of seconds relative to now; entries past their expiry
+    are dropped lazily on access, or when they're picked for eviction.
+    """
+
+    def __init__(self, max_items=None, max_bytes=None, policy='lru'):
+
+        if policy not in EVICTION_POLICIES:
+            raise PycacherBackendArgumentException(\
+                    "Eviction policy must be one of: %s" % ', '.join(sorted(EVICTION_POLICIES)))
+
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+
         self._dict = {}
+        self._policy = EVICTION_POLICIES[policy]()
+        self._lock = threading.RLock()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _payload_size(self, value):
+        if isinstance(value, (bytes, bytearray)):
+            return len(value)
+
+        return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+    def _remove(self, key):
+        value, expires_at, size = self._dict.pop(key)
+        self._policy.remove(key)
+        self._bytes -= size
+
+    def _evict(self, size):
+        """Evicts entries until a new entry of `size` bytes fits within the
+        backend's bounds."""
+
+        while self._dict and ((self.max_items is not None and len(self._dict) >= self.max_items)
+                              or (self.max_bytes is not None and self._bytes + size > self.max_bytes)):
+
+            victim = self._policy.victim()
+            expires_at = self._dict[victim][1]
+
+            self._remove(victim)
+
+            if expires_at is not None and expires_at <= time.time():
+                self.expirations += 1
+            else:
+                self.evictions += 1
+
+    def _lookup(self, key):
+        """Returns the live value of `key` or None, updating the counters and
+        the eviction bookkeeping. Must be called with the lock held."""
+
+        entry = self._dict.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if entry[1] is not None and entry[1] <= time.time():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._policy.touch(key)
+        self.hits += 1
+
+        return entry[0]
+
+    def set(self, key, value, expires=None):
+
+        size = self._payload_size(value)
+        expires_at = time.time() + expires if expires else None
+
+        with self._lock:
 
-    def set(self, key, value):
-        self._dict[key] = value
+            if key in self._dict:
+                self._remove(key)
+
+            #A single payload that doesn't fit at all is not stored.
+            if self.max_bytes is not None and size > self.max_bytes:
+                self.evictions += 1
+                return False
+
+            #Make room first, so that a fresh entry is never its own victim.
+            self._evict(size)
+
+            self._dict[key] = (value, expires_at, size)
+            self._policy.insert(key)
+            self._bytes += size
+
+        return True
+
+    def add(self, key, value, expires=None):
+        with self._lock:
+            if self._lookup(key) is not None:
+                return False
+
+            return self.set(key, value, expires=expires)
+
+    def incr(self, key, delta=1):
+        with self._lock:
+            value = self._lookup(key)
+
+            if value is None:
+                return None
+
+            entry = self._dict[key]
+            self._dict[key] = (value + delta,) + entry[1:]
+
+            return value + delta
 
     def get(self, key):
-        return self._dict.get(key)
+        with self._lock:
+            return self._lookup(key)
 
     def delete(self, key):
-        try:
-            del self._dict[key]
-        except KeyError: #suppress error on deletion of non-existent keys
-            pass
+        with self._lock:
+            try:
+                self._remove(key)
+            except KeyError: #suppress error on deletion of non-existent keys
+                pass
 
     def exists(self, key):
-        return self._dict.get(key) is not None
+        return self.get(key) is not None
 
     def multi_get(self, keys):
         
         values = {}
 
-        for key in keys:
-            values[key] = self._dict.get(key)
+        with self._lock:
+            for key in keys:
+                values[key] = self._lookup(key)
 
         return values
 
-class MemcacheBackend(object):
+    def multi_set(self, mapping, expires=None):
+        with self._lock:
+            return [key for key, value in mapping.items()
+                    if not self.set(key, value, expires=expires)]
+
+    def multi_delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self.delete(key)
+
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._dict.clear()
+            self._policy.clear()
+            self._bytes = 0
+
+    def get_stats(self):
+        """Returns a snapshot of the backend's counters.
+
+        Example usage::
+
+            backend.get_stats()
+            >> {'items': 120, 'bytes': 48213, 'hits': 1021, 'misses': 130,
+                'evictions': 10, 'expirations': 0}
+
+        """
+
+        with self._lock:
+            return {
+                'items': len(self._dict),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+#Memcached treats expiration times above 30 days as absolute unix timestamps.
+MEMCACHE_MAX_RELATIVE_EXPIRES = 60 * 60 * 24 * 30
+
+def memcache_expires(expires):
+    """Converts a relative `expires` in seconds to memcached's `exptime`."""
+
+    if not expires:
+        return 0
+
+    if expires > MEMCACHE_MAX_RELATIVE_EXPIRES:
+        return int(time.time() + expires)
+
+    #exptime is an integer and 0 means "never", so round up.
+    return int(math.ceil(expires))
+
+class MemcacheBackend(Backend):
     
     def __init__(self, client=None, host='127.0.0.1', port=11211):
         
@@ -59,8 +386,14 @@ class MemcacheBackend(object):
     def get(self, key):
         return self.client.get(key)
 
-    def set(self, key, value):
-        return self.client.set(key, value)
+    def set(self, key, value, expires=None):
+        return self.client.set(key, value, time=memcache_expires(expires))
+
+    def add(self, key, value, expires=None):
+        return self.client.add(key, value, time=memcache_expires(expires))
+
+    def incr(self, key, delta=1):
+        return self.client.incr(key, delta)
 
     def delete(self, key):
         return self.client.delete(key)
@@ -71,5 +404,248 @@ class MemcacheBackend(object):
     def multi_get(self, keys):
         return self.client.get_multi(keys)
 
+    def multi_set(self, mapping, expires=None):
+        return self.client.set_multi(mapping, time=memcache_expires(expires))
+
+    def multi_delete(self, keys):
+        return self.client.delete_multi(keys)
+
+class TieredBackend(Backend):
+    """Two-tier backend: a small in-process L1 in front of a remote L2.
+
+    Reads go through L1 first and only fall back to L2 on a miss, in which case
+    the value fetched from L2 is copied into L1. Writes go to both tiers. L1
+    entries only live for `l1_expires` seconds, which bounds how stale a value
+    can get in a process that didn't see the write.
+
+    Example usage::
+
+        from pycacher import Cacher
+        from pycacher.backends import TieredBackend, LocalBackend, MemcacheBackend
+
+        backend = TieredBackend(MemcacheBackend(host='10.0.0.1'),
+                                l1=LocalBackend(max_items=10000),
+                                l1_expires=5)
+
+        cacher = Cacher(backend=backend)
+
+    When used with a `Cacher`, `purge_local` is registered as an 'invalidate'
+    hook, so every invalidation also drops the key from L1.
+    """
+
+    def __init__(self, l2, l1=None, l1_expires=5):
+
+        if l1 is None:
+            l1 = LocalBackend(max_items=10000)
+
+        self.l1 = l1
+        self.l2 = l2
+        self.l1_expires = l1_expires
+
+    def get(self, key):
+        value = self.l1.get(key)
+
+        if value is None:
+            value = self.l2.get(key)
+
+            if value is not None:
+                self.l1.set(key, value, expires=self.l1_expires)
+
+        return value
+
+    def set(self, key, value, expires=None):
+        rv = self.l2.set(key, value, expires=expires)
+        self.l1.set(key, value, expires=self._l1_expires(expires))
+
+        return rv
+
+    def add(self, key, value, expires=None):
+        #Only L2 can arbitrate between processes, L1 is left alone.
+        return self.l2.add(key, value, expires=expires)
+
+    def incr(self, key, delta=1):
+        self.l1.delete(key)
+        return self.l2.incr(key, delta)
+
+    def delete(self, key):
+        self.l1.delete(key)
+        return self.l2.delete(key)
+
+    def exists(self, key):
+        return self.get(key) is not None
+
+    def multi_get(self, keys):
+
+        values = {}
+        missing = []
+
+        for key, value in self.l1.multi_get(keys).items():
+            if value is None:
+                missing.append(key)
+            else:
+                values[key] = value
+
+        if missing:
+            for key, value in self.l2.multi_get(missing).items():
+                values[key] = value
+
+                if value is not None:
+                    self.l1.set(key, value, expires=self.l1_expires)
+
+        return values
+
+    def _l1_expires(self, expires):
+        """An L1 copy must never outlive the entry it mirrors."""
+
+        if expires and (not self.l1_expires or expires < self.l1_expires):
+            return expires
+
+        return self.l1_expires
+
+    def multi_set(self, mapping, expires=None):
+        failed = self.l2.multi_set(mapping, expires=expires)
+        self.l1.multi_set(mapping, expires=self._l1_expires(expires))
+
+        return failed
+
+    def multi_delete(self, keys):
+        self.l1.multi_delete(keys)
+        return self.l2.multi_delete(keys)
+
+    def purge_local(self, key, *args):
+        """Drops `key` from L1 only. Meant to be used as an 'invalidate' hook."""
+        self.l1.delete(key)
+
+class ChunkedBackend(Backend):
+    """Wraps a backend to store values bigger than its item size limit (1MB
+    for memcached) as several chunks.
+
+    Example usage::
+
+        from pycacher import Cacher
+        from pycacher.backends import ChunkedBackend, MemcacheBackend
+
+        cacher = Cacher(backend=ChunkedBackend(MemcacheBackend()))
+
+    A byte string value longer than `chunk_size` is split into chunks stored
+    under sub-keys, and the key itself only holds a small manifest listing
+    them. Everything is written with a single `multi_set`, and read back with
+    one extra `multi_get` for all the chunks of all the manifests found.
+
+    Every write uses a fresh random version in its chunk keys, so a reader
+    can never assemble a value out of chunks from different writes: either
+    all the chunks of the manifest it read are there, or it's a miss.
+
+    Deleting a chunked key only deletes its manifest, the orphaned chunks
+    are left to expire or be evicted.
+    """
+
+    manifest_prefix = b'\x00pycacher-chunks:'
+
+    def __init__(self, backend, chunk_size=1000 * 1000):
+        self.backend = backend
+        self.chunk_size = chunk_size
+
+    def _is_manifest(self, value):
+        return isinstance(value, bytes) and value.startswith(self.manifest_prefix)
+
+    def _chunk_keys(self, key, manifest):
+        version, count = manifest[len(self.manifest_prefix):].decode('ascii').split(':')
+
+        return [hash_long_key('%s:chunk:%s:%s' % (key, version, i)) for i in range(int(count))]
+
+    def _split(self, key, value):
+        """Returns the mapping of keys to store for `value`, which is just
+        `{key: value}` for values that fit in a single item."""
+
+        if not isinstance(value, bytes) or len(value) <= self.chunk_size:
+            return {key: value}
+
+        count = (len(value) + self.chunk_size - 1) // self.chunk_size
+        manifest = self.manifest_prefix + ('%s:%s' % (binascii.hexlify(os.urandom(8)).decode('ascii'),
+                                                     count)).encode('ascii')
+
+        mapping = dict(zip(self._chunk_keys(key, manifest),
+                           [value[i * self.chunk_size:(i + 1) * self.chunk_size] for i in range(count)]))
+        mapping[key] = manifest
+
+        return mapping
+
+    def _assemble(self, values):
+        """Replaces the manifests in `values` with the assembled values, or
+        None if any of their chunks is missing."""
+
+        chunk_keys = dict((key, self._chunk_keys(key, value))
+                          for key, value in values.items() if self._is_manifest(value))
+
+        if not chunk_keys:
+            return values
+
+        chunks = self.backend.multi_get([chunk_key for keys in chunk_keys.values() for chunk_key in keys])
+
+        for key, keys in chunk_keys.items():
+            parts = [chunks.get(chunk_key) for chunk_key in keys]
+
+            values[key] = None if None in parts else b''.join(parts)
+
+        return values
+
+    def get(self, key):
+        return self.multi_get([key]).get(key)
+
+    def set(self, key, value, expires=None):
+        mapping = self._split(key, value)
+
+        if len(mapping) == 1:
+            return self.backend.set(key, value, expires=expires)
+
+        return not self.backend.multi_set(mapping, expires=expires)
+
+    def add(self, key, value, expires=None):
+        mapping = self._split(key, value)
+
+        if len(mapping) == 1:
+            return self.backend.add(key, value, expires=expires)
+
+        #the chunks first, so that the manifest never points to missing ones
+        manifest = mapping.pop(key)
+        self.backend.multi_set(mapping, expires=expires)
+
+        return self.backend.add(key, manifest, expires=expires)
+
+    def incr(self, key, delta=1):
+        return self.backend.incr(key, delta)
+
+    def delete(self, key):
+        return self.backend.delete(key)
+
+    def exists(self, key):
+        return self.get(key) is not None
+
+    def multi_get(self, keys):
+        return self._assemble(self.backend.multi_get(keys))
+
+    def multi_set(self, mapping, expires=None):
+
+        split_mapping = {}
+
+        #the key every stored key belongs to, to report failed chunks as
+        #failures of their key
+        owners = {}
+
+        for key, value in mapping.items():
+            split = self._split(key, value)
+
+            split_mapping.update(split)
+            owners.update((split_key, key) for split_key in split)
+
+        failed = self.backend.multi_set(split_mapping, expires=expires) or []
+        failed_keys = set(owners[failed_key] for failed_key in failed)
+
+        return [key for key in mapping if key in failed_keys]
+
+    def multi_delete(self, keys):
+        return self.backend.multi_delete(keys)
+
 class PycacherBackendArgumentException(Exception):
     pass
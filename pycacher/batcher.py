@@ -1,3 +1,7 @@
+import math
+
+from .hooks import Hooks
+
 class Batcher(object):
     """
     Batcher enables developers to batch multiple retrieval requests.
@@ -51,16 +55,40 @@ class Batcher(object):
         batcher.register(cached_func, 1, 2)
         batcher.register(cached_func_2, 1, 2)
 
+    Keys that were batched but not found are authoritative misses: cached
+    functions called inside the context compute them right away, without
+    looking them up in the backend again, and record the values they compute
+    in the batcher, so that later calls within the context get them.
+
+    A write-back batcher also buffers the values that cached functions
+    compute inside its context, and stores all of them in a single `multi_set`
+    round-trip when the context exits (or when `flush` is called).
+
+    Example usage #3::
+
+        batcher = cacher.create_batcher(write_back=True)
+
+        with batcher:
+            cached_func(1, 2) #misses are computed, but not stored yet
+            cached_func(3, 4)
+
+        #both values were stored with one round-trip on exit.
+
     """
     
-    def __init__(self, cacher=None):
+    def __init__(self, cacher=None, write_back=False):
         self.cacher = cacher
+        self.write_back = write_back
         self._keys = set()
+        self._versioned = []
+        self._namespaces = set()
         self._last_batched_values = None
+        self._batched_keys = set()
+        self._pending_writes = {}
 
         self._autobatch_flag = False
 
-        self._hooks = {'register':[], 'call':[]}
+        self.hooks = Hooks()
 
     def add(self, key):
 
@@ -72,44 +100,90 @@ class Batcher(object):
 
     def reset(self):
         self._keys = set()
+        self._versioned = []
+        self._namespaces = set()
 
     def batch(self):
+
+        generations = {}
+
+        #The keys of namespaced functions embed the generations of their
+        #namespaces, which are all fetched first with a single round-trip.
+        if self._versioned:
+            generations = self.cacher.get_generations(self._namespaces)
+
+            for key, namespaces in self._versioned:
+                self.add(self.cacher.versioned_key(key, [generations[namespace]
+                                                         for namespace in namespaces]))
+
         self._last_batched_values = self.cacher.backend.multi_get(self._keys)
+        self._batched_keys = set(self._keys)
+
+        #Keep the generations, so that the calls within the context don't
+        #look them up again.
+        for namespace, generation in generations.items():
+            self.record(self.cacher.generation_key(namespace), generation)
 
         return self._last_batched_values
 
     def has_batched(self):
         return self._last_batched_values is not None
 
-    def register(self, decorated_func, *args):
-        cache_key = decorated_func.build_cache_key(*args)
+    def register(self, decorated_func, *args, **kwargs):
 
-        self.add(cache_key)
+        if getattr(decorated_func, 'namespaces', None):
+            #The actual key is only known once the generations are batched.
+            cache_key = decorated_func.build_unversioned_cache_key(*args, **kwargs)
+            namespaces = decorated_func.get_namespaces(*args, **kwargs)
+
+            self._versioned.append((cache_key, namespaces))
+            self._namespaces.update(namespaces)
+        else:
+            cache_key = decorated_func.build_cache_key(*args, **kwargs)
+
+            self.add(cache_key)
+
+        #the versions of the tags are batched along with the value
+        if getattr(decorated_func, 'tags', None):
+            self.add(decorated_func.get_tag_keys(*args, **kwargs))
     
-        #run the hooks on the batcher first
-        self.trigger_hooks('register', cache_key, self)
-        self.cacher.trigger_hooks('register', cache_key, self)
+        self._run_register_hooks(cache_key)
 
     def register_list(self, decorated_list_func, *args, **kwargs):
         """Registers a cached list function.
 
         """
 
-        skip = kwargs['skip']
-        limit = kwargs['limit']
+        skip = kwargs.pop('skip')
+        limit = kwargs.pop('limit')
 
         #add the ranged cache keys to the actual internal key batch list.
-        for ranged_cache_key in decorated_list_func.get_ranged_cache_keys(skip=skip, limit=limit, *args):
+        for ranged_cache_key in decorated_list_func.get_ranged_cache_keys(skip=skip, limit=limit,
+                                                                          *args, **kwargs):
             self.add(ranged_cache_key)
 
+        #and the keys of its version and metadata record
+        self.add(list(decorated_list_func.get_meta_keys(*args, **kwargs)))
+
         #Build the "root" cache key to be passed to the hook functions.
         #Note that we do not pass the ranged cache key to the hook functions,
         #it's completely for internal use.
-        cache_key = decorated_list_func.build_cache_key(*args)
+        cache_key = decorated_list_func.build_cache_key(*args, **kwargs)
+
+        self._run_register_hooks(cache_key)
+
+    def _run_register_hooks(self, cache_key):
 
         #run the hooks on the batcher first
-        self.trigger_hooks('register', cache_key, self)
-        self.cacher.trigger_hooks('register', cache_key, self)
+        on_register = self.hooks.on_register
+
+        if on_register is not None:
+            on_register(cache_key, self)
+
+        on_register = self.cacher.hooks.on_register
+
+        if on_register is not None:
+            on_register(cache_key, self)
 
     def get_last_batched_values(self):
         return self._last_batched_values
@@ -121,11 +195,74 @@ class Batcher(object):
         return self._keys
 
     def get(self, key):
+        if key in self._pending_writes:
+            return self._pending_writes[key][0]
+
         if self._last_batched_values:
             return self._last_batched_values.get(key)
 
         return None
 
+    def is_miss(self, key):
+        """Checks whether a key was part of the latest batch and wasn't found,
+        in which case there's no point in looking it up again."""
+
+        if key not in self._batched_keys or key in self._pending_writes:
+            return False
+
+        return self._last_batched_values.get(key) is None
+
+    def record(self, key, value):
+        """Records a value computed (and stored) within the context, so that
+        later lookups of the key within the context get it."""
+
+        if self._last_batched_values is None:
+            self._last_batched_values = {}
+
+        self._last_batched_values[key] = value
+        self._batched_keys.add(key)
+
+    def forget(self, key):
+        """Drops everything the batcher knows about a key, e.g. because it was
+        invalidated. Later lookups of the key go to the backend."""
+
+        if self._last_batched_values:
+            self._last_batched_values.pop(key, None)
+
+        self._batched_keys.discard(key)
+        self._pending_writes.pop(key, None)
+
+    def buffer(self, key, value, expires=None):
+        """Buffers a value to be stored on the next `flush`."""
+
+        #TTLs are grouped by whole seconds, so that jittered TTLs can still
+        #share a round-trip.
+        if expires:
+            expires = int(math.ceil(expires))
+
+        self._pending_writes[key] = (value, expires)
+
+    def get_pending_writes(self):
+        return dict((key, value) for key, (value, expires) in self._pending_writes.items())
+
+    def flush(self):
+        """Stores all the buffered values, with one `multi_set` per distinct TTL.
+        Returns the keys that couldn't be stored."""
+
+        groups = {}
+
+        for key, (value, expires) in self._pending_writes.items():
+            groups.setdefault(expires, {})[key] = value
+
+        self._pending_writes = {}
+
+        failed = []
+
+        for expires, mapping in groups.items():
+            failed.extend(self.cacher.backend.multi_set(mapping, expires=expires) or [])
+
+        return failed
+
     def is_batched(self, key):
         """Checks whether a key is included in the latest batch.
         
@@ -181,6 +318,9 @@ class Batcher(object):
 
         self.cacher.pop_batcher()
 
+        if self._pending_writes:
+            self.flush()
+
     def add_hook(self, event, fn):
         """ Add hook function to be executed on event.
 
@@ -193,26 +333,10 @@ class Batcher(object):
 
         """
         
-        if event not in ('invalidate', 'call', 'register'):
-            raise InvalidHookEventException(\
-                    "Hook event must be 'invalidate', 'call', or 'register'")
-    
-        self._hooks[event].append(fn)
-
+        self.hooks.add(event, fn)
 
     def trigger_hooks(self, event, *args, **kwargs):
-        
-        if event not in ('invalidate', 'call', 'register'):
-            raise InvalidHookEventException(\
-                    "Hook event must be 'invalidate', 'call', or 'register'")
-
-        for fn in self._hooks[event]:
-            fn(*args, **kwargs)
+        self.hooks.trigger(event, *args, **kwargs)
 
     def remove_all_hooks(self, event):
-        if event not in ('invalidate', 'call', 'register'):
-            raise InvalidHookEventException(\
-                    "Hook event must be 'invalidate', 'call', or 'register'")
-        
-        #reset
-        self._hooks[event] = []
+        self.hooks.remove_all(event)
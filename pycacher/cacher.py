@@ -1,11 +1,24 @@
 from functools import wraps
-import pickle
+import contextvars
+import time
 
-from .backends import LocalBackend, MemcacheBackend
+from .backends import LocalBackend, MemcacheBackend, TieredBackend
 from .decorators import CachedFunctionDecorator, CachedListFunctionDecorator
-from .utils import default_cache_key_func
+from .utils import default_cache_key_func, jittered_expires, hash_long_key
 from .batcher import Batcher
-from .exceptions import InvalidHookEventException, OutOfBatcherContextRegistrationException
+from .stampede import SingleFlight
+from . import serializers
+from .compression import get_compressor
+from .tags import new_tag_version
+from .metrics import MeteredBackend
+from .hooks import Hooks
+from .exceptions import OutOfBatcherContextRegistrationException
+
+#The batcher stacks of every cacher, keyed by cacher. Living in a context
+#variable, they are local to every thread and every asyncio task. Neither the
+#mappings nor the stacks (tuples) are ever mutated, a new one is set instead,
+#which keeps a task from changing the stacks it inherited from its parent.
+_batcher_stacks = contextvars.ContextVar('pycacher_batcher_stacks', default={})
 
 class Cacher(object):
 
@@ -30,22 +43,98 @@ class Cacher(object):
 
         cacher = pycacher.Cacher(backend=LocalBackend())
 
+    `default_expires` is the TTL (in seconds) used by cached functions that don't
+    specify their own `expires`. `expires_jitter` is the default fraction by
+    which TTLs are randomly shortened, so that keys written at the same time
+    don't all expire at the same time::
+
+        cacher = pycacher.Cacher(default_expires=600, expires_jitter=0.1)
+
+    `serializer` is the default serializer of the cached values, either a
+    name ('pickle', 'marshal', 'json' or 'msgpack') or a `Serializer` instance.
+    Cached functions can override it. Values are always read back with the
+    serializer they were written with::
+
+        cacher = pycacher.Cacher(serializer='json')
+
+        @cacher.cache(serializer='marshal')
+        def expensive_function(a, b):
+            pass
+
+    `compressor` compresses the serialized values above its size threshold
+    before they're stored, either a name ('zlib' or 'lzma') or a `Compressor`
+    instance. Cached functions can override it too::
+
+        from pycacher.compression import ZlibCompressor
+
+        cacher = pycacher.Cacher(compressor='zlib')
+
+        @cacher.cache_list(compressor=ZlibCompressor(level=9, threshold=256))
+        def get_follower_ids(uid, skip=0, limit=10):
+            pass
+
+    Given a `Metrics` registry, the cacher keeps stats of every cached
+    function (hits, misses, compute time, bytes) and of its backend (latency
+    of every operation, bytes, batch sizes)::
+
+        from pycacher.metrics import Metrics
+
+        metrics = Metrics()
+        cacher = pycacher.Cacher(metrics=metrics)
+
+        metrics.snapshot()
+
+    Given a `SamplingProfiler`, the cacher times the phases (key building,
+    lookup, deserialization, computation, storage) of a sample of the calls
+    of the cached functions::
+
+        from pycacher.hooks import SamplingProfiler
+
+        profiler = SamplingProfiler(sample_rate=0.01)
+        cacher = pycacher.Cacher(profiler=profiler)
+
+        profiler.snapshot()
+
     """
     def __init__(self, host='localhost', port=11211, client=None,
                        backend=None, default_expires=None, 
-                       cache_key_func=default_cache_key_func):
+                       cache_key_func=default_cache_key_func,
+                       expires_jitter=None, serializer='pickle', compressor=None,
+                       metrics=None, profiler=None):
         
         self.cache_key_func = cache_key_func 
+        self.metrics = metrics
+        self.profiler = profiler
+        self.serializer = serializers.get_serializer(serializer)
+        self.compressor = get_compressor(compressor)
+        self.default_expires = default_expires
+        self.expires_jitter = expires_jitter
 
         if backend:
             self.backend = backend
         else:
             self.backend = MemcacheBackend(host=host, port=port)
         
-        self._batcher_ctx_stack = []
-        self._hooks = {'call':[], 'invalidate':[], 'register':[]}
+        self.flights = SingleFlight()
+
+        self.hooks = Hooks()
+
+        #Keep the near-cache of a tiered backend coherent with invalidations.
+        if isinstance(self.backend, TieredBackend):
+            self.add_hook('invalidate', self.backend.purge_local)
 
-    def cache(self, expires=None):
+        if metrics is not None:
+            self.backend = self.meter_backend(self.backend)
+
+    def meter_backend(self, backend):
+        """Wraps the backend so that its operations are recorded in the
+        metrics."""
+        return MeteredBackend(backend, self.metrics.backend(type(backend).__name__))
+
+    def cache(self, expires=None, jitter=None, single_flight=False,
+                    lease_timeout=None, lease_wait=None, stale_after=None,
+                    early_refresh=None, serializer=None, compressor=None,
+                    namespaces=None, tags=None, negative_expires=None):
         """Decorates a function to be cacheable.
 
         Example usage::
@@ -54,17 +143,62 @@ class Cacher(object):
             def expensive_function(a, b):
                 pass
 
+            #cached for 5 to 10 minutes
+            @cacher.cache(expires=600, jitter=0.5)
+            def another_expensive_function(a, b):
+                pass
+
+            #only one thread per process, and only one process holding the
+            #10 second lease, recomputes a missing key at a time.
+            @cacher.cache(single_flight=True, lease_timeout=10)
+            def hot_expensive_function(a, b):
+                pass
+
+            #"not found" results (None) are only cached for 30 seconds
+            @cacher.cache(expires=3600, negative_expires=30)
+            def get_user_by_email(email):
+                pass
+
+            #after 60 seconds, callers keep getting the cached value while
+            #it's recomputed in the background
+            @cacher.cache(expires=3600, stale_after=60)
+            def slow_function(a, b):
+                pass
+
+            #every cached value of the function can be invalidated at once
+            #with `get_user_boards.invalidate_all()`, and all those of user
+            #42 with `cacher.invalidate_namespace('user:42')`
+            @cacher.cache(namespaces=lambda uid, bid: ['user:%s' % uid])
+            def get_user_boards(uid, bid):
+                pass
+
+            #invalidated by `cacher.invalidate_tags('board:%s' % bid)`
+            @cacher.cache(tags=lambda uid, bid: ['user:%s' % uid, 'board:%s' % bid])
+            def is_user_board_subscriber(uid, bid):
+                pass
+
         """
         
         def decorator(f):
 
             #Wraps the function within a function decorator
             return CachedFunctionDecorator(f, cacher=self, expires=expires, 
-                                              cache_key_func=self.cache_key_func)
+                                              cache_key_func=self.cache_key_func,
+                                              jitter=jitter, single_flight=single_flight,
+                                              lease_timeout=lease_timeout,
+                                              lease_wait=lease_wait,
+                                              stale_after=stale_after,
+                                              early_refresh=early_refresh,
+                                              serializer=serializer,
+                                              compressor=compressor,
+                                              namespaces=namespaces,
+                                              tags=tags,
+                                              negative_expires=negative_expires)
 
         return decorator
 
-    def cache_list(self, range=10, skip_key="skip", limit_key="limit", expires=None):
+    def cache_list(self, range=10, skip_key="skip", limit_key="limit", expires=None,
+                         jitter=None, serializer=None, compressor=None):
         """Decorates a function that returns a list as a return value to be cacheable.
         
         Example usage::
@@ -79,29 +213,50 @@ class Cacher(object):
             return CachedListFunctionDecorator(f, cacher=self, expires=expires,
                                                   cache_key_func=self.cache_key_func,
                                                   range=range, skip_key=skip_key,
-                                                  limit_key=limit_key)
+                                                  limit_key=limit_key, jitter=jitter,
+                                                  serializer=serializer,
+                                                  compressor=compressor)
 
         return decorator
 
-    def create_batcher(self):
+    def create_batcher(self, write_back=False):
         """Simply creates a Batcher instance."""
-        return Batcher(self)
+        return Batcher(self, write_back=write_back)
     
+    def _get_batcher_stack(self):
+        return _batcher_stacks.get().get(self, ())
+
+    def _set_batcher_stack(self, stack):
+        stacks = dict(_batcher_stacks.get())
+
+        #empty stacks are dropped, so that they don't keep the cacher alive
+        if stack:
+            stacks[self] = stack
+        else:
+            stacks.pop(self, None)
+
+        _batcher_stacks.set(stacks)
+
     def push_batcher(self, batcher):
-        self._batcher_ctx_stack.append(batcher)
+        self._set_batcher_stack(self._get_batcher_stack() + (batcher,))
 
     def get_current_batcher(self):
 
-        if len(self._batcher_ctx_stack) > 0:
-            return self._batcher_ctx_stack[-1]
+        stack = self._get_batcher_stack()
+
+        if len(stack) > 0:
+            return stack[-1]
         else:
             return None
 
     def pop_batcher(self):
-        return self._batcher_ctx_stack.pop()
+        stack = self._get_batcher_stack()
+        self._set_batcher_stack(stack[:-1])
+
+        return stack[-1]
 
     def get_batcher_stack_depth(self):
-        return len(self._batcher_ctx_stack)
+        return len(self._get_batcher_stack())
 
     def add_hook(self, event, fn):
         """ Add hook function to be executed on event.
@@ -115,26 +270,178 @@ class Cacher(object):
 
         """
         
-        if event not in ('invalidate', 'call', 'register'):
-            raise InvalidHookEventException(\
-                    "Hook event must be 'invalidate', 'call', or 'register'")
-    
-        self._hooks[event].append(fn)
+        self.hooks.add(event, fn)
+
+    def remove_hook(self, event, fn):
+        self.hooks.remove(event, fn)
+
+    def remove_all_hooks(self, event):
+        self.hooks.remove_all(event)
 
     def trigger_hooks(self, event, *args, **kwargs):
-        
-        if event not in ('invalidate', 'call', 'register'):
-            raise InvalidHookEventException(\
-                    "Hook event must be 'invalidate', 'call', or 'register'")
+        self.hooks.trigger(event, *args, **kwargs)
+
+    def generation_key(self, namespace):
+        return hash_long_key('pycacher-generation:' + namespace)
+
+    def _init_generation(self, key):
+        """Creates a missing generation counter. It starts at the current time
+        in milliseconds rather than at 0, so that a counter that got evicted
+        never starts over at a generation that keys were built with before."""
+
+        generation = int(time.time() * 1000)
+
+        if self.backend.add(key, generation):
+            return generation
+
+        #created concurrently by someone else
+        return self.backend.get(key) or generation
+
+    def get_generations(self, namespaces, batcher=None):
+        """Returns a dict of the current generation of every namespace, read
+        from `batcher`'s batched values when it has them, and otherwise with a
+        single `multi_get`."""
 
-        for fn in self._hooks[event]:
-            fn(*args, **kwargs)
+        keys = dict((namespace, self.generation_key(namespace)) for namespace in namespaces)
+        generations = {}
 
-    def get(self, key):
-        return pickle.loads(self.backend.get(key))
+        if batcher:
+            for namespace, key in keys.items():
+                generation = batcher.get(key)
 
-    def set(self, key, value):
-        return self.backend.set(key, pickle.dumps(value))
+                if generation is not None:
+                    generations[namespace] = generation
+
+        missing = [namespace for namespace in keys if namespace not in generations]
+
+        if missing:
+            values = self.backend.multi_get([keys[namespace] for namespace in missing])
+
+            for namespace in missing:
+                generation = values.get(keys[namespace])
+
+                if generation is None:
+                    generation = self._init_generation(keys[namespace])
+
+                generations[namespace] = generation
+
+        return generations
+
+    def versioned_key(self, key, generations):
+        """Folds namespace generations into a cache key."""
+        return hash_long_key(key + '@' + '.'.join([str(generation) for generation in generations]))
+
+    def invalidate_namespace(self, namespace):
+        """Invalidates every cached value built within `namespace`, with a
+        single `incr` of its generation.
+
+        Example usage::
+
+            cacher.invalidate_namespace('user:42')
+
+        """
+
+        key = self.generation_key(namespace)
+
+        if self.backend.incr(key) is None:
+            self._init_generation(key)
+
+        self.forget([key])
+
+        self.trigger_hooks('invalidate', key)
+
+    def tag_key(self, tag):
+        return hash_long_key('pycacher-tag:' + tag)
+
+    def get_tag_versions(self, keys, values=None):
+        """Returns a dict of the current version of every tag key, taken from
+        `values` when it has them (e.g. the result of a `multi_get` the keys
+        were part of), and otherwise read from the backend. Missing tags are
+        created with a new version."""
+
+        if values is None:
+            values = self.backend.multi_get(keys)
+
+        versions = {}
+
+        for key in keys:
+            version = values.get(key)
+
+            if version is None:
+                version = new_tag_version()
+
+                #created concurrently by someone else
+                if not self.backend.add(key, version):
+                    version = self.backend.get(key) or version
+
+            versions[key] = version
+
+        return versions
+
+    def invalidate_tags(self, *tags):
+        """Invalidates every cached value that depends on any of `tags`, by
+        giving them new versions with a single `multi_set`.
+
+        Example usage::
+
+            cacher.invalidate_tags('user:42', 'board:7')
+
+        """
+
+        keys = [self.tag_key(tag) for tag in tags]
+
+        self.backend.multi_set(dict((key, new_tag_version()) for key in keys))
+        self.forget(keys)
+
+        for key in keys:
+            self.trigger_hooks('invalidate', key)
+
+    def resolve_expires(self, expires=None, jitter=None):
+        """Returns the TTL to store an entry with, falling back to the cacher's
+        defaults and applying the expiry jitter."""
+
+        if expires is None:
+            expires = self.default_expires
+
+        if jitter is None:
+            jitter = self.expires_jitter
+
+        return jittered_expires(expires, jitter)
+
+    def dumps(self, value, serializer=None, compressor=None):
+        """Serializes (and compresses) a value into the payload stored in the
+        backend."""
+        return serializers.dumps(value, serializer or self.serializer,
+                                 compressor or self.compressor)
+
+    def loads(self, data):
+        """Deserializes a payload read from the backend."""
+        return serializers.loads(data)
+
+    def get(self, key, default=None):
+        """Returns the value of `key`, or `default` if it's missing. Pass
+        `MISSING` as `default` to tell a miss apart from a cached None."""
+
+        data = self.backend.get(key)
+
+        if data is None:
+            return default
+
+        return self.loads(data)
+
+    def set(self, key, value, expires=None):
+        return self.backend.set(key, self.dumps(value),
+                                expires=self.resolve_expires(expires))
 
     def delete(self, key):
+        self.forget([key])
         return self.backend.delete(key)
+
+    def forget(self, keys):
+        """Drops invalidated keys from the current batcher, if any."""
+
+        batcher = self.get_current_batcher()
+
+        if batcher:
+            for key in keys:
+                batcher.forget(key)
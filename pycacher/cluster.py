@@ -0,0 +1,411 @@
+"""
+
+    This module contains a backend spreading keys over a fleet of memcached
+    servers with ketama consistent hashing, keeping a pool of connections per
+    server.
+
+"""
+
+import pickle
+import queue
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .backends import Backend, PycacherBackendArgumentException, memcache_expires
+from .ketama import HashRing
+from .exceptions import MemcacheProtocolException
+
+#Same flags as python-memcached, so that both can read each other's values.
+FLAG_PICKLE = 1 << 0
+FLAG_INTEGER = 1 << 1
+FLAG_TEXT = 1 << 4
+
+def encode_value(value):
+    """Returns a `(flags, bytes)` tuple for a value."""
+
+    if isinstance(value, bytes):
+        return 0, value
+    elif isinstance(value, str):
+        return FLAG_TEXT, value.encode('utf-8')
+    elif isinstance(value, int) and not isinstance(value, bool):
+        return FLAG_INTEGER, str(value).encode('ascii')
+
+    return FLAG_PICKLE, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+def decode_value(flags, data):
+
+    if flags & FLAG_PICKLE:
+        return pickle.loads(data)
+    elif flags & FLAG_INTEGER:
+        return int(data)
+    elif flags & FLAG_TEXT:
+        return data.decode('utf-8')
+
+    return data
+
+def _to_bytes(key):
+    if isinstance(key, bytes):
+        return key
+
+    return key.encode('utf-8')
+
+class MemcacheConnection(object):
+    """A blocking text protocol connection to a single memcached server.
+
+    Not thread-safe by itself: connections are meant to be checked out of a
+    `ConnectionPool` by one thread at a time. Multi-key commands are
+    pipelined, costing a single round-trip.
+    """
+
+    def __init__(self, host='127.0.0.1', port=11211, timeout=3):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+        self._socket = None
+        self._file = None
+
+    def connect(self):
+        if self._socket is None:
+            self._socket = socket.create_connection((self.host, self.port), self.timeout)
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._file = self._socket.makefile('rb')
+
+    def close(self):
+        if self._socket is not None:
+            self._file.close()
+            self._socket.close()
+
+        self._socket = None
+        self._file = None
+
+    def _send(self, data):
+        self.connect()
+        self._socket.sendall(data)
+
+    def _read_line(self):
+        line = self._file.readline()
+
+        if not line.endswith(b'\r\n'):
+            raise MemcacheProtocolException("Connection closed by server")
+
+        line = line[:-2]
+
+        if line == b'ERROR' or line.startswith(b'CLIENT_ERROR') or line.startswith(b'SERVER_ERROR'):
+            raise MemcacheProtocolException(line.decode('utf-8', 'replace'))
+
+        return line
+
+    def get_multi(self, keys):
+
+        keys = dict((_to_bytes(key), key) for key in keys)
+
+        if not keys:
+            return {}
+
+        self._send(b'get ' + b' '.join(keys) + b'\r\n')
+
+        values = {}
+
+        while True:
+            line = self._read_line()
+
+            if line == b'END':
+                return values
+
+            parts = line.split()
+            data = self._file.read(int(parts[3]) + 2)[:-2]
+
+            values[keys[parts[1]]] = decode_value(int(parts[2]), data)
+
+    def _storage_command(self, command, key, value, expires):
+        flags, data = encode_value(value)
+
+        return b' '.join([command, _to_bytes(key), str(flags).encode('ascii'),
+                          str(memcache_expires(expires)).encode('ascii'),
+                          str(len(data)).encode('ascii')]) + b'\r\n' + data + b'\r\n'
+
+    def store(self, command, key, value, expires=None):
+        self._send(self._storage_command(command, key, value, expires))
+
+        return self._read_line() == b'STORED'
+
+    def incr(self, key, delta=1):
+        """Returns the new value, or None if the key doesn't exist."""
+
+        self._send(b'incr ' + _to_bytes(key) + b' ' + str(int(delta)).encode('ascii') + b'\r\n')
+
+        line = self._read_line()
+
+        return None if line == b'NOT_FOUND' else int(line)
+
+    def set_multi(self, mapping, expires=None):
+        """Returns the keys that weren't stored."""
+
+        keys = list(mapping)
+
+        if not keys:
+            return []
+
+        self._send(b''.join(self._storage_command(b'set', key, mapping[key], expires)
+                            for key in keys))
+
+        return [key for key in keys if self._read_line() != b'STORED']
+
+    def delete_multi(self, keys):
+
+        keys = list(keys)
+
+        if not keys:
+            return True
+
+        self._send(b''.join(b'delete ' + _to_bytes(key) + b'\r\n' for key in keys))
+
+        for key in keys:
+            self._read_line()
+
+        return True
+
+class ConnectionPool(object):
+    """A thread-safe pool of at most `max_size` connections created by
+    `factory`.
+
+    Example usage::
+
+        pool = ConnectionPool(lambda: MemcacheConnection('10.0.0.1'), max_size=8)
+
+        with pool.connection() as conn:
+            conn.get_multi(['some-key'])
+
+    A connection that raised while checked out is closed and dropped, since
+    its protocol state is unknown.
+    """
+
+    def __init__(self, factory, max_size=4):
+        self.factory = factory
+        self.max_size = max_size
+
+        self._idle = queue.LifoQueue()
+        self._semaphore = threading.BoundedSemaphore(max_size)
+
+    def connection(self):
+        return _PooledConnection(self)
+
+    def _checkout(self):
+        self._semaphore.acquire()
+
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self.factory()
+
+    def _checkin(self, conn, broken=False):
+
+        if broken:
+            conn.close()
+        else:
+            self._idle.put(conn)
+
+        self._semaphore.release()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+class _PooledConnection(object):
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.conn = None
+
+    def __enter__(self):
+        self.conn = self.pool._checkout()
+        return self.conn
+
+    def __exit__(self, type, value, traceback):
+        self.pool._checkin(self.conn, broken=type is not None)
+
+class MemcacheClusterBackend(Backend):
+    """Backend spreading keys over several memcached servers.
+
+    Example usage::
+
+        from pycacher import Cacher
+        from pycacher.cluster import MemcacheClusterBackend
+
+        backend = MemcacheClusterBackend(['10.0.0.1:11211', '10.0.0.2:11211',
+                                          '10.0.0.3:11211'], pool_size=8)
+
+        cacher = Cacher(backend=backend)
+
+    Keys are placed with ketama consistent hashing. Every server has its own
+    pool of up to `pool_size` connections, and multi-key operations are split
+    per server and run in parallel, one pipelined round-trip per server.
+
+    A server that fails is ejected from the ring for `retry_after` seconds:
+    only its share of the keys is remapped to the other servers meanwhile,
+    and gets back to it once it's re-added. Failed reads are treated as
+    misses and failed writes as unstored keys, like python-memcached does.
+    """
+
+    def __init__(self, servers, pool_size=4, timeout=3, retry_after=30,
+                       points_per_node=160, connection_factory=MemcacheConnection):
+
+        self.servers = list(servers)
+
+        if not self.servers:
+            raise PycacherBackendArgumentException("At least one server is needed")
+
+        self.retry_after = retry_after
+
+        self.ring = HashRing(self.servers, points_per_node=points_per_node)
+        self.pools = {}
+
+        for server in self.servers:
+            host, port = server.rsplit(':', 1)
+
+            self.pools[server] = ConnectionPool(
+                    lambda host=host, port=int(port): connection_factory(host, port, timeout),
+                    max_size=pool_size)
+
+        self._ejected = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=len(self.servers))
+
+    def eject_node(self, server, retry_after=None):
+        """Takes a server out of the ring, until `retry_after` seconds have
+        passed (or forever if there's no `retry_after`)."""
+
+        if retry_after is None:
+            retry_after = self.retry_after
+
+        with self._lock:
+            self._ejected[server] = time.time() + retry_after if retry_after else None
+            self.ring.remove_node(server)
+
+    def add_node(self, server):
+        """Puts an ejected server back in the ring."""
+
+        with self._lock:
+            self._ejected.pop(server, None)
+
+            if server not in self.ring:
+                self.ring.add_node(server)
+
+    def _readd_recovered_nodes(self):
+
+        if not self._ejected:
+            return
+
+        now = time.time()
+
+        for server, retry_at in list(self._ejected.items()):
+            if retry_at is not None and retry_at <= now:
+                self.add_node(server)
+
+    def _run(self, server, fn, default):
+        """Runs `fn(conn)` on a pooled connection to `server`, ejecting the
+        server and returning `default` when it fails."""
+
+        try:
+            with self.pools[server].connection() as conn:
+                return fn(conn)
+        except (socket.error, MemcacheProtocolException):
+            self.eject_node(server)
+            return default
+
+    def _group_by_server(self, keys):
+
+        self._readd_recovered_nodes()
+
+        groups = {}
+
+        for key in keys:
+            server = self.ring.get_node(key)
+
+            if server is not None:
+                groups.setdefault(server, []).append(key)
+
+        return groups
+
+    def _run_per_server(self, groups, fn, default):
+        """Runs `fn(conn, keys)` for every server's share of the keys, in
+        parallel. Returns the list of results."""
+
+        if len(groups) == 1:
+            server, keys = list(groups.items())[0]
+            return [self._run(server, lambda conn: fn(conn, keys), default(keys))]
+
+        futures = [self._executor.submit(self._run, server,
+                                         lambda conn, keys=keys: fn(conn, keys),
+                                         default(keys))
+                   for server, keys in groups.items()]
+
+        return [future.result() for future in futures]
+
+    def get(self, key):
+        return self.multi_get([key]).get(key)
+
+    def set(self, key, value, expires=None):
+        return not self.multi_set({key: value}, expires=expires)
+
+    def add(self, key, value, expires=None):
+        server = self._group_by_server([key])
+
+        if not server:
+            return False
+
+        return self._run(list(server)[0],
+                         lambda conn: conn.store(b'add', key, value, expires), False)
+
+    def incr(self, key, delta=1):
+        server = self._group_by_server([key])
+
+        if not server:
+            return None
+
+        return self._run(list(server)[0], lambda conn: conn.incr(key, delta), None)
+
+    def delete(self, key):
+        return self.multi_delete([key])
+
+    def exists(self, key):
+        return self.get(key) is not None
+
+    def multi_get(self, keys):
+
+        values = {}
+
+        for result in self._run_per_server(self._group_by_server(keys),
+                                           lambda conn, keys: conn.get_multi(keys),
+                                           lambda keys: {}):
+            values.update(result)
+
+        return values
+
+    def multi_set(self, mapping, expires=None):
+
+        groups = self._group_by_server(mapping)
+
+        #keys that have no server to go to, if every server got ejected
+        failed = [key for key in mapping if not groups]
+
+        for result in self._run_per_server(groups,
+                                           lambda conn, keys: conn.set_multi(
+                                               dict((key, mapping[key]) for key in keys), expires),
+                                           lambda keys: keys):
+            failed.extend(result)
+
+        return failed
+
+    def multi_delete(self, keys):
+        self._run_per_server(self._group_by_server(keys),
+                             lambda conn, keys: conn.delete_multi(keys),
+                             lambda keys: False)
+
+        return True
@@ -0,0 +1,104 @@
+"""
+
+    This module contains the compressors applied to serialized payloads
+    before they're stored in the backend.
+
+    A compressed payload has its compressor's id in bits 3-4 of the header
+    byte (see `pycacher.serializers`), so it's decompressed transparently on
+    reads, whichever compressor the reader is configured with.
+
+"""
+
+import lzma
+import zlib
+
+from .exceptions import UnknownCompressorException
+
+class Compressor(object):
+    """Base class of the compressors. Subclasses define a unique
+    `compressor_id` (between 1 and 3) and a `name`, and implement `compress`
+    and `decompress`.
+
+    Payloads smaller than `threshold` bytes are stored as is, since the
+    compression overhead isn't worth it on them. So are payloads that don't
+    get any smaller.
+    """
+
+    compressor_id = None
+    name = None
+
+    def __init__(self, threshold=1024):
+        self.threshold = threshold
+
+    def compress(self, data):
+        raise NotImplementedError("Compressor subclasses should always implement `compress` method")
+
+    def decompress(self, data):
+        raise NotImplementedError("Compressor subclasses should always implement `decompress` method")
+
+class ZlibCompressor(Compressor):
+    """Fast compression with a decent ratio. `level` goes from 1 (fastest)
+    to 9 (smallest)."""
+
+    compressor_id = 1
+    name = 'zlib'
+
+    def __init__(self, level=6, threshold=1024):
+        super(ZlibCompressor, self).__init__(threshold)
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+class LZMACompressor(Compressor):
+    """Slow compression with the best ratio, for large and rarely written
+    values. `preset` goes from 0 (fastest) to 9 (smallest)."""
+
+    compressor_id = 2
+    name = 'lzma'
+
+    def __init__(self, preset=0, threshold=1024):
+        super(LZMACompressor, self).__init__(threshold)
+        self.preset = preset
+
+    def compress(self, data):
+        #the raw "alone" format has the smallest header
+        return lzma.compress(data, format=lzma.FORMAT_ALONE, preset=self.preset)
+
+    def decompress(self, data):
+        return lzma.decompress(data, format=lzma.FORMAT_ALONE)
+
+COMPRESSORS = {
+    'zlib': ZlibCompressor,
+    'lzma': LZMACompressor,
+}
+
+_decompressors = {}
+
+def get_compressor(compressor):
+    """Returns a compressor instance out of a compressor name or instance."""
+
+    if compressor is None or isinstance(compressor, Compressor):
+        return compressor
+
+    if compressor not in COMPRESSORS:
+        raise UnknownCompressorException("Unknown compressor: %r" % (compressor,))
+
+    return COMPRESSORS[compressor]()
+
+def get_decompressor(compressor_id):
+
+    decompressor = _decompressors.get(compressor_id)
+
+    if decompressor is None:
+        for compressor_class in COMPRESSORS.values():
+            if compressor_class.compressor_id == compressor_id:
+                decompressor = _decompressors[compressor_id] = compressor_class()
+                break
+        else:
+            raise UnknownCompressorException("Unknown compressor id: %s" % compressor_id)
+
+    return decompressor
@@ -1,73 +1,475 @@
-import pickle
-import math
+import itertools
+import threading
+import time
 
-from .utils import default_cache_key_func
-from .exceptions import InvalidHookEventException, OutOfBatcherContextRegistrationException
+from .utils import default_cache_key_func, hash_long_key, MISSING
+from .stampede import Lease
+from .refresh import CachedValue
+from .tags import TaggedValue, new_tag_version, version_id
+from .serializers import get_serializer
+from .compression import get_compressor
+from .hooks import current_timer
+from .exceptions import OutOfBatcherContextRegistrationException, NotNamespacedFunctionException
+
+def _function_stats(cacher, name):
+    """Returns the stats of a cached function, if the cacher keeps metrics."""
+
+    metrics = getattr(cacher, 'metrics', None)
+
+    if metrics is None:
+        return None
+
+    return metrics.function(name)
+
+def multi_get(cacher, keys, batcher=None):
+    """Gets several keys from the batcher, and those it doesn't have from the
+    backend with a single round-trip."""
+
+    values = {}
+
+    if batcher:
+        for key in keys:
+            values[key] = batcher.get(key)
+
+    missing = [key for key in keys
+               if values.get(key) is None and not (batcher and batcher.is_miss(key))]
+
+    if missing:
+        values.update(cacher.backend.multi_get(missing))
+
+    return values
 
 class CachedFunctionDecorator(object):
+    """Wraps a function so that its return values are cached.
+
+    With `single_flight` enabled, concurrent misses of the same key within
+    a process are coalesced into a single call of the wrapped function. With
+    `lease_timeout` set, the process computing a missing key additionally
+    takes a lease on it in the backend (which lasts at most `lease_timeout`
+    seconds), and other processes wait up to `lease_wait` seconds for its
+    value before computing it themselves.
+
+    With `namespaces` set, the cache keys of the function embed generation
+    counters stored in the backend: one for the function itself, and one for
+    each namespace returned by `namespaces(*args, **kwargs)` (if it's a
+    callable, `namespaces=True` only uses the function's own). Bumping a
+    counter with `invalidate_all` or `Cacher.invalidate_namespace` then
+    invalidates any number of keys at once. Outside of a batcher, looking up
+    the generations costs one more round-trip per call.
+
+    With `tags` set, `tags(*args, **kwargs)` returns the tags the value
+    depends on, and `Cacher.invalidate_tags` invalidates every value that
+    depends on any of the given tags. The versions of the tags are read in the
+    same `multi_get` as the value.
+
+    A None return value is cached like any other, for `negative_expires`
+    seconds if it's set, so that lookups of missing rows can be cached for
+    a shorter time than the others.
+
+    With `stale_after` set, values become stale that many seconds after being
+    computed: a stale value is still returned right away, but it also kicks
+    off a single background refresh of the key. With `early_refresh` set, the
+    value is instead recomputed probabilistically ahead of its expiry (XFetch),
+    `early_refresh` being the XFetch beta (1.0 is a good default, higher values
+    refresh earlier).
+    """
     
     def __init__(self, func, cacher=None, expires=None, 
-                        cache_key_func=default_cache_key_func):
+                        cache_key_func=default_cache_key_func, jitter=None,
+                        single_flight=False, lease_timeout=None, lease_wait=None,
+                        stale_after=None, early_refresh=None, serializer=None,
+                        compressor=None, namespaces=None, tags=None,
+                        negative_expires=None):
         self.func = func
+        self.serializer = get_serializer(serializer) if serializer else None
+        self.compressor = get_compressor(compressor)
         self.cacher = cacher
         self.cache_key_func = cache_key_func
         self.expires = expires
+        self.negative_expires = negative_expires
+        self.jitter = jitter
+        self.single_flight = single_flight
+        self.lease_timeout = lease_timeout
+        self.lease_wait = lease_wait
+        self.stale_after = stale_after
+        self.early_refresh = early_refresh
+        self.namespaces = namespaces
+        self.tags = tags
+        self.namespace = '%s.%s' % (func.__module__, getattr(func, '__qualname__', func.__name__))
+        self.metrics = _function_stats(cacher, self.namespace)
 
     def __call__(self, *args, **kwargs):
         """The method that will actually be called when the decorated functon
         is called."""
 
-        cache_key = self._build_cache_key(*args)
+        profiler = self.cacher.profiler
+
+        if profiler is not None and profiler.sample():
+            with profiler.start(self.namespace) as timer:
+                return self._call(timer, *args, **kwargs)
+
+        return self._call(None, *args, **kwargs)
+
+    def _call(self, timer, *args, **kwargs):
+
+        cache_key = self._build_cache_key(*args, **kwargs)
+
+        if timer is not None:
+            timer.cache_key = cache_key
+            timer.mark('key_build')
         
         batcher = self.cacher.get_current_batcher()
 
+        tag_keys = self.get_tag_keys(*args, **kwargs)
+        tag_versions = None
+
+        if tag_keys:
+            #The tag versions ride along with the value.
+            values = multi_get(self.cacher, [cache_key] + tag_keys, batcher)
+
+            unpickled_value = values.get(cache_key)
+            tag_versions = dict((key, values.get(key)) for key in tag_keys)
+
+            if unpickled_value is None:
+                unpickled_value = MISSING
+        else:
+            unpickled_value = self._get(cache_key, batcher)
+
+        if timer is not None:
+            timer.mark('lookup')
+
+        if self.metrics is not None:
+            self._record_lookup(unpickled_value)
+
+        if unpickled_value is not MISSING:
+            loaded_value = self._loads(unpickled_value)
+
+            if timer is not None:
+                timer.mark('deserialize')
+
+            value = self._unwrap(cache_key, tag_versions, loaded_value, *args, **kwargs)
+        elif self.single_flight:
+            value = self.cacher.flights.do(cache_key,
+                                           lambda: self._compute(cache_key, tag_versions,
+                                                                 *args, **kwargs),
+                                           timeout=self.lease_wait)
+        else:
+            value = self._compute(cache_key, tag_versions, *args, **kwargs)
+
+        on_call = self.cacher.hooks.on_call
+
+        if on_call is not None:
+            on_call(cache_key)
+
         if batcher:
-            unpickled_value = batcher.get(cache_key) or self.cacher.backend.get(cache_key)
+            on_call = batcher.hooks.on_call
+
+            if on_call is not None:
+                on_call(cache_key)
+            
+        return value
+
+    def _record_lookup(self, unpickled_value):
+
+        if unpickled_value is MISSING:
+            self.metrics.incr('misses')
         else:
+            self.metrics.incr('hits')
+            self.metrics.incr('bytes_read', len(unpickled_value))
+
+    def _get(self, cache_key, batcher=None):
+        """Returns the stored payload of the key, or `MISSING`."""
+
+        if batcher:
+            unpickled_value = batcher.get(cache_key)
+
+            #batched and not found, no need to ask the backend again
+            if unpickled_value is None and batcher.is_miss(cache_key):
+                return MISSING
+        else:
+            unpickled_value = None
+
+        if unpickled_value is None:
             unpickled_value = self.cacher.backend.get(cache_key)
 
+        if unpickled_value is None:
+            return MISSING
+
+        return unpickled_value
+
+    def _compute(self, cache_key, tag_versions, *args, **kwargs):
+        """Runs the actual function and stores its value, under a backend lease
+        if `lease_timeout` is set. `tag_versions` are the versions of the
+        function's tags read before the computation, if it has tags."""
+
+        if self.lease_timeout is None:
+            return self._compute_and_store(cache_key, tag_versions, *args, **kwargs)
+
+        lease = Lease(self.cacher.backend, cache_key, timeout=self.lease_timeout)
+
+        if lease.acquire():
+            try:
+                return self._compute_and_store(cache_key, tag_versions, *args, **kwargs)
+            finally:
+                lease.release()
+
+        #Another process is computing the value, wait for it. It's fresher
+        #than the tag versions read before waiting, so they aren't checked.
+        unpickled_value = lease.wait(self.lease_wait)
+
         if unpickled_value is not None:
-            value = pickle.loads(unpickled_value)
-        else:
-            value = self.func(*args)
-            self.cacher.backend.set(cache_key, pickle.dumps(value))
+            return self._unwrap(cache_key, None, self._loads(unpickled_value), *args, **kwargs)
+
+        return self._compute_and_store(cache_key, tag_versions, *args, **kwargs)
+
+    def _compute_and_store(self, cache_key, tag_versions, *args, **kwargs):
+
+        #Tags that don't exist yet get their first version before the
+        #computation starts.
+        if tag_versions is not None:
+            tag_versions = self.cacher.get_tag_versions(list(tag_versions), tag_versions)
+
+        timer = current_timer(cache_key)
 
-        self.cacher.trigger_hooks('call', cache_key)
+        if timer is not None:
+            timer.mark('lookup')
+
+        start = time.time()
+        value = self.func(*args, **kwargs)
+        delta = time.time() - start
+
+        if timer is not None:
+            timer.mark('compute')
+
+        self._store(cache_key, value, delta, tag_versions)
+
+        if timer is not None:
+            timer.mark('store')
+
+        return value
+
+    def _store(self, cache_key, value, delta, tag_versions=None):
+        """Stores the value, or buffers it in the current batcher if it's a
+        write-back one."""
+
+        expires = self.get_expires(negative=value is None)
+        value = self._wrap(value, delta, expires, tag_versions)
+
+        batcher = self.cacher.get_current_batcher()
+
+        #Values computed under a lease are stored right away, since other
+        #processes are polling for them.
+        unpickled_value = self._dumps(value)
+
+        if self.metrics is not None:
+            self.metrics.observe('compute_seconds', delta)
+            self.metrics.incr('bytes_written', len(unpickled_value))
+
+        if batcher and batcher.write_back and self.lease_timeout is None:
+            return batcher.buffer(cache_key, unpickled_value, expires=expires)
 
         if batcher:
-            batcher.trigger_hooks('call', cache_key)
-            
+            batcher.record(cache_key, unpickled_value)
+
+        return self.cacher.backend.set(cache_key, unpickled_value, expires=expires)
+
+    def _wrap(self, value, delta, expires, tag_versions=None):
+        """Wraps the value with its refresh metadata if this function refreshes
+        ahead of expiry, and with its tag versions if it has tags."""
+
+        if self.stale_after is not None or self.early_refresh is not None:
+            now = time.time()
+
+            value = CachedValue(value,
+                                soft_expires_at=now + self.stale_after if self.stale_after is not None else None,
+                                expires_at=now + expires if expires else None,
+                                delta=delta).dump()
+
+        if tag_versions is not None:
+            value = TaggedValue(value, tag_versions).dump()
+
         return value
 
-    def _build_cache_key(self, *args):
+    def _unwrap(self, cache_key, tag_versions, value, *args, **kwargs):
+        """Returns the actual return value out of a stored value, recomputing
+        it if its tags were invalidated, and refreshing it first if needed."""
+
+        tagged = TaggedValue.load(value)
+
+        if tagged is not None:
+            if tag_versions is not None and not tagged.is_valid(tag_versions):
+                return self._compute(cache_key, tag_versions, *args, **kwargs)
+
+            value = tagged.value
+        elif tag_versions is not None:
+            #cached before the function had tags
+            return self._compute(cache_key, tag_versions, *args, **kwargs)
+
+        cached = CachedValue.load(value)
+
+        if cached is None:
+            return value
+
+        value = cached
+
+        if self.early_refresh is not None and value.should_refresh_early(self.early_refresh):
+            return self._compute(cache_key, tag_versions, *args, **kwargs)
+
+        if value.is_stale():
+            self._refresh_in_background(cache_key, *args, **kwargs)
+
+        return value.value
+
+    def _refresh_in_background(self, cache_key, *args, **kwargs):
+        """Starts a thread that warms the key, unless a refresh of the key is
+        already running in this process (or in another one, given a lease)."""
+
+        if self.cacher.flights.in_flight(cache_key):
+            return
+
+        def refresh():
+            if self.lease_timeout is None:
+                return self.warm(*args, **kwargs)
+
+            lease = Lease(self.cacher.backend, cache_key, timeout=self.lease_timeout)
+
+            if lease.acquire():
+                try:
+                    return self.warm(*args, **kwargs)
+                finally:
+                    lease.release()
+
+        thread = threading.Thread(target=self.cacher.flights.do, args=(cache_key, refresh))
+        thread.daemon = True
+        thread.start()
+
+    def _build_cache_key(self, *args, **kwargs):
         """Builds the cache key with the supplied cache_key function """
+
+        key = self.build_unversioned_cache_key(*args, **kwargs)
+
+        if not self.namespaces:
+            return key
+
+        namespaces = self.get_namespaces(*args, **kwargs)
+        generations = self.cacher.get_generations(namespaces, self.cacher.get_current_batcher())
+
+        return self.cacher.versioned_key(key, [generations[namespace] for namespace in namespaces])
+
+    def build_unversioned_cache_key(self, *args, **kwargs):
+        """Builds the cache key without the namespace generations."""
+
+        #kwargs are only passed when there are some, so that key functions
+        #written for positional args only keep working.
+        if kwargs:
+            return self.cache_key_func(self.func, *args, **kwargs)
+
         return self.cache_key_func(self.func, *args)
 
-    def build_cache_key(self, *args):
+    def get_tag_keys(self, *args, **kwargs):
+        """Returns the keys of the versions of the tags the value depends on."""
+
+        if not self.tags:
+            return []
+
+        return [self.cacher.tag_key(tag) for tag in self.tags(*args, **kwargs)]
+
+    def get_tag_versions(self, *args, **kwargs):
+        """Returns the current versions of the tags, or None if the function
+        has no tags."""
+
+        if not self.tags:
+            return None
+
+        return self.cacher.get_tag_versions(self.get_tag_keys(*args, **kwargs))
+
+    def get_namespaces(self, *args, **kwargs):
+        """Returns the namespaces whose generations are part of the key."""
+
+        if not self.namespaces:
+            return []
+
+        if callable(self.namespaces):
+            return [self.namespace] + list(self.namespaces(*args, **kwargs))
+
+        return [self.namespace]
+
+    def build_cache_key(self, *args, **kwargs):
         """Builds the cache key with the supplied cache_key function """
-        return self.cache_key_func(self.func, *args)
+        return self._build_cache_key(*args, **kwargs)
+
+    def _dumps(self, value):
+        """Serializes a value with this function's serializer and compressor,
+        or the cacher's."""
+        return self.cacher.dumps(value, self.serializer, self.compressor)
+
+    def _loads(self, data):
+        return self.cacher.loads(data)
+
+    def get_expires(self, negative=False):
+        """Returns the (jittered) TTL for the next value stored by this
+        function, or for the next None if `negative` is set."""
+
+        if negative and self.negative_expires is not None:
+            return self.cacher.resolve_expires(self.negative_expires, self.jitter)
+
+        return self.cacher.resolve_expires(self.expires, self.jitter)
 
-    def warm(self, *args):
+    def warm(self, *args, **kwargs):
         """
             Forces to run the actual function (regardless of whether we already
             have the result on the cache or not) and set the backend to store
             the return value.
         """
-        cache_key = self._build_cache_key(*args)
+        cache_key = self._build_cache_key(*args, **kwargs)
+        tag_versions = self.get_tag_versions(*args, **kwargs)
+
+        start = time.time()
+        value = self.func(*args, **kwargs)
+
+        return self._store(cache_key, value, time.time() - start, tag_versions)
+
+    def warm_multi(self, args_list):
+        """
+            Like `warm`, for several sets of args, storing all the return
+            values with a single `multi_set` round-trip.
+
+            Example usage::
+
+                expensive_function.warm_multi([(1, 2), (1, 3), (2, 5)])
+        """
+        expires = {False: self.get_expires(), True: self.get_expires(negative=True)}
+        groups = {}
+
+        for args in args_list:
+            tag_versions = self.get_tag_versions(*args)
+
+            start = time.time()
+            value = self.func(*args)
+
+            #None values go in a separate round-trip if they expire sooner.
+            negative = value is None and expires[True] != expires[False]
+            value = self._wrap(value, time.time() - start, expires[negative], tag_versions)
+
+            groups.setdefault(negative, {})[self._build_cache_key(*args)] = self._dumps(value)
 
-        value = self.func(*args)
-        return self.cacher.backend.set(cache_key, pickle.dumps(value))
+        failed = []
 
-    def is_cached(self, *args):
+        for negative, values in groups.items():
+            failed.extend(self.cacher.backend.multi_set(values, expires=expires[negative]) or [])
+
+        return failed
+
+    def is_cached(self, *args, **kwargs):
         """
             Simply checks if the current function value with the supplied args
             is currently cached in the backend.
         """
-        cache_key = self._build_cache_key(*args)
+        cache_key = self._build_cache_key(*args, **kwargs)
 
         return self.cacher.backend.exists(cache_key)
 
-    def invalidate(self, *args):
+    def invalidate(self, *args, **kwargs):
         """Invalidates the current function's cache key with the current args.
 
         Example usage::
@@ -76,7 +478,7 @@ class CachedFunctionDecorator(object):
 
         """
 
-        key = self._build_cache_key(*args)
+        key = self._build_cache_key(*args, **kwargs)
 
         rv = self.cacher.delete(key)
         
@@ -85,7 +487,23 @@ class CachedFunctionDecorator(object):
 
         return rv
 
-    def register(self, *args):
+    def invalidate_all(self):
+        """Invalidates the cached values of the function for all args, with a
+        single `incr`. Needs `namespaces` to be set.
+
+        Example usage::
+
+            is_user_board_subscriber.invalidate_all()
+
+        """
+
+        if not self.namespaces:
+            raise NotNamespacedFunctionException(
+                    "invalidate_all needs the function to be cached with `namespaces`")
+
+        self.cacher.invalidate_namespace(self.namespace)
+
+    def register(self, *args, **kwargs):
         """Registers the cached function on an active batcher context for later batching.
             
             Example usage::
@@ -105,22 +523,40 @@ class CachedFunctionDecorator(object):
 
         if batcher:
             #Register the function and the args to the batcher 
-            batcher.register(self, *args)
+            batcher.register(self, *args, **kwargs)
         else:
             raise OutOfBatcherContextRegistrationException()
 
 class CachedListFunctionDecorator(object):
+    """Wraps a function returning a paginated list (taking `skip` and `limit`
+    keyword args) so that the list is cached in chunks of `range` items.
+
+    Chunk `n` holds the items `[n * range, (n + 1) * range)` of the list.
+
+    Every list also has a version, that all its chunks are stored with, and a
+    metadata record with the number of populated chunks and the length of
+    the list, once its end has been reached. Both are read in the same
+    `multi_get` as the chunks. Invalidating a list bumps its version, which
+    invalidates all its chunks at once, and deletes the populated chunks
+    with a single `multi_delete`.
+    """
     
     def __init__(self, func, cacher=None, expires=None, 
                         cache_key_func=default_cache_key_func, range=10, 
-                        skip_key='skip', limit_key='limit'):
+                        skip_key='skip', limit_key='limit', jitter=None,
+                        serializer=None, compressor=None):
         self.func = func
+        self.serializer = get_serializer(serializer) if serializer else None
+        self.compressor = get_compressor(compressor)
         self.cacher = cacher
         self.cache_key_func = cache_key_func
         self.expires = expires
+        self.jitter = jitter
         self.range = range
         self.skip_key = skip_key
         self.limit_key = limit_key
+        self.metrics = _function_stats(cacher, '%s.%s' % (func.__module__,
+                                                        getattr(func, '__qualname__', func.__name__)))
 
     def __call__(self, *args, **kwargs):
         """
@@ -129,151 +565,274 @@ class CachedListFunctionDecorator(object):
 
             app.models.user.get_user_activity_ids(1, skip=0, limit=15)
 
-        When this function is called, it will compare the delta between limit and
-        skip and decide which "chunks" it should get.
+        When this function is called, it fetches all the chunks overlapping
+        the requested skip & limit with a single `multi_get`.
 
         For example, if the range of the cached function is 5, and the requested 
-        skip & limit is 0 & 15, it will then try to call the actual function with 3 different
-        skip & limit pairs, which are 0:5, 6:10, and 11:15.
+        skip & limit is 3 & 10, it fetches the chunks [0:5], [5:10] and
+        [10:15]. Adjacent missing chunks are computed together: if all three
+        are missing, the actual function is called once with skip & limit
+        0 & 15.
+
+        Other kwargs are passed to the function, and are part of the keys.
 
         """
         
-        limit = kwargs[self.limit_key]
-        skip = kwargs[self.skip_key]
-        
-        #Get the range pairs.
+        limit = kwargs.pop(self.limit_key)
+        skip = kwargs.pop(self.skip_key)
+
+        if limit <= 0:
+            return []
+
+        #Ranged keys are for internal use only, hooks get the root key.
+        cache_key = self.build_cache_key(*args, **kwargs)
+
+        first = skip // self.range
         range_pairs = self._get_range_pairs(self.range, skip, limit)
+        keys = [self._ranged_key(cache_key, start, end) for start, end in range_pairs]
+
+        version_key, meta_key = self._meta_keys(cache_key)
 
-        #This list will store all the values that needs to be returned according
-        #to the skip & limit rule.
-        return_list = []
-        
         batcher = self.cacher.get_current_batcher()
+        values = multi_get(self.cacher, [version_key, meta_key] + keys, batcher)
 
-        first_iter = True
-        
-        #Go through each of the range pair.
-        for rp in range_pairs:
+        versions = {version_key: values.get(version_key)}
+        version = version_id(versions[version_key])
 
-            cache_key = self.build_ranged_cache_key(start=rp[0], end=rp[1], *args)
+        meta = self._load_meta(values.get(meta_key), version)
+        length = meta['length'] if meta else None
 
-            #print "cache_key", cache_key
+        chunks = []
 
-            if batcher:
-                unpickled_value = batcher.get(cache_key) or self.cacher.backend.get(cache_key)
-            else:
-                unpickled_value = self.cacher.backend.get(cache_key)
-
-            if unpickled_value is not None:
-
-                #append the value to the return list
-                value = pickle.loads(unpickled_value)
-            else:
-                
-                if first_iter:
-                    func_skip = rp[0]
-                else:
-                    func_skip = rp[0] - 1
-
-                #Call the actual function with the correct skip and the limit.
-                value = self.func(skip=func_skip, limit=self.range, *args)
-                self.cacher.set(cache_key, value)
-
-            return_list += value
-            
-            #if the length of value is less than range, then that means the
-            #function won't have anything to return anyways in subsequent range iterations
-            #so let's just stop running them.
-            if len(value) < self.range:
+        for (start, end), key in zip(range_pairs, keys):
+            chunk = values.get(key)
+
+            if length is not None and start >= length:
+                #past the known end of the list, no need to compute it
+                chunk = []
+            elif chunk is not None:
+                chunk = self._loads(chunk)
+
+                #chunks of another version of the list are misses
+                chunk = chunk[1] if len(chunk) == 2 and chunk[0] == version else None
+
+            chunks.append(chunk)
+
+        #Chunks computed on misses, stored together at the end.
+        computed = {}
+
+        i = 0
+
+        while i < len(chunks):
+
+            if chunks[i] is None:
+                #Merge this miss with the adjacent ones into a single call.
+                j = i
+
+                while j < len(chunks) and chunks[j] is None:
+                    j += 1
+
+                #A list that doesn't have a version yet gets one before the
+                #computation starts.
+                if not computed:
+                    versions = self.cacher.get_tag_versions([version_key], versions)
+                    version = version_id(versions[version_key])
+
+                start = time.time()
+                kwargs[self.skip_key] = range_pairs[i][0]
+                kwargs[self.limit_key] = (j - i) * self.range
+
+                value = self.func(*args, **kwargs)
+
+                if self.metrics is not None:
+                    self.metrics.observe('compute_seconds', time.time() - start)
+
+                for k in range(i, j):
+                    offset = (k - i) * self.range
+                    chunks[k] = value[offset:offset + self.range]
+                    computed[keys[k]] = self._dumps([version, chunks[k]])
+
+                    if len(chunks[k]) < self.range:
+                        break
+
+                i = k
+
+            #A short chunk is the end of the list, there's nothing after it.
+            if len(chunks[i]) < self.range:
+                if length is None or range_pairs[i][0] < length:
+                    length = range_pairs[i][0] + len(chunks[i])
+
+                del chunks[i + 1:]
                 break
 
-            first_iter = False
+            i += 1
+
+        if self.metrics is not None:
+            self._record_lookups(values, keys, computed)
+
+        if computed:
+            populated = max([meta['chunks'] if meta else 0] +
+                            [first + index + 1 for index, key in enumerate(keys) if key in computed])
+
+            computed[meta_key] = self._dumps({'version': version, 'chunks': populated,
+                                              'length': length})
+
+            self._store_chunks(computed, batcher)
+
+        on_call = self.cacher.hooks.on_call
 
-            print "CALLING CACHE_KEY", cache_key
+        if on_call is not None:
+            on_call(cache_key)
 
-            self.cacher.trigger_hooks('call', cache_key)
+        if batcher:
+            on_call = batcher.hooks.on_call
+
+            if on_call is not None:
+                on_call(cache_key)
+
+        start = skip - first * self.range
+
+        return list(itertools.islice(itertools.chain.from_iterable(chunks), start, start + limit))
+
+    def _record_lookups(self, values, keys, computed):
+        """Records the chunks that were found as hits, and the computed ones
+        as misses."""
+
+        for key in keys:
+            if key in computed:
+                self.metrics.incr('misses')
+                self.metrics.incr('bytes_written', len(computed[key]))
+            elif values.get(key) is not None:
+                self.metrics.incr('hits')
+                self.metrics.incr('bytes_read', len(values[key]))
+
+    def _store_chunks(self, chunks, batcher=None):
+        """Stores serialized chunks with a single round-trip, or buffers them in
+        the current batcher if it's a write-back one."""
 
+        expires = self.get_expires()
+
+        if batcher and batcher.write_back:
+            for cache_key, value in chunks.items():
+                batcher.buffer(cache_key, value, expires=expires)
+        else:
             if batcher:
-                batcher.trigger_hooks('call', cache_key)
-        
-        #print "ORIGINAL RETURN LIST", len(return_list), return_list
-        
-        cut_return_list = return_list[0:limit]
+                for cache_key, value in chunks.items():
+                    batcher.record(cache_key, value)
 
-        #print "after cut", cut_return_list
-        #TODO : make this more performant
-        #only return n-many return values that is requested.
-        return cut_return_list
+            self.cacher.backend.multi_set(chunks, expires=expires)
 
     def _get_range_pairs(self, range_, skip, limit):
         """
-            Returns (0, 5), (6, 10), (11, 15)
+            Returns the (start, end) bounds of the chunks overlapping the
+            requested items, e.g. (0, 5), (5, 10), (10, 15) for a range of
+            5, skip of 3 and limit of 10.
         """
-        range_limit = range_ * int(math.ceil(float(limit + skip)/range_))
-        skip_limit = range_ * (skip/range_)
-        
-        l = []
-        i = 0
-    
-        #print "original skip", skip
-        #print "SKIP LIMIT", skip_limit
-        #print "RANGE LIMIT", range_limit
-
-        for lower_bound in xrange(skip_limit, range_limit, range_):
-            
-            if i == 0 and skip_limit == 0:
-                l.append((lower_bound, lower_bound + range_))
-            else:
-                l.append((lower_bound + 1, lower_bound + range_))
 
-            i += 1
+        if limit <= 0:
+            return []
 
-        return l
+        return [(i * range_, (i + 1) * range_)
+                for i in range(skip // range_, (skip + limit - 1) // range_ + 1)]
 
-    def invalidate(self, *args):
+    def invalidate(self, *args, **kwargs):
         """
         
         Example usage::
 
             app.models.user.get_user_friend_ids.invalidate(1)
         
-        app.models.user.get_user_activity_ids:1[$LIMIT]
-
-        When invalidates, what we do is to know [0:5],[6:10],[11:15]
+        Bumps the version of the list, which invalidates all its chunks, even
+        those a concurrent call is about to store. Then deletes the chunks
+        the metadata record knows are populated, e.g. [0:5], [5:10] and
+        [10:15], along with the record, in a single `multi_delete`.
 
         """
         
-        #TODO : limit has to be retrieved from metakey
-        ranged_keys_to_invalidate = self.get_ranged_cache_keys(skip=0, limit=75, *args)
-        
-        for ranged_key in ranged_keys_to_invalidate:
-            self.cacher.delete(ranged_key)
+        cache_key = self.build_cache_key(*args, **kwargs)
+        version_key, meta_key = self._meta_keys(cache_key)
 
-            #run all the invalidate hooks with the root cache key
-            self.cacher.trigger_hooks('invalidate', ranged_key)
-        
-        #key = self.build_cache_key(*args)
+        meta = self._load_meta(self.cacher.backend.get(meta_key))
+
+        self.cacher.backend.set(version_key, new_tag_version())
+
+        keys = [meta_key]
+
+        if meta:
+            keys += [self._ranged_key(cache_key, start, end)
+                     for start, end in self._get_range_pairs(self.range, 0, meta['chunks'] * self.range)]
+
+        self.cacher.backend.multi_delete(keys)
+        self.cacher.forget([version_key] + keys)
 
         #run all the invalidate hooks with the root cache key
-        #self.cacher.trigger_hooks('invalidate', key)
+        self.cacher.trigger_hooks('invalidate', cache_key)
     
-    def build_cache_key(self, *args):
+    def build_cache_key(self, *args, **kwargs):
+        """Builds the root key of the list, out of the args and of the kwargs
+        other than skip & limit."""
+
+        #kwargs are only passed when there are some, so that key functions
+        #written for positional args only keep working.
+        if kwargs:
+            return self.cache_key_func(self.func, *args, **kwargs)
+
         return self.cache_key_func(self.func, *args)
 
+    def get_meta_keys(self, *args, **kwargs):
+        """Returns the keys of the version and of the metadata record of the
+        list."""
+        return self._meta_keys(self.build_cache_key(*args, **kwargs))
+
+    def _meta_keys(self, cache_key):
+        return self.cacher.tag_key('list:' + cache_key), hash_long_key(cache_key + '[meta]')
+
+    def _load_meta(self, data, version=None):
+        """Returns the metadata record, or None if there's none for `version`."""
+
+        if data is None:
+            return None
+
+        meta = self._loads(data)
+
+        if version is not None and meta['version'] != version:
+            return None
+
+        return meta
+
+    def _dumps(self, value):
+        """Serializes a value with this function's serializer and compressor,
+        or the cacher's."""
+        return self.cacher.dumps(value, self.serializer, self.compressor)
+
+    def _loads(self, data):
+        return self.cacher.loads(data)
+
+    def get_expires(self):
+        """Returns the (jittered) TTL for the next chunk stored by this function."""
+        return self.cacher.resolve_expires(self.expires, self.jitter)
+
     def build_ranged_cache_key(self, *args, **kwargs):
         """
             app.models.user.get_user_activity_ids:1[0:5]
-            app.models.user.get_user_activity_ids:1[6:10]
-            app.models.user.get_user_activity_ids:1[11:15]
+            app.models.user.get_user_activity_ids:1[5:10]
+            app.models.user.get_user_activity_ids:1[10:15]
         """
-        return self.build_cache_key(*args) + ('[%s:%s]' % (int(kwargs['start']), int(kwargs['end'])))
+        start = kwargs.pop('start')
+        end = kwargs.pop('end')
+
+        return self._ranged_key(self.build_cache_key(*args, **kwargs), start, end)
+
+    def _ranged_key(self, cache_key, start, end):
+        #hashed again, since the suffix can push the key over the length limit
+        return hash_long_key(cache_key + ('[%s:%s]' % (int(start), int(end))))
 
     def get_ranged_cache_keys(self, *args, **kwargs):
         
-        range_pairs = self._get_range_pairs(self.range, kwargs['skip'], kwargs['limit'])
+        range_pairs = self._get_range_pairs(self.range, kwargs.pop('skip'), kwargs.pop('limit'))
+        cache_key = self.build_cache_key(*args, **kwargs)
 
-        return [self.build_ranged_cache_key(start=rp[0], end=rp[1], *args)
-                for rp in range_pairs]
+        return [self._ranged_key(cache_key, start, end) for start, end in range_pairs]
 
     def register(self, *args, **kwargs):
         """
@@ -283,6 +842,9 @@ class CachedListFunctionDecorator(object):
         batcher = self.cacher.get_current_batcher()
 
         if batcher:
-            batcher.register_list(self, skip=kwargs['skip'], limit=kwargs['limit'], *args)
+            skip = kwargs.pop(self.skip_key)
+            limit = kwargs.pop(self.limit_key)
+
+            batcher.register_list(self, skip=skip, limit=limit, *args, **kwargs)
         else:
             raise OutOfBatcherContextRegistrationException()
@@ -3,3 +3,15 @@ class InvalidHookEventException(Exception):
 
 class OutOfBatcherContextRegistrationException(Exception):
     pass
+
+class MemcacheProtocolException(Exception):
+    pass
+
+class UnknownSerializerException(Exception):
+    pass
+
+class UnknownCompressorException(Exception):
+    pass
+
+class NotNamespacedFunctionException(Exception):
+    pass
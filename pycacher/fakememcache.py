@@ -0,0 +1,785 @@
+"""
+
+    This module contains a memcache server written in pure Python on top of
+    asyncio, standing in for memcached in tests, benchmarks and load tests on
+    machines that don't have one.
+
+    Example usage::
+
+        from pycacher import Cacher
+        from pycacher.backends import MemcacheBackend
+        from pycacher.fakememcache import FakeMemcacheServer
+
+        with FakeMemcacheServer(max_bytes=64 * 1024 * 1024) as server:
+            cacher = Cacher(backend=MemcacheBackend(host=server.host, port=server.port))
+
+    The server runs its own event loop in a background thread, so blocking
+    clients can use it from the thread that started it. It can also be run on
+    its own::
+
+        python -m pycacher.fakememcache --port 11211 --latency 0.001
+
+    It speaks the text protocol (get, gets, set, add, replace, append,
+    prepend, cas, delete, incr, decr, touch, flush_all, stats, version, quit)
+    and the meta protocol (mg, ms, md, ma, mn). Items expire after their TTL,
+    and the least recently used ones are evicted past `max_bytes`. Keys longer
+    than 250 bytes, or with control characters, are refused with a
+    `CLIENT_ERROR` like memcached does.
+
+    Network trouble can be simulated: every response is delayed by `latency`
+    seconds (pipelined commands arriving together are answered together, as
+    over a slow link), and a `failure_rate` fraction of the commands fail
+    with a `SERVER_ERROR`, a dropped connection or no response at all,
+    depending on `failure_mode`. Both can be changed while the server runs::
+
+        server.latency = 0.005
+        server.failure_rate = 0.01
+        server.failure_mode = 'disconnect'
+
+"""
+
+import argparse
+import asyncio
+import collections
+import random
+import threading
+import time
+
+from .backends import MEMCACHE_MAX_RELATIVE_EXPIRES
+
+#longest command line accepted, e.g. a get of thousands of keys
+MAX_LINE_LENGTH = 16 * 1024 * 1024
+
+#bytes accounted for every item on top of its key and data
+ITEM_OVERHEAD = 48
+
+#longest key memcached accepts
+MAX_KEY_LENGTH = 250
+
+FAILURE_MODES = ('error', 'disconnect', 'hang')
+
+#commands followed by a data block, and the index of its length in their
+#arguments
+STORAGE_COMMANDS = {b'set': 3, b'add': 3, b'replace': 3, b'append': 3, b'prepend': 3,
+                    b'cas': 3, b'ms': 1}
+
+#commands whose arguments are all keys, the others taking one key first
+MULTI_KEY_COMMANDS = (b'get', b'gets')
+KEYLESS_COMMANDS = (b'flush_all', b'stats', b'version', b'mn')
+
+class _Item(object):
+
+    __slots__ = ('flags', 'exptime', 'data', 'cas')
+
+    def __init__(self, flags, exptime, data):
+        self.flags = flags
+        self.exptime = exptime
+        self.data = data
+        self.cas = 0
+
+def _absolute_exptime(exptime):
+    """Returns the time at which an item stored with `exptime` expires, 0
+    meaning never."""
+
+    if exptime == 0:
+        return 0
+    elif exptime < 0:
+        return -1
+    elif exptime <= MEMCACHE_MAX_RELATIVE_EXPIRES:
+        return time.time() + exptime
+
+    return exptime
+
+def _remaining_ttl(item):
+    if not item.exptime:
+        return -1
+
+    return max(int(round(item.exptime - time.time())), 0)
+
+def _item_size(key, data):
+    return len(key) + len(data) + ITEM_OVERHEAD
+
+def _valid_key(key):
+    """Keys are at most 250 bytes, without control characters (whitespace
+    splits them already)."""
+    return len(key) <= MAX_KEY_LENGTH and not any(byte < 0x20 or byte == 0x7f for byte in key)
+
+def _valid_keys(name, args):
+    if name in KEYLESS_COMMANDS:
+        return True
+
+    if name in MULTI_KEY_COMMANDS:
+        return all(_valid_key(key) for key in args)
+
+    return not args or _valid_key(args[0])
+
+def _meta_flags(tokens):
+    """Returns the `(flag, token)` pairs of the flags of a meta command."""
+    return [(token[:1], token[1:]) for token in tokens]
+
+class MemcacheStore(object):
+    """The items of a server, keyed by bytes keys, from the least to the most
+    recently used. Past `max_bytes`, the least recently used items are
+    evicted."""
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+
+        self.bytes = 0
+        self.evictions = 0
+
+        self._items = collections.OrderedDict()
+        self._cas = 0
+
+    def get(self, key):
+        item = self._items.get(key)
+
+        if item is None:
+            return None
+
+        if item.exptime and item.exptime <= time.time():
+            self.delete(key)
+            return None
+
+        self._items.move_to_end(key)
+
+        return item
+
+    def set(self, key, item):
+        """Stores `item`, giving it a new cas unique."""
+
+        self.delete(key)
+
+        self._cas += 1
+        item.cas = self._cas
+
+        self._items[key] = item
+        self.bytes += _item_size(key, item.data)
+
+        while self.max_bytes is not None and self.bytes > self.max_bytes and len(self._items) > 1:
+            evicted_key, evicted = self._items.popitem(last=False)
+
+            self.bytes -= _item_size(evicted_key, evicted.data)
+            self.evictions += 1
+
+    def delete(self, key):
+        item = self._items.pop(key, None)
+
+        if item is None:
+            return False
+
+        self.bytes -= _item_size(key, item.data)
+
+        return True
+
+    def flush(self):
+        self._items.clear()
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self._items)
+
+class _ProtocolError(Exception):
+    pass
+
+class _Connection(object):
+    """A client connection. Responses delayed by the injected latency wait in
+    `queue` for the `sender` task, which writes them out in order."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.queue = collections.deque()
+        self.sender = None
+
+class FakeMemcacheServer(object):
+    """A memcache server listening on `host`:`port`, a port of 0 picking a
+    free one (read it back from `port` once started).
+
+    `max_bytes` bounds the memory used by the items (None for no bound), and
+    `max_item_size` the size of a single item. `latency`, `failure_rate` and
+    `failure_mode` simulate network trouble, and `seed` makes the injected
+    failures reproducible.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, max_bytes=None, max_item_size=1024 * 1024,
+                       latency=0, failure_rate=0, failure_mode='error', seed=None):
+
+        if failure_mode not in FAILURE_MODES:
+            raise ValueError("Failure mode must be 'error', 'disconnect' or 'hang'")
+
+        self.host = host
+        self.port = port
+        self.max_item_size = max_item_size
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failure_mode = failure_mode
+
+        self.store = MemcacheStore(max_bytes)
+        self.counters = collections.Counter()
+
+        self._random = random.Random(seed)
+        self._server = None
+        self._loop = None
+        self._thread = None
+        self._tasks = set()
+
+    async def serve(self):
+        """Starts listening, on the running event loop."""
+
+        self._server = await asyncio.start_server(self._handle, self.host, self.port,
+                                                  limit=MAX_LINE_LENGTH)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+        return self._server
+
+    def start(self):
+        """Starts the server in a background thread, returning once it
+        accepts connections."""
+
+        started = threading.Event()
+        errors = []
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+
+            try:
+                self._loop.run_until_complete(self.serve())
+            except Exception as e:
+                errors.append(e)
+                started.set()
+                return
+
+            started.set()
+            self._loop.run_forever()
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name='pycacher-fakememcache')
+        self._thread.daemon = True
+        self._thread.start()
+
+        started.wait()
+
+        if errors:
+            raise errors[0]
+
+        return self
+
+    def stop(self):
+        """Stops a server started with `start`, closing its connections."""
+
+        if self._thread is None:
+            return
+
+        async def shutdown():
+            self._server.close()
+
+            for task in list(self._tasks):
+                task.cancel()
+
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+            self._loop.stop()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop)
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, type, value, traceback):
+        self.stop()
+
+    def flush(self):
+        """Drops all the items, e.g. between tests."""
+        self.store.flush()
+
+    def stats(self):
+        """Returns the counters reported by the `stats` command."""
+
+        stats = dict(self.counters)
+        stats.update({
+            'curr_items': len(self.store),
+            'bytes': self.store.bytes,
+            'limit_maxbytes': self.store.max_bytes or 0,
+            'evictions': self.store.evictions,
+        })
+
+        return stats
+
+    async def _handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._tasks.add(task)
+
+        conn = _Connection(reader, writer)
+
+        self.counters['curr_connections'] += 1
+        self.counters['total_connections'] += 1
+
+        try:
+            while True:
+                line = await reader.readline()
+
+                if not line:
+                    break
+
+                if not line.endswith(b'\r\n'):
+                    writer.write(b'CLIENT_ERROR line not terminated\r\n')
+                    break
+
+                args = line[:-2].split()
+
+                if not args:
+                    self._send(conn, b'ERROR\r\n')
+                    continue
+
+                name = args[0]
+
+                if name == b'quit':
+                    break
+
+                command = getattr(self, '_cmd_' + name.decode('ascii', 'replace'), None)
+
+                if command is None:
+                    self._send(conn, b'ERROR\r\n')
+                    continue
+
+                if self.failure_rate and self._random.random() < self.failure_rate:
+                    self.counters['injected_failures'] += 1
+
+                    if self.failure_mode == 'disconnect':
+                        break
+
+                    if self.failure_mode == 'hang':
+                        #never answer, until the client gives up
+                        while await reader.read(65536):
+                            pass
+
+                        break
+
+                    await self._skip_data(reader, name, args[1:])
+                    self._send(conn, b'SERVER_ERROR injected failure\r\n')
+                    continue
+
+                if not _valid_keys(name, args[1:]):
+                    await self._skip_data(reader, name, args[1:])
+                    self._send(conn, b'CLIENT_ERROR bad command line format\r\n')
+                    continue
+
+                try:
+                    response = await command(reader, args[1:])
+                except _ProtocolError as e:
+                    response = b'CLIENT_ERROR ' + str(e).encode('ascii') + b'\r\n'
+                except (ValueError, IndexError):
+                    response = b'CLIENT_ERROR bad command line format\r\n'
+
+                if response:
+                    self._send(conn, response)
+
+                if conn.sender is None:
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self.counters['curr_connections'] -= 1
+            self._tasks.discard(task)
+
+            if conn.sender is not None:
+                conn.sender.cancel()
+
+            writer.close()
+
+    def _send(self, conn, response):
+
+        if not self.latency and conn.sender is None:
+            conn.writer.write(response)
+            return
+
+        conn.queue.append((time.monotonic() + self.latency, response))
+
+        if conn.sender is None:
+            conn.sender = asyncio.ensure_future(self._run_sender(conn))
+
+    async def _run_sender(self, conn):
+        """Writes out the delayed responses of a connection in order, each once
+        its delay is over."""
+
+        try:
+            while conn.queue:
+                due, response = conn.queue[0]
+                delay = due - time.monotonic()
+
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                conn.queue.popleft()
+                conn.writer.write(response)
+
+                await conn.writer.drain()
+        except ConnectionError:
+            conn.queue.clear()
+        finally:
+            conn.sender = None
+
+    async def _skip_data(self, reader, name, args):
+        """Reads the data block of a failed storage command."""
+
+        if name in STORAGE_COMMANDS:
+            try:
+                length = int(args[STORAGE_COMMANDS[name]])
+            except (ValueError, IndexError):
+                return
+
+            await self._read_data(reader, length)
+
+    async def _read_data(self, reader, length):
+        data = await reader.readexactly(length + 2)
+
+        if not data.endswith(b'\r\n'):
+            raise _ProtocolError('bad data chunk')
+
+        return data[:-2]
+
+    def _get(self, key):
+        item = self.store.get(key)
+
+        self.counters['cmd_get'] += 1
+        self.counters['get_hits' if item is not None else 'get_misses'] += 1
+
+        return item
+
+    def _set(self, key, flags, exptime, data):
+        """Stores an item, returning False if it's too large."""
+
+        if _item_size(key, data) > self.max_item_size:
+            return False
+
+        self.store.set(key, _Item(flags, exptime, data))
+
+        return True
+
+    #Text protocol
+
+    async def _cmd_get(self, reader, keys, cas=False):
+        response = []
+
+        for key in keys:
+            item = self._get(key)
+
+            if item is None:
+                continue
+
+            if cas:
+                response.append(b'VALUE %s %d %d %d\r\n' % (key, item.flags, len(item.data),
+                                                             item.cas))
+            else:
+                response.append(b'VALUE %s %d %d\r\n' % (key, item.flags, len(item.data)))
+
+            response.append(item.data + b'\r\n')
+
+        response.append(b'END\r\n')
+
+        return b''.join(response)
+
+    async def _cmd_gets(self, reader, keys):
+        return await self._cmd_get(reader, keys, cas=True)
+
+    async def _store(self, reader, args, check, combine=None):
+        """Reads the data of a storage command, and stores it if `check(item,
+        args)` on the existing item returns True. `check` can also return the
+        response itself. `combine(item, data)`, if given, builds the data
+        stored out of the existing item's."""
+
+        noreply = args[-1] == b'noreply'
+
+        if noreply:
+            args = args[:-1]
+
+        key, flags, exptime, length = args[0], int(args[1]), int(args[2]), int(args[3])
+        data = await self._read_data(reader, length)
+
+        self.counters['cmd_set'] += 1
+
+        item = self.store.get(key)
+        stored = check(item, args)
+
+        if stored is True:
+            if combine is not None:
+                flags, exptime, data = item.flags, item.exptime, combine(item, data)
+            else:
+                exptime = _absolute_exptime(exptime)
+
+            if self._set(key, flags, exptime, data):
+                response = b'STORED\r\n'
+            else:
+                response = b'SERVER_ERROR object too large for cache\r\n'
+        elif stored is False:
+            response = b'NOT_STORED\r\n'
+        else:
+            response = stored
+
+        return None if noreply else response
+
+    def _cas(self, item, args):
+
+        if item is None:
+            return b'NOT_FOUND\r\n'
+        elif item.cas != int(args[4]):
+            return b'EXISTS\r\n'
+
+        return True
+
+    async def _cmd_set(self, reader, args):
+        return await self._store(reader, args, lambda item, args: True)
+
+    async def _cmd_add(self, reader, args):
+        return await self._store(reader, args, lambda item, args: item is None)
+
+    async def _cmd_replace(self, reader, args):
+        return await self._store(reader, args, lambda item, args: item is not None)
+
+    async def _cmd_append(self, reader, args):
+        return await self._store(reader, args, lambda item, args: item is not None,
+                                 lambda item, data: item.data + data)
+
+    async def _cmd_prepend(self, reader, args):
+        return await self._store(reader, args, lambda item, args: item is not None,
+                                 lambda item, data: data + item.data)
+
+    async def _cmd_cas(self, reader, args):
+        return await self._store(reader, args, self._cas)
+
+    async def _cmd_delete(self, reader, args):
+        noreply = args[-1] == b'noreply'
+        response = b'DELETED\r\n' if self.store.delete(args[0]) else b'NOT_FOUND\r\n'
+
+        return None if noreply else response
+
+    def _arithmetic(self, key, delta):
+        """Adds `delta` to the item. Returns its new value, None if it doesn't
+        exist, or False if it isn't a number."""
+
+        item = self.store.get(key)
+
+        if item is None:
+            return None
+        elif not item.data.isdigit():
+            return False
+
+        #incr wraps around at 64 bits, decr stops at 0
+        value = str(max(int(item.data) + delta, 0) % 2 ** 64).encode('ascii')
+
+        self._set(key, item.flags, item.exptime, value)
+
+        return value
+
+    async def _incr_decr(self, args, sign):
+        noreply = args[-1] == b'noreply'
+        value = self._arithmetic(args[0], sign * int(args[1]))
+
+        if value is None:
+            response = b'NOT_FOUND\r\n'
+        elif value is False:
+            response = b'CLIENT_ERROR cannot increment or decrement non-numeric value\r\n'
+        else:
+            response = value + b'\r\n'
+
+        return None if noreply else response
+
+    async def _cmd_incr(self, reader, args):
+        return await self._incr_decr(args, 1)
+
+    async def _cmd_decr(self, reader, args):
+        return await self._incr_decr(args, -1)
+
+    async def _cmd_touch(self, reader, args):
+        noreply = args[-1] == b'noreply'
+        item = self.store.get(args[0])
+
+        if item is not None:
+            item.exptime = _absolute_exptime(int(args[1]))
+
+        response = b'TOUCHED\r\n' if item is not None else b'NOT_FOUND\r\n'
+
+        return None if noreply else response
+
+    async def _cmd_flush_all(self, reader, args):
+        self.store.flush()
+
+        return None if args and args[-1] == b'noreply' else b'OK\r\n'
+
+    async def _cmd_stats(self, reader, args):
+        lines = [b'STAT %s %s\r\n' % (name.encode('ascii'), str(value).encode('ascii'))
+                 for name, value in sorted(self.stats().items())]
+
+        return b''.join(lines) + b'END\r\n'
+
+    async def _cmd_version(self, reader, args):
+        return b'VERSION pycacher-fakememcache\r\n'
+
+    #Meta protocol
+
+    def _meta_response(self, code, key, item, flags):
+        """Builds a meta response, with the value and the flags the client
+        asked to be returned."""
+
+        returned = []
+
+        for flag, token in flags:
+            if flag == b'O':
+                returned.append(b'O' + token)
+            elif flag == b'k':
+                returned.append(b'k' + key)
+            elif item is None:
+                continue
+            elif flag == b'c':
+                returned.append(b'c%d' % item.cas)
+            elif flag == b'f':
+                returned.append(b'f%d' % item.flags)
+            elif flag == b's':
+                returned.append(b's%d' % len(item.data))
+            elif flag == b't':
+                returned.append(b't%d' % _remaining_ttl(item))
+
+        if item is not None and any(flag == b'v' for flag, token in flags):
+            line = b' '.join([b'VA', str(len(item.data)).encode('ascii')] + returned)
+            return line + b'\r\n' + item.data + b'\r\n'
+
+        return b' '.join([code] + returned) + b'\r\n'
+
+    async def _cmd_mg(self, reader, args):
+        key, flags = args[0], _meta_flags(args[1:])
+        options = dict(flags)
+
+        item = self._get(key)
+
+        if item is None:
+            return None if b'q' in options else b'EN\r\n'
+
+        if b'T' in options:
+            item.exptime = _absolute_exptime(int(options[b'T']))
+
+        return self._meta_response(b'HD', key, item, flags)
+
+    async def _cmd_ms(self, reader, args):
+        key, length, flags = args[0], int(args[1]), _meta_flags(args[2:])
+        options = dict(flags)
+
+        data = await self._read_data(reader, length)
+
+        self.counters['cmd_set'] += 1
+
+        item = self.store.get(key)
+        mode = options.get(b'M', b'S').upper()
+
+        if b'C' in options and (item is None or item.cas != int(options[b'C'])):
+            code = b'NF' if item is None else b'EX'
+        elif mode == b'E' and item is not None:
+            code = b'NS'
+        elif mode in (b'R', b'A', b'P') and item is None:
+            code = b'NS'
+        else:
+            item_flags = int(options.get(b'F', 0))
+            exptime = _absolute_exptime(int(options.get(b'T', 0)))
+
+            if mode == b'A':
+                item_flags, exptime, data = item.flags, item.exptime, item.data + data
+            elif mode == b'P':
+                item_flags, exptime, data = item.flags, item.exptime, data + item.data
+
+            if not self._set(key, item_flags, exptime, data):
+                return b'SERVER_ERROR object too large for cache\r\n'
+
+            code = b'HD'
+
+        if code == b'HD' and b'q' in options:
+            return None
+
+        #ms never returns the value
+        return self._meta_response(code, key, self.store.get(key) if code == b'HD' else None,
+                                   [(flag, token) for flag, token in flags if flag != b'v'])
+
+    async def _cmd_md(self, reader, args):
+        key, flags = args[0], _meta_flags(args[1:])
+        options = dict(flags)
+
+        item = self.store.get(key)
+
+        if item is None:
+            code = b'NF'
+        elif b'C' in options and item.cas != int(options[b'C']):
+            code = b'EX'
+        else:
+            self.store.delete(key)
+            code = b'HD'
+
+        if code == b'HD' and b'q' in options:
+            return None
+
+        return self._meta_response(code, key, None, flags)
+
+    async def _cmd_ma(self, reader, args):
+        key, flags = args[0], _meta_flags(args[1:])
+        options = dict(flags)
+
+        item = self.store.get(key)
+
+        if item is None and b'N' in options:
+            #autovivified with the initial value
+            self._set(key, 0, _absolute_exptime(int(options[b'N'])), options.get(b'J', b'0'))
+        elif item is not None and b'C' in options and item.cas != int(options[b'C']):
+            return self._meta_response(b'EX', key, None, flags)
+        else:
+            delta = int(options.get(b'D', 1))
+
+            if options.get(b'M', b'I').upper() in (b'D', b'-'):
+                delta = -delta
+
+            value = self._arithmetic(key, delta)
+
+            if value is None:
+                return self._meta_response(b'NF', key, None, flags)
+            elif value is False:
+                return b'CLIENT_ERROR cannot increment or decrement non-numeric value\r\n'
+
+        item = self.store.get(key)
+
+        if b'T' in options:
+            item.exptime = _absolute_exptime(int(options[b'T']))
+
+        if b'q' in options:
+            return None
+
+        return self._meta_response(b'HD', key, item, flags)
+
+    async def _cmd_mn(self, reader, args):
+        return b'MN\r\n'
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs a fake memcache server.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11211)
+    parser.add_argument('--max-bytes', type=int, default=64 * 1024 * 1024)
+    parser.add_argument('--latency', type=float, default=0,
+                        help="seconds every response is delayed by")
+    parser.add_argument('--failure-rate', type=float, default=0,
+                        help="fraction of the commands that fail")
+    parser.add_argument('--failure-mode', choices=FAILURE_MODES, default='error')
+
+    options = parser.parse_args()
+    server = FakeMemcacheServer(options.host, options.port, max_bytes=options.max_bytes,
+                                latency=options.latency, failure_rate=options.failure_rate,
+                                failure_mode=options.failure_mode)
+
+    async def run():
+        await server.serve()
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""
+
+    This module contains the hook registries of cachers and batchers, and the
+    sampling profiler timing the phases of cached function calls.
+
+    A registry keeps, for every event, a dispatcher compiled whenever the
+    hooks of the event change: `None` when there are none, the hook itself
+    when there's only one, and a loop over them otherwise. The decorators
+    only call it when it isn't `None`, so a call with no hooks registered
+    pays for one attribute lookup.
+
+    Example usage::
+
+        from pycacher import Cacher
+        from pycacher.hooks import SamplingProfiler
+
+        profiler = SamplingProfiler(sample_rate=0.01)
+        cacher = Cacher(profiler=profiler)
+
+        profiler.snapshot()
+        >> {'app.models.get_user': {'lookup': {'count': 12, 'total': 0.0061,
+                                               'mean': 0.0005, 'max': 0.0009},
+                                    ...}}
+
+"""
+
+import contextvars
+import random
+import threading
+import time
+
+from .exceptions import InvalidHookEventException
+
+EVENTS = ('invalidate', 'call', 'register')
+
+PHASES = ('key_build', 'lookup', 'deserialize', 'compute', 'store')
+
+class Hooks(object):
+    """The hooks of a cacher or a batcher. `on_invalidate`, `on_call` and
+    `on_register` are the compiled dispatchers of the events."""
+
+    def __init__(self):
+        self._hooks = dict((event, ()) for event in EVENTS)
+
+        self.on_invalidate = None
+        self.on_call = None
+        self.on_register = None
+
+    def _check(self, event):
+        if event not in EVENTS:
+            raise InvalidHookEventException(\
+                    "Hook event must be 'invalidate', 'call', or 'register'")
+
+    def _compile(self, event):
+        hooks = self._hooks[event]
+
+        if not hooks:
+            dispatch = None
+        elif len(hooks) == 1:
+            dispatch = hooks[0]
+        else:
+            def dispatch(*args, **kwargs):
+                for fn in hooks:
+                    fn(*args, **kwargs)
+
+        setattr(self, 'on_' + event, dispatch)
+
+    def add(self, event, fn):
+        self._check(event)
+
+        #Tuples, so a dispatcher never sees its hooks change under it.
+        self._hooks[event] = self._hooks[event] + (fn,)
+        self._compile(event)
+
+    def remove(self, event, fn):
+        self._check(event)
+
+        self._hooks[event] = tuple(hook for hook in self._hooks[event] if hook is not fn)
+        self._compile(event)
+
+    def remove_all(self, event):
+        self._check(event)
+
+        self._hooks[event] = ()
+        self._compile(event)
+
+    def get(self, event):
+        self._check(event)
+
+        return self._hooks[event]
+
+    def trigger(self, event, *args, **kwargs):
+        self._check(event)
+
+        dispatch = getattr(self, 'on_' + event)
+
+        if dispatch is not None:
+            dispatch(*args, **kwargs)
+
+#The timer of the sampled call being run, if any.
+_current_timer = contextvars.ContextVar('pycacher_phase_timer', default=None)
+
+class PhaseTimer(object):
+    """Times the phases of one sampled call of the function called `name`.
+    Every `mark` adds the time since the previous one to a phase."""
+
+    def __init__(self, profiler, name, cache_key=None):
+        self.profiler = profiler
+        self.name = name
+        self.cache_key = cache_key
+        self.timings = {}
+
+        self._last = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+
+        self.timings[phase] = self.timings.get(phase, 0) + now - self._last
+        self._last = now
+
+    def __enter__(self):
+        self._token = _current_timer.set(self)
+        return self
+
+    def __exit__(self, type, value, traceback):
+        _current_timer.reset(self._token)
+
+        if type is None:
+            self.profiler.record(self.name, self.timings)
+
+def current_timer(cache_key):
+    """Returns the timer of the sampled call computing `cache_key`, if any.
+    Cached functions called by a sampled one aren't timed with its timer."""
+
+    timer = _current_timer.get()
+
+    if timer is not None and timer.cache_key == cache_key:
+        return timer
+
+    return None
+
+class SamplingProfiler(object):
+    """Records the time spent in every phase (`PHASES`) of a sample of the
+    calls of the cached functions, `sample_rate` being the fraction of calls
+    sampled.
+
+    The timings of every sampled call are passed to `callback(name,
+    timings)` if it's given, and added to the totals returned by
+    `snapshot`.
+    """
+
+    def __init__(self, sample_rate=0.01, callback=None):
+        self.sample_rate = sample_rate
+        self.callback = callback
+
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def sample(self):
+        return random.random() < self.sample_rate
+
+    def start(self, name):
+        """Returns the timer of a sampled call of the function called
+        `name`."""
+        return PhaseTimer(self, name)
+
+    def record(self, name, timings):
+
+        if self.callback is not None:
+            self.callback(name, timings)
+
+        with self._lock:
+            totals = self._totals.setdefault(name, {})
+
+            for phase, seconds in timings.items():
+                count, total, maximum = totals.get(phase, (0, 0, 0))
+                totals[phase] = (count + 1, total + seconds, max(maximum, seconds))
+
+    def snapshot(self):
+        """Returns the `count`, `total`, `mean` and `max` seconds of every
+        phase of every function."""
+
+        with self._lock:
+            return dict((name, dict((phase, {'count': count, 'total': total,
+                                             'mean': total / count, 'max': maximum})
+                                    for phase, (count, total, maximum) in phases.items()))
+                        for name, phases in self._totals.items())
+
+    def reset(self):
+        with self._lock:
+            self._totals = {}
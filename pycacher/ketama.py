@@ -0,0 +1,91 @@
+"""
+
+    Ketama consistent hashing, as used by most memcached clients to spread
+    keys over a set of servers.
+
+"""
+
+import bisect
+import hashlib
+
+def _md5(value):
+    if not isinstance(value, bytes):
+        value = value.encode('utf-8')
+
+    return hashlib.md5(value).digest()
+
+def _point(digest, offset=0):
+    """Reads a 32 bit little-endian ring position out of an md5 digest."""
+    return (digest[3 + offset * 4] << 24 | digest[2 + offset * 4] << 16 |
+            digest[1 + offset * 4] << 8 | digest[offset * 4])
+
+class HashRing(object):
+    """A ketama continuum mapping keys to nodes.
+
+    Example usage::
+
+        ring = HashRing(['10.0.0.1:11211', '10.0.0.2:11211'])
+
+        ring.get_node('some-key')
+        >> '10.0.0.2:11211'
+
+    Every node gets `points_per_node` points on the ring (multiplied by its
+    weight), and a key belongs to the first node point following the key's
+    hash. Adding or removing a node therefore only moves the keys that fall
+    between that node's points and their predecessors, i.e. about 1/N of the
+    keyspace.
+    """
+
+    def __init__(self, nodes=(), weights=None, points_per_node=160):
+        self.points_per_node = points_per_node
+
+        self._weights = {}
+        self._continuum = ([], {})
+
+        for node in nodes:
+            self._weights[node] = (weights or {}).get(node, 1)
+
+        self._build()
+
+    def _build(self):
+        ring = {}
+
+        for node, weight in self._weights.items():
+            #Each md5 digest yields 4 points.
+            for i in range(self.points_per_node * weight // 4):
+                digest = _md5('%s-%s' % (node, i))
+
+                for offset in range(4):
+                    ring[_point(digest, offset)] = node
+
+        #Swapped in one go, so that concurrent lookups never see a mix of the
+        #old and the new ring.
+        self._continuum = (sorted(ring), ring)
+
+    def add_node(self, node, weight=1):
+        self._weights[node] = weight
+        self._build()
+
+    def remove_node(self, node):
+        self._weights.pop(node, None)
+        self._build()
+
+    def get_nodes(self):
+        return list(self._weights)
+
+    def get_node(self, key):
+
+        points, ring = self._continuum
+
+        if not points:
+            return None
+
+        index = bisect.bisect(points, _point(_md5(key)))
+
+        if index == len(points):
+            index = 0
+
+        return ring[points[index]]
+
+    def __contains__(self, node):
+        return node in self._weights
@@ -0,0 +1,361 @@
+"""
+
+    This module contains the counters and histograms kept for every cached
+    function and every backend, when a `Cacher` is given a `Metrics`
+    registry.
+
+    Example usage::
+
+        from pycacher import Cacher
+        from pycacher.metrics import Metrics
+
+        metrics = Metrics()
+        cacher = Cacher(metrics=metrics)
+
+        metrics.snapshot()
+        >> {'functions': {'app.models.get_user': {'hits': 1021, 'misses': 130,
+                                                  'hit_ratio': 0.887, ...}},
+            'backends': {'MemcacheBackend': {...}}}
+
+        print(metrics.to_prometheus())
+
+    Every thread updates its own preallocated list of slots, so recording
+    takes no lock. Snapshots add up the lists of all the threads, and the
+    list of a thread is folded into a shared one when the thread exits.
+
+"""
+
+import bisect
+import threading
+import time
+import weakref
+
+from .backends import Backend
+
+#in seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+#in number of keys
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+BACKEND_OPERATIONS = ('get', 'set', 'add', 'incr', 'delete', 'multi_get', 'multi_set',
+                      'multi_delete')
+
+class _ShardOwner(object):
+    """Lives in a thread's locals, so it's collected when the thread exits."""
+
+class _Shards(object):
+    """Per-thread lists of `size` numeric slots. The slots of the threads
+    that exited are added up in `_retired`."""
+
+    def __init__(self, size):
+        self.size = size
+
+        self._local = threading.local()
+        self._shards = {}
+        self._retired = [0] * size
+        self._lock = threading.Lock()
+
+    def get(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = [0] * self.size
+
+            owner = self._local.owner = _ShardOwner()
+            weakref.finalize(owner, self._retire, shard)
+
+            #only once per thread
+            with self._lock:
+                self._shards[id(shard)] = shard
+
+            return shard
+
+    def _retire(self, shard):
+
+        with self._lock:
+            del self._shards[id(shard)]
+
+            for i, value in enumerate(shard):
+                self._retired[i] += value
+
+    def totals(self):
+
+        with self._lock:
+            totals = list(self._retired)
+            shards = list(self._shards.values())
+
+        for shard in shards:
+            for i, value in enumerate(shard):
+                totals[i] += value
+
+        return totals
+
+class Stats(object):
+    """A fixed set of counters and histograms. Subclasses list them in
+    `COUNTERS` and `HISTOGRAMS` (as `(name, buckets)` pairs)."""
+
+    COUNTERS = ()
+    HISTOGRAMS = ()
+
+    def __init__(self, name):
+        self.name = name
+
+        self._offsets = {}
+        self._buckets = {}
+
+        size = 0
+
+        for counter in self.COUNTERS:
+            self._offsets[counter] = size
+            size += 1
+
+        #every histogram has a slot per bucket, one for +Inf, its sum and
+        #its count
+        for histogram, buckets in self.HISTOGRAMS:
+            self._offsets[histogram] = size
+            self._buckets[histogram] = buckets
+            size += len(buckets) + 3
+
+        self._shards = _Shards(size)
+
+    def incr(self, counter, value=1):
+        self._shards.get()[self._offsets[counter]] += value
+
+    def observe(self, histogram, value):
+        shard = self._shards.get()
+        offset = self._offsets[histogram]
+        buckets = self._buckets[histogram]
+
+        shard[offset + bisect.bisect_left(buckets, value)] += 1
+        shard[offset + len(buckets) + 1] += value
+        shard[offset + len(buckets) + 2] += 1
+
+    def snapshot(self):
+        """Returns the current values, with histograms as dicts of their
+        cumulative `buckets` (`(upper bound, count)` pairs), `sum` and
+        `count`."""
+
+        totals = self._shards.totals()
+        snapshot = {}
+
+        for counter in self.COUNTERS:
+            snapshot[counter] = totals[self._offsets[counter]]
+
+        for histogram, buckets in self.HISTOGRAMS:
+            offset = self._offsets[histogram]
+
+            cumulative = 0
+            histogram_buckets = []
+
+            for i, bound in enumerate(buckets + (float('inf'),)):
+                cumulative += totals[offset + i]
+                histogram_buckets.append((bound, cumulative))
+
+            snapshot[histogram] = {
+                'buckets': histogram_buckets,
+                'sum': totals[offset + len(buckets) + 1],
+                'count': totals[offset + len(buckets) + 2],
+            }
+
+        return snapshot
+
+class FunctionStats(Stats):
+    """Stats of a cached function. `compute_seconds` is the time spent in the
+    actual function on misses."""
+
+    COUNTERS = ('hits', 'misses', 'bytes_read', 'bytes_written')
+    HISTOGRAMS = (('compute_seconds', LATENCY_BUCKETS),)
+
+    def snapshot(self):
+        snapshot = super(FunctionStats, self).snapshot()
+
+        calls = snapshot['hits'] + snapshot['misses']
+        compute = snapshot['compute_seconds']
+
+        snapshot['hit_ratio'] = float(snapshot['hits']) / calls if calls else None
+
+        #what the hits would have cost without the cache
+        snapshot['saved_seconds'] = (snapshot['hits'] * compute['sum'] / compute['count']
+                                     if compute['count'] else 0)
+
+        return snapshot
+
+class BackendStats(Stats):
+    """Stats of a backend: the latency of every operation, the bytes read and
+    written, and the number of keys of the multi-key operations."""
+
+    COUNTERS = ('bytes_read', 'bytes_written')
+    HISTOGRAMS = tuple((operation + '_seconds', LATENCY_BUCKETS) for operation in BACKEND_OPERATIONS) + \
+                 (('batch_size', BATCH_SIZE_BUCKETS),)
+
+class Metrics(object):
+    """The registry of the stats of the cached functions and backends of one
+    or more cachers."""
+
+    def __init__(self):
+        self._functions = {}
+        self._backends = {}
+        self._lock = threading.Lock()
+
+    def _get(self, registry, stats_class, name):
+        try:
+            return registry[name]
+        except KeyError:
+            with self._lock:
+                if name not in registry:
+                    registry[name] = stats_class(name)
+
+                return registry[name]
+
+    def function(self, name):
+        """Returns the stats of the cached function called `name`."""
+        return self._get(self._functions, FunctionStats, name)
+
+    def backend(self, name):
+        """Returns the stats of the backend called `name`."""
+        return self._get(self._backends, BackendStats, name)
+
+    def snapshot(self):
+        return {
+            'functions': dict((name, stats.snapshot()) for name, stats in list(self._functions.items())),
+            'backends': dict((name, stats.snapshot()) for name, stats in list(self._backends.items())),
+        }
+
+    def to_prometheus(self, prefix='pycacher'):
+        """Returns the metrics in the Prometheus text exposition format."""
+
+        snapshot = self.snapshot()
+        lines = []
+
+        def counter(name, label, values, field):
+            lines.append('# TYPE %s_%s counter' % (prefix, name))
+
+            for label_value, stats in sorted(values.items()):
+                lines.append('%s_%s{%s="%s"} %s' % (prefix, name, label, _escape(label_value),
+                                                   _format(stats[field])))
+
+        def histogram(name, labels, histogram):
+            for bound, count in histogram['buckets']:
+                lines.append('%s_%s_bucket{%sle="%s"} %s' % (prefix, name, labels,
+                                                             _format(bound), count))
+
+            lines.append('%s_%s_sum{%s} %s' % (prefix, name, labels.rstrip(','),
+                                               _format(histogram['sum'])))
+            lines.append('%s_%s_count{%s} %s' % (prefix, name, labels.rstrip(','),
+                                                 histogram['count']))
+
+        functions = snapshot['functions']
+
+        for field in FunctionStats.COUNTERS:
+            counter('function_%s_total' % field, 'function', functions, field)
+
+        lines.append('# TYPE %s_function_compute_seconds histogram' % prefix)
+
+        for name, stats in sorted(functions.items()):
+            histogram('function_compute_seconds', 'function="%s",' % _escape(name),
+                      stats['compute_seconds'])
+
+        backends = snapshot['backends']
+
+        for field in BackendStats.COUNTERS:
+            counter('backend_%s_total' % field, 'backend', backends, field)
+
+        lines.append('# TYPE %s_backend_operation_seconds histogram' % prefix)
+
+        for name, stats in sorted(backends.items()):
+            for operation in BACKEND_OPERATIONS:
+                histogram('backend_operation_seconds',
+                          'backend="%s",operation="%s",' % (_escape(name), operation),
+                          stats[operation + '_seconds'])
+
+        lines.append('# TYPE %s_backend_batch_size histogram' % prefix)
+
+        for name, stats in sorted(backends.items()):
+            histogram('backend_batch_size', 'backend="%s",' % _escape(name), stats['batch_size'])
+
+        return '\n'.join(lines) + '\n'
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format(value):
+    if value == float('inf'):
+        return '+Inf'
+
+    return repr(value)
+
+def _payload_size(value):
+    return len(value) if isinstance(value, (bytes, memoryview)) else 0
+
+class MeteredBackend(Backend):
+    """Wraps a backend to record the latency of its operations, the bytes it
+    reads and writes, and the sizes of its batches, in `stats` (a
+    `BackendStats`).
+
+    A `Cacher` given a `Metrics` registry wraps its backend automatically.
+    Attributes that aren't backend operations (e.g. `get_stats`) are looked
+    up on the wrapped backend.
+    """
+
+    def __init__(self, backend, stats):
+        self.backend = backend
+        self.stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def _timed(self, operation, fn, *args, **kwargs):
+        start = time.perf_counter()
+
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.stats.observe(operation + '_seconds', time.perf_counter() - start)
+
+    def get(self, key):
+        value = self._timed('get', self.backend.get, key)
+        self.stats.incr('bytes_read', _payload_size(value))
+
+        return value
+
+    def set(self, key, value, expires=None):
+        self.stats.incr('bytes_written', _payload_size(value))
+        return self._timed('set', self.backend.set, key, value, expires=expires)
+
+    def add(self, key, value, expires=None):
+        self.stats.incr('bytes_written', _payload_size(value))
+        return self._timed('add', self.backend.add, key, value, expires=expires)
+
+    def incr(self, key, delta=1):
+        return self._timed('incr', self.backend.incr, key, delta)
+
+    def delete(self, key):
+        return self._timed('delete', self.backend.delete, key)
+
+    def exists(self, key):
+        return self.get(key) is not None
+
+    def multi_get(self, keys):
+        keys = list(keys)
+
+        self.stats.observe('batch_size', len(keys))
+        values = self._timed('multi_get', self.backend.multi_get, keys)
+
+        self.stats.incr('bytes_read', sum([_payload_size(value) for value in values.values()]))
+
+        return values
+
+    def multi_set(self, mapping, expires=None):
+        self.stats.observe('batch_size', len(mapping))
+        self.stats.incr('bytes_written', sum([_payload_size(value) for value in mapping.values()]))
+
+        return self._timed('multi_set', self.backend.multi_set, mapping, expires=expires)
+
+    def multi_delete(self, keys):
+        keys = list(keys)
+
+        self.stats.observe('batch_size', len(keys))
+
+        return self._timed('multi_delete', self.backend.multi_delete, keys)
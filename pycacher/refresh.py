@@ -0,0 +1,69 @@
+"""
+
+    This module contains the envelope stored by cached functions that refresh
+    their values ahead of expiry, either after a soft expiry
+    (stale-while-revalidate) or probabilistically (XFetch).
+
+"""
+
+import math
+import random
+import time
+
+#First item of a dumped CachedValue.
+MARKER = '__pycacher_cached_value__'
+
+class CachedValue(object):
+    """A cached return value along with the metadata needed to decide when to
+    refresh it.
+
+    `soft_expires_at` is the timestamp after which the value is stale, and
+    `expires_at` the timestamp at which the backend drops it. `delta` is the
+    number of seconds it took to compute the value.
+
+    It's stored as a plain list (see `dump`), which every serializer
+    supports.
+    """
+
+    def __init__(self, value, soft_expires_at=None, expires_at=None, delta=0):
+        self.value = value
+        self.soft_expires_at = soft_expires_at
+        self.expires_at = expires_at
+        self.delta = delta
+
+    def dump(self):
+        return [MARKER, self.soft_expires_at, self.expires_at, self.delta, self.value]
+
+    @classmethod
+    def load(cls, data):
+        """Returns the CachedValue dumped as `data`, or None if `data` isn't
+        one. Instances pickled by older versions are returned as is."""
+
+        if isinstance(data, cls):
+            return data
+
+        if isinstance(data, (list, tuple)) and len(data) == 5 and data[0] == MARKER:
+            return cls(data[4], soft_expires_at=data[1], expires_at=data[2], delta=data[3])
+
+        return None
+
+    def is_stale(self, now=None):
+        if self.soft_expires_at is None:
+            return False
+
+        return (now or time.time()) >= self.soft_expires_at
+
+    def should_refresh_early(self, beta=1.0, now=None):
+        """XFetch: returns True with a probability that grows as the expiry
+        gets closer, and grows faster for values that take longer to compute.
+
+        See "Optimal Probabilistic Cache Stampede Prevention", Vattani et al.
+        """
+
+        if self.expires_at is None:
+            return False
+
+        #1 - random() is in (0, 1], which keeps log() defined.
+        gap = -self.delta * beta * math.log(1.0 - random.random())
+
+        return (now or time.time()) + gap >= self.expires_at
@@ -0,0 +1,180 @@
+"""
+
+    This module contains the serializers turning cached values into the bytes
+    stored by the backends, and back.
+
+    Every payload starts with a one byte header identifying its serializer
+    (bits 0-2) and its compressor, if any (bits 3-4), so values are always
+    read back the way they were written. Header bytes are below 0x20, which
+    no pickle starts with, so values pickled without a header by older
+    versions are still readable.
+
+"""
+
+import json
+import marshal
+import pickle
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from .compression import get_decompressor
+from .exceptions import UnknownSerializerException
+
+class Serializer(object):
+    """Base class of the serializers. Subclasses define a unique `format_id`
+    (between 1 and 7) and a `name`, and implement `dumps` and `loads`."""
+
+    format_id = None
+    name = None
+
+    def dumps(self, value):
+        raise NotImplementedError("Serializer subclasses should always implement `dumps` method")
+
+    def loads(self, data):
+        raise NotImplementedError("Serializer subclasses should always implement `loads` method")
+
+class PickleSerializer(Serializer):
+    """Serializes any picklable value, using the highest pickle protocol by
+    default (the fastest and most compact one)."""
+
+    format_id = 1
+    name = 'pickle'
+
+    def __init__(self, protocol=pickle.HIGHEST_PROTOCOL):
+        self.protocol = protocol
+
+    def dumps(self, value):
+        return pickle.dumps(value, self.protocol)
+
+    def loads(self, data):
+        return pickle.loads(data)
+
+class MarshalSerializer(Serializer):
+    """Serializes builtin types only (numbers, strings, lists, dicts, ...).
+    Faster than pickle, but the format is specific to the Python version."""
+
+    format_id = 2
+    name = 'marshal'
+
+    def dumps(self, value):
+        return marshal.dumps(value)
+
+    def loads(self, data):
+        return marshal.loads(data)
+
+class JSONSerializer(Serializer):
+    """Serializes JSON-compatible values, readable from other languages.
+    Tuples come back as lists."""
+
+    format_id = 3
+    name = 'json'
+
+    def dumps(self, value):
+        return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+    def loads(self, data):
+        return json.loads(bytes(data).decode('utf-8'))
+
+class MsgpackSerializer(Serializer):
+    """Serializes msgpack-compatible values, compact and readable from other
+    languages. Needs the `msgpack` package."""
+
+    format_id = 4
+    name = 'msgpack'
+
+    def __init__(self):
+        if msgpack is None:
+            raise UnknownSerializerException("The msgpack serializer needs the `msgpack` package")
+
+    def dumps(self, value):
+        return msgpack.packb(value, use_bin_type=True)
+
+    def loads(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+SERIALIZERS = {}
+
+_decoders = {}
+
+def register_serializer(serializer_class):
+    """Makes a serializer usable by name, and its payloads readable.
+
+    Example usage::
+
+        class YAMLSerializer(Serializer):
+            format_id = 5
+            name = 'yaml'
+            ...
+
+        register_serializer(YAMLSerializer)
+
+    """
+
+    if not 0 < serializer_class.format_id < 8:
+        raise UnknownSerializerException("Serializer format ids must be between 1 and 7")
+
+    SERIALIZERS[serializer_class.name] = serializer_class
+
+    return serializer_class
+
+for serializer_class in (PickleSerializer, MarshalSerializer, JSONSerializer, MsgpackSerializer):
+    register_serializer(serializer_class)
+
+def get_serializer(serializer):
+    """Returns a serializer instance out of a serializer name or instance."""
+
+    if isinstance(serializer, Serializer):
+        return serializer
+
+    if serializer not in SERIALIZERS:
+        raise UnknownSerializerException("Unknown serializer: %r" % (serializer,))
+
+    return SERIALIZERS[serializer]()
+
+def _get_decoder(format_id):
+
+    decoder = _decoders.get(format_id)
+
+    if decoder is None:
+        for serializer_class in SERIALIZERS.values():
+            if serializer_class.format_id == format_id:
+                decoder = _decoders[format_id] = serializer_class()
+                break
+        else:
+            raise UnknownSerializerException("Unknown serializer format id: %s" % format_id)
+
+    return decoder
+
+def dumps(value, serializer, compressor=None):
+    """Serializes a value into a payload with a header, compressing it if
+    a compressor is given and the payload is big enough."""
+
+    header = serializer.format_id
+    data = serializer.dumps(value)
+
+    if compressor is not None and len(data) >= compressor.threshold:
+        compressed = compressor.compress(data)
+
+        if len(compressed) < len(data):
+            header |= compressor.compressor_id << 3
+            data = compressed
+
+    return bytes((header,)) + data
+
+def loads(data):
+    """Deserializes a payload written by `dumps` (or a headerless pickle)."""
+
+    header = data[0]
+
+    if header >= 0x20:
+        return pickle.loads(data)
+
+    body = memoryview(data)[1:]
+
+    if header >> 3:
+        body = get_decompressor(header >> 3).decompress(body)
+
+    return _get_decoder(header & 0x07).loads(body)
@@ -0,0 +1,985 @@
+"""
+
+    This module contains a backend keeping the cache in a memory-mapped file,
+    shared by all the processes of a host that open the same file.
+
+    Example usage::
+
+        from pycacher import Cacher
+        from pycacher.backends import TieredBackend, MemcacheBackend
+        from pycacher.sharedmemory import SharedMemoryBackend
+
+        #every gunicorn worker of the box shares the same 256MB
+        backend = SharedMemoryBackend('/dev/shm/myapp-cache', size=256 * 1024 * 1024)
+
+        cacher = Cacher(backend=backend)
+
+        #or as a host-local tier in front of memcached
+        cacher = Cacher(backend=TieredBackend(MemcacheBackend(host='10.0.0.1'), l1=backend))
+
+    The file holds an open-addressing hash table split in `stripes`, each
+    with its own write lock and sequence counter, and a slab allocator:
+    memory is handed out in pages, each cut in chunks of a single size class
+    (powers of two from 64 bytes up to the page size). An entry's key, value
+    and expiry live in a chunk; its table slot holds the key's hash and the
+    chunk's offset. Values are always copied out of the file.
+
+    Writers lock their key's stripe (a thread lock, then an `fcntl` lock on
+    the file so that other processes are excluded too), and bump its
+    sequence counter before and after changing it. Readers take no lock:
+    they read the counter, look the key up, and start over if the counter
+    changed in the meantime (a seqlock). New values are always written to a
+    fresh chunk before the slot is switched to it.
+
+    When a size class has no free chunk left, one of its entries is evicted
+    with the CLOCK algorithm (an approximation of LRU), which looks at a
+    bounded number of the class's chunks. A class that has no page, or no
+    entry to evict, takes a page from the class holding the most pages
+    instead: the entries in the page are evicted, and it's cut again into
+    chunks of the new class. Entries past their expiry are dropped lazily.
+
+    Needs a POSIX system (for `fcntl`).
+
+"""
+
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from .backends import Backend, PycacherBackendArgumentException
+
+MAGIC = b'PYCSHM02'
+
+#magic, size, stripes, slots per stripe, page size, pages, size classes,
+#next free page, page moves
+HEADER = struct.Struct('<8sQQQQQQQQ')
+
+NEXT_PAGE_OFFSET = 56
+PAGE_MOVES_OFFSET = 64
+
+#per stripe: sequence counter, live items, evictions
+STRIPE = struct.Struct('<QQQ')
+
+#per size class: head and tail of the free list, pages owned
+FREE_LIST = struct.Struct('<QQQ')
+
+#per page: owning size class + 1 (0 while unassigned), whether it's being
+#moved to another class, chunks allocated but not released yet
+PAGE = struct.Struct('<III')
+
+#key hash, chunk offset, referenced bit
+SLOT = struct.Struct('<QQQ')
+
+#key length, value length, value flags, size class, absolute expiry (0 for
+#never)
+CHUNK = struct.Struct('<IIIId')
+
+U64 = struct.Struct('<Q')
+U32 = struct.Struct('<I')
+
+STRIPES_OFFSET = 128
+
+#slot offsets that aren't chunks
+EMPTY = 0
+TOMBSTONE = 1
+
+MIN_CHUNK_SIZE = 64
+
+#optimistic reads attempted before falling back to locking the stripe
+READ_ATTEMPTS = 16
+
+#chunks the CLOCK hand looks at to find an entry to evict
+EVICTION_SCAN = 64
+
+#rounds of making room for a chunk, which other writers may take first
+ALLOC_ATTEMPTS = 8
+
+#fcntl locks are taken on bytes past the end of the file, so that they never
+#get in the way of anything else
+LOCK_BASE = 1 << 40
+INIT_LOCK = LOCK_BASE
+ALLOC_LOCK = LOCK_BASE + 1
+STRIPE_LOCKS = LOCK_BASE + 2
+
+#value flags, the same as the memcache ones
+FLAG_PICKLE = 1 << 0
+FLAG_INTEGER = 1 << 1
+FLAG_TEXT = 1 << 4
+
+#an incremented counter never takes more digits than this
+MAX_INTEGER_LENGTH = 21
+
+def _align(offset, alignment):
+    return (offset + alignment - 1) // alignment * alignment
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+def _to_bytes(key):
+    if isinstance(key, bytes):
+        return key
+
+    return key.encode('utf-8')
+
+def _encode_value(value):
+
+    if isinstance(value, bytes):
+        return 0, value
+    elif isinstance(value, str):
+        return FLAG_TEXT, value.encode('utf-8')
+    elif isinstance(value, int) and not isinstance(value, bool):
+        return FLAG_INTEGER, str(value).encode('ascii')
+
+    return FLAG_PICKLE, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+class _Lock(object):
+    """A lock excluding the other threads of the process, then the other
+    processes sharing the file."""
+
+    def __init__(self, fd, offset):
+        self.fd = fd
+        self.offset = offset
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self._lock.acquire()
+
+        try:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, 1, self.offset)
+        except BaseException:
+            self._lock.release()
+            raise
+
+    def __exit__(self, type, value, traceback):
+        try:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, self.offset)
+        finally:
+            self._lock.release()
+
+class SharedMemoryBackend(Backend):
+    """Backend storing entries in the memory-mapped file at `path`, created
+    with `size` bytes if it doesn't exist. Processes opening an existing file
+    use the layout it was created with.
+
+    `max_items` sizes the hash table (twice as many slots are allocated,
+    to keep the probes short), by default one slot per 512 bytes of `size`.
+    `page_size` is the size of the slab pages, which bounds the size of an
+    entry.
+    """
+
+    def __init__(self, path, size=64 * 1024 * 1024, max_items=None, stripes=64,
+                       page_size=1024 * 1024):
+
+        if fcntl is None:
+            raise PycacherBackendArgumentException("SharedMemoryBackend needs a POSIX system")
+
+        if page_size < MIN_CHUNK_SIZE or page_size & (page_size - 1):
+            raise PycacherBackendArgumentException("Page size must be a power of two")
+
+        self.path = path
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+
+        try:
+            self._open(size, max_items or size // 512, stripes, page_size)
+        except BaseException:
+            os.close(self._fd)
+            raise
+
+        self._alloc_lock = _Lock(self._fd, ALLOC_LOCK)
+        self._stripe_locks = [_Lock(self._fd, STRIPE_LOCKS + i) for i in range(self.stripes)]
+
+        #the CLOCK hand of this process in every size class, and where it
+        #starts looking for a page to move
+        self._hands = [0] * self.size_classes
+        self._page_hand = 0
+
+    def _open(self, size, max_items, stripes, page_size):
+        """Maps the file, laying it out first if it's new."""
+
+        init_lock = _Lock(self._fd, INIT_LOCK)
+
+        with init_lock:
+            existing = os.fstat(self._fd).st_size
+
+            if existing >= HEADER.size:
+                magic = os.pread(self._fd, len(MAGIC), 0)
+            else:
+                magic = None
+
+            if magic == MAGIC:
+                size = existing
+            else:
+                os.ftruncate(self._fd, size)
+
+            self._map = mmap.mmap(self._fd, size)
+
+            if magic != MAGIC:
+                slots_per_stripe = max(_align(max_items * 2, stripes) // stripes, 1)
+                self._layout(size, stripes, slots_per_stripe, page_size)
+            else:
+                self._load_layout()
+
+    def _compute_offsets(self, size):
+        self.free_lists_offset = STRIPES_OFFSET + STRIPE.size * self.stripes
+        self.pages_offset = self.free_lists_offset + FREE_LIST.size * self.size_classes
+
+        #sized for every page the file could hold, before the table is taken
+        #out of it
+        self.table_offset = _align(self.pages_offset + PAGE.size * (size // self.page_size), 64)
+        self.slab_offset = _align(self.table_offset + SLOT.size * self.stripes * self.slots_per_stripe,
+                                  mmap.PAGESIZE)
+
+    def _layout(self, size, stripes, slots_per_stripe, page_size):
+        self.stripes = stripes
+        self.slots_per_stripe = slots_per_stripe
+        self.page_size = page_size
+        self.size_classes = page_size.bit_length() - MIN_CHUNK_SIZE.bit_length() + 1
+
+        self._compute_offsets(size)
+
+        self.pages = (size - self.slab_offset) // page_size
+
+        if self.pages < 1:
+            raise PycacherBackendArgumentException(
+                    "Size must be at least %s bytes for this layout" % (self.slab_offset + page_size))
+
+        self._map[:self.slab_offset] = bytes(self.slab_offset)
+
+        #the magic goes in last, once the layout is complete
+        HEADER.pack_into(self._map, 0, b'\x00' * 8, size, stripes, slots_per_stripe, page_size,
+                         self.pages, self.size_classes, 0, 0)
+        self._map[:len(MAGIC)] = MAGIC
+
+    def _load_layout(self):
+        (magic, size, self.stripes, self.slots_per_stripe, self.page_size, self.pages,
+         self.size_classes, next_page, page_moves) = HEADER.unpack_from(self._map, 0)
+
+        self._compute_offsets(size)
+
+    def close(self):
+        """Unmaps the file."""
+
+        self._map.close()
+        os.close(self._fd)
+
+    #Layout helpers
+
+    def _locate(self, key):
+        """Returns `(key bytes, hash, stripe, first slot index)`."""
+
+        key = _to_bytes(key)
+        key_hash = _hash(key)
+        stripe = key_hash % self.stripes
+
+        return key, key_hash, stripe, stripe * self.slots_per_stripe
+
+    def _slot_offset(self, index):
+        return self.table_offset + index * SLOT.size
+
+    def _seq(self, stripe):
+        return U64.unpack_from(self._map, STRIPES_OFFSET + stripe * STRIPE.size)[0]
+
+    def _bump(self, stripe):
+        offset = STRIPES_OFFSET + stripe * STRIPE.size
+        U64.pack_into(self._map, offset, U64.unpack_from(self._map, offset)[0] + 1)
+
+    def _count(self, stripe, field, delta):
+        offset = STRIPES_OFFSET + stripe * STRIPE.size + field * 8
+        U64.pack_into(self._map, offset, U64.unpack_from(self._map, offset)[0] + delta)
+
+    def _probe(self, key, key_hash, stripe, first):
+        """Returns `(slot index, chunk offset)` of the entry of the key, or
+        `(None, index of the first reusable slot or None)`. Expired entries
+        are returned too."""
+
+        sps = self.slots_per_stripe
+        home = (key_hash // self.stripes) % sps
+        reusable = None
+
+        for i in range(sps):
+            index = first + (home + i) % sps
+            slot_hash, offset, referenced = SLOT.unpack_from(self._map, self._slot_offset(index))
+
+            if offset == EMPTY:
+                return None, index if reusable is None else reusable
+            elif offset == TOMBSTONE:
+                if reusable is None:
+                    reusable = index
+            elif slot_hash == key_hash and self._chunk_key(offset) == key:
+                return index, offset
+
+        return None, reusable
+
+    def _chunk_key(self, offset):
+        key_length = U32.unpack_from(self._map, offset)[0]
+        start = offset + CHUNK.size
+
+        return self._map[start:start + key_length]
+
+    def _read_chunk(self, offset):
+        """Returns the value of the chunk, or None if it's expired."""
+
+        key_length, value_length, flags, size_class, expires = CHUNK.unpack_from(self._map, offset)
+
+        if expires and expires <= time.time():
+            return None
+
+        start = offset + CHUNK.size + key_length
+        data = self._map[start:start + value_length]
+
+        if flags == 0:
+            return data
+        elif flags & FLAG_INTEGER:
+            return int(data)
+        elif flags & FLAG_TEXT:
+            return data.decode('utf-8')
+
+        #unpickled once the read is known to be consistent
+        return _Pickled(data)
+
+    #Slab allocator
+
+    def _size_class(self, length):
+        size_class = max(length - 1, 0).bit_length() - MIN_CHUNK_SIZE.bit_length() + 1
+        return max(size_class, 0)
+
+    def _chunk_size(self, size_class):
+        return MIN_CHUNK_SIZE << size_class
+
+    def _free_list(self, size_class):
+        return self.free_lists_offset + size_class * FREE_LIST.size
+
+    def _page(self, offset):
+        """Returns the index of the page holding the chunk at `offset`."""
+        return (offset - self.slab_offset) // self.page_size
+
+    def _page_entry(self, page):
+        return self.pages_offset + page * PAGE.size
+
+    def _owns(self, page, size_class):
+        owner, moving, in_flight = PAGE.unpack_from(self._map, self._page_entry(page))
+        return owner == size_class + 1 and not moving
+
+    def _alloc(self, size_class):
+        """Returns the offset of a free chunk of the class, or None. The chunk
+        is in flight until it's released with `_release`: the page it's in
+        can't be moved meanwhile."""
+
+        free_list = self._free_list(size_class)
+
+        with self._alloc_lock:
+            head, tail, pages = FREE_LIST.unpack_from(self._map, free_list)
+
+            if not head:
+                next_page = U64.unpack_from(self._map, NEXT_PAGE_OFFSET)[0]
+
+                if next_page >= self.pages:
+                    return None
+
+                U64.pack_into(self._map, NEXT_PAGE_OFFSET, next_page + 1)
+
+                head, tail = self._cut_page(next_page, size_class)
+                pages += 1
+
+            next_chunk = U64.unpack_from(self._map, head)[0]
+            FREE_LIST.pack_into(self._map, free_list, next_chunk, tail if next_chunk else 0, pages)
+
+            entry = self._page_entry(self._page(head))
+            owner, moving, in_flight = PAGE.unpack_from(self._map, entry)
+            PAGE.pack_into(self._map, entry, owner, moving, in_flight + 1)
+
+            return head
+
+    def _cut_page(self, page, size_class):
+        """Gives the page to the class, cut into chunks linked in order.
+        Returns the first and last chunks. Must be called with the allocator
+        locked."""
+
+        chunk_size = self._chunk_size(size_class)
+        start = self.slab_offset + page * self.page_size
+        chunks = range(start, start + self.page_size, chunk_size)
+
+        for chunk in chunks:
+            U64.pack_into(self._map, chunk, chunk + chunk_size if chunk != chunks[-1] else 0)
+
+        PAGE.pack_into(self._map, self._page_entry(page), size_class + 1, 0, 0)
+
+        return chunks[0], chunks[-1]
+
+    def _release(self, allocated=None, freed=None):
+        """Ends the flight of the `allocated` chunk, and appends the `freed`
+        one to the end of its class's free list, so that it's reused as late
+        as possible. Freed chunks of a page being moved are dropped, the page
+        is cut again once it's empty."""
+
+        with self._alloc_lock:
+            if allocated is not None:
+                entry = self._page_entry(self._page(allocated))
+                owner, moving, in_flight = PAGE.unpack_from(self._map, entry)
+                PAGE.pack_into(self._map, entry, owner, moving, in_flight - 1)
+
+            if freed is None:
+                return
+
+            owner, moving, in_flight = PAGE.unpack_from(self._map, self._page_entry(self._page(freed)))
+
+            if moving:
+                return
+
+            free_list = self._free_list(owner - 1)
+            head, tail, pages = FREE_LIST.unpack_from(self._map, free_list)
+
+            U64.pack_into(self._map, freed, 0)
+
+            if tail:
+                U64.pack_into(self._map, tail, freed)
+                FREE_LIST.pack_into(self._map, free_list, head, freed, pages)
+            else:
+                FREE_LIST.pack_into(self._map, free_list, freed, freed, pages)
+
+    def _free(self, offset):
+        self._release(freed=offset)
+
+    def _make_room(self, size_class):
+        """Frees a chunk of the class, by evicting one of its entries, or by
+        moving a page to it. Returns whether there may be a free chunk now."""
+
+        pages = FREE_LIST.unpack_from(self._map, self._free_list(size_class))[2]
+
+        if pages and self._evict(size_class):
+            return True
+
+        return self._move_page(size_class)
+
+    def _advance_hand(self, size_class):
+        """Moves this process's CLOCK hand of the class to the class's next
+        chunk, and returns it. Returns None if the class has no page."""
+
+        chunk_size = self._chunk_size(size_class)
+        hand = self._hands[size_class]
+
+        if hand:
+            page = self._page(hand)
+
+            if hand + chunk_size < self.slab_offset + (page + 1) * self.page_size \
+                    and self._owns(page, size_class):
+                self._hands[size_class] = hand + chunk_size
+                return hand + chunk_size
+
+            page += 1
+        else:
+            page = 0
+
+        for i in range(self.pages):
+            candidate = (page + i) % self.pages
+
+            if self._owns(candidate, size_class):
+                hand = self._hands[size_class] = self.slab_offset + candidate * self.page_size
+                return hand
+
+        return None
+
+    def _locate_chunk(self, offset):
+        """Returns `_locate` of the key stored in the chunk, or None if it
+        can't hold one (e.g. it's free and starts with a link instead)."""
+
+        try:
+            key_length = U32.unpack_from(self._map, offset)[0]
+
+            if CHUNK.size + key_length > self.page_size:
+                return None
+
+            return self._locate(self._chunk_key(offset))
+        except (struct.error, ValueError):
+            return None
+
+    def _evict(self, size_class):
+        """Evicts an entry of the class picked by the CLOCK hand, out of
+        `EVICTION_SCAN` chunks at most: the first one that's expired or that
+        wasn't referenced since the hand last passed, else the first
+        referenced one. Returns whether one was evicted."""
+
+        fallback = None
+
+        for step in range(EVICTION_SCAN):
+            offset = self._advance_hand(size_class)
+
+            if offset is None:
+                return False
+
+            located = self._locate_chunk(offset)
+
+            if located is None:
+                continue
+
+            #peek without the lock first, `_evict_chunks` checks again
+            try:
+                index, found = self._probe(*located)
+                expires = CHUNK.unpack_from(self._map, offset)[4]
+            except (struct.error, ValueError):
+                continue
+
+            if index is None or found != offset:
+                #free, or not stored yet
+                continue
+
+            slot_offset = self._slot_offset(index)
+
+            if SLOT.unpack_from(self._map, slot_offset)[2] and not (expires and expires <= time.time()):
+                #a racy write, like the ones readers make
+                U64.pack_into(self._map, slot_offset + 16, 0)
+
+                if fallback is None:
+                    fallback = offset
+
+                continue
+
+            if self._evict_chunks([offset]):
+                return True
+
+        return fallback is not None and self._evict_chunks([fallback]) > 0
+
+    def _evict_chunks(self, offsets, free=True):
+        """Evicts the entries stored in the chunks, if they're still there,
+        locking every stripe once. Returns how many were evicted."""
+
+        stripes = {}
+
+        for offset in offsets:
+            located = self._locate_chunk(offset)
+
+            if located is not None:
+                stripes.setdefault(located[2], []).append((offset, located))
+
+        evicted = []
+
+        for stripe, chunks in stripes.items():
+            with self._stripe_locks[stripe]:
+                self._bump(stripe)
+
+                for offset, located in chunks:
+                    index, found = self._probe(*located)
+
+                    if index is None or found != offset:
+                        continue
+
+                    SLOT.pack_into(self._map, self._slot_offset(index), 0, TOMBSTONE, 0)
+                    evicted.append(offset)
+
+                    self._count(stripe, 1, -1)
+                    self._count(stripe, 2, 1)
+
+                self._bump(stripe)
+
+        if free:
+            for offset in evicted:
+                self._free(offset)
+
+        return len(evicted)
+
+    def _move_page(self, size_class):
+        """Moves a page to the class from the one holding the most pages: the
+        entries in the page are evicted, and it's cut again into chunks of
+        the class. Returns whether the class may have a free chunk now."""
+
+        with self._alloc_lock:
+            #room was made in the meantime
+            if FREE_LIST.unpack_from(self._map, self._free_list(size_class))[0]:
+                return True
+
+            if U64.unpack_from(self._map, NEXT_PAGE_OFFSET)[0] < self.pages:
+                return True
+
+            page = self._pick_page(size_class)
+
+            if page is None:
+                return False
+
+            donor = PAGE.unpack_from(self._map, self._page_entry(page))[0] - 1
+
+            PAGE.pack_into(self._map, self._page_entry(page), donor + 1, 1, 0)
+            self._unlink_page(donor, page)
+
+        #No chunk of the page can be allocated now, and freed ones are
+        #dropped, so once its entries are evicted it's empty.
+        start = self.slab_offset + page * self.page_size
+        self._evict_chunks(range(start, start + self.page_size, self._chunk_size(donor)), free=False)
+
+        with self._alloc_lock:
+            first, last = self._cut_page(page, size_class)
+
+            free_list = self._free_list(size_class)
+            head, tail, pages = FREE_LIST.unpack_from(self._map, free_list)
+
+            if tail:
+                U64.pack_into(self._map, tail, first)
+                FREE_LIST.pack_into(self._map, free_list, head, last, pages + 1)
+            else:
+                FREE_LIST.pack_into(self._map, free_list, first, last, pages + 1)
+
+            U64.pack_into(self._map, PAGE_MOVES_OFFSET,
+                          U64.unpack_from(self._map, PAGE_MOVES_OFFSET)[0] + 1)
+
+        return True
+
+    def _pick_page(self, size_class):
+        """Returns a page of the class holding the most pages (more than
+        `size_class` does) that has no chunk in flight, or None. Must be
+        called with the allocator locked."""
+
+        counts = [FREE_LIST.unpack_from(self._map, self._free_list(c))[2]
+                  for c in range(self.size_classes)]
+
+        for donor in sorted(range(self.size_classes), key=lambda c: -counts[c]):
+            if counts[donor] <= counts[size_class]:
+                return None
+
+            for i in range(self.pages):
+                page = (self._page_hand + i) % self.pages
+                owner, moving, in_flight = PAGE.unpack_from(self._map, self._page_entry(page))
+
+                if owner == donor + 1 and not moving and not in_flight:
+                    self._page_hand = page + 1
+                    return page
+
+        return None
+
+    def _unlink_page(self, size_class, page):
+        """Takes the chunks of the page out of the class's free list, and the
+        page out of its count. Must be called with the allocator locked."""
+
+        free_list = self._free_list(size_class)
+        head, tail, pages = FREE_LIST.unpack_from(self._map, free_list)
+
+        start = self.slab_offset + page * self.page_size
+        end = start + self.page_size
+
+        new_head = new_tail = 0
+        chunk = head
+
+        while chunk:
+            next_chunk = U64.unpack_from(self._map, chunk)[0]
+
+            if not start <= chunk < end:
+                if new_tail:
+                    U64.pack_into(self._map, new_tail, chunk)
+                else:
+                    new_head = chunk
+
+                new_tail = chunk
+
+            chunk = next_chunk
+
+        if new_tail:
+            U64.pack_into(self._map, new_tail, 0)
+
+        FREE_LIST.pack_into(self._map, free_list, new_head, new_tail, pages - 1)
+
+    def _new_chunk(self, key, flags, data, expires, size=None):
+        """Allocates a chunk and writes an entry in it, with room for at
+        least `size` bytes of data. Returns its offset, or None if there's no
+        room for it. The chunk must be released with `_release`."""
+
+        length = CHUNK.size + len(key) + max(len(data), size or 0)
+
+        if length > self.page_size:
+            return None
+
+        size_class = self._size_class(length)
+
+        for attempt in range(ALLOC_ATTEMPTS):
+            offset = self._alloc(size_class)
+
+            if offset is not None:
+                break
+
+            if not self._make_room(size_class):
+                return None
+        else:
+            return None
+
+        self._write_chunk(offset, key, flags, data, time.time() + expires if expires else 0,
+                          size_class)
+
+        return offset
+
+    def _write_chunk(self, offset, key, flags, data, expires_at, size_class):
+        CHUNK.pack_into(self._map, offset, len(key), len(data), flags, size_class, expires_at)
+
+        start = offset + CHUNK.size
+        self._map[start:start + len(key)] = key
+        self._map[start + len(key):start + len(key) + len(data)] = data
+
+    def _install(self, key, key_hash, stripe, first, chunk, only_new=False):
+        """Points the slot of the key to `chunk`, with the stripe locked.
+        Returns whether it did, and the chunk to free."""
+
+        index, found = self._probe(key, key_hash, stripe, first)
+
+        if index is not None:
+            if only_new and self._read_chunk(found) is not None:
+                return False, chunk
+
+            old = found
+        elif found is not None:
+            index, old = found, None
+            self._count(stripe, 1, 1)
+        else:
+            #the stripe is full, the entry takes the place of another one
+            index = self._victim(key_hash, first)
+            old = SLOT.unpack_from(self._map, self._slot_offset(index))[1]
+            self._count(stripe, 2, 1)
+
+        self._bump(stripe)
+        SLOT.pack_into(self._map, self._slot_offset(index), key_hash, chunk, 0)
+        self._bump(stripe)
+
+        return True, old
+
+    def _victim(self, key_hash, first):
+        """Returns the index of the first slot of the stripe that wasn't
+        referenced, from the key's home slot."""
+
+        sps = self.slots_per_stripe
+        home = (key_hash // self.stripes) % sps
+
+        for i in range(sps):
+            index = first + (home + i) % sps
+            slot_hash, offset, referenced = SLOT.unpack_from(self._map, self._slot_offset(index))
+
+            if not referenced:
+                return index
+
+            SLOT.pack_into(self._map, self._slot_offset(index), slot_hash, offset, 0)
+
+        return first + home
+
+    #Backend API
+
+    def get(self, key):
+        key, key_hash, stripe, first = self._locate(key)
+
+        for attempt in range(READ_ATTEMPTS):
+            seq = self._seq(stripe)
+
+            if seq & 1:
+                continue
+
+            try:
+                index, offset = self._probe(key, key_hash, stripe, first)
+                value = self._read_chunk(offset) if index is not None else None
+            except (struct.error, ValueError, IndexError, UnicodeDecodeError):
+                #read while the stripe was being changed
+                continue
+
+            if self._seq(stripe) == seq:
+                break
+        else:
+            with self._stripe_locks[stripe]:
+                index, offset = self._probe(key, key_hash, stripe, first)
+                value = self._read_chunk(offset) if index is not None else None
+
+        if value is None:
+            return None
+
+        #a racy write, at worst it marks the wrong entry as referenced
+        U64.pack_into(self._map, self._slot_offset(index) + 16, 1)
+
+        if isinstance(value, _Pickled):
+            return pickle.loads(value.data)
+
+        return value
+
+    def set(self, key, value, expires=None):
+        key, key_hash, stripe, first = self._locate(key)
+        flags, data = _encode_value(value)
+
+        chunk = self._new_chunk(key, flags, data, expires)
+
+        if chunk is None:
+            return False
+
+        #freed if it doesn't get stored
+        old = chunk
+
+        try:
+            with self._stripe_locks[stripe]:
+                stored, old = self._install(key, key_hash, stripe, first, chunk)
+        finally:
+            self._release(chunk, old)
+
+        return True
+
+    def add(self, key, value, expires=None):
+        key, key_hash, stripe, first = self._locate(key)
+        flags, data = _encode_value(value)
+
+        chunk = self._new_chunk(key, flags, data, expires)
+
+        if chunk is None:
+            return False
+
+        stored, old = False, chunk
+
+        try:
+            with self._stripe_locks[stripe]:
+                stored, old = self._install(key, key_hash, stripe, first, chunk, only_new=True)
+        finally:
+            self._release(chunk, old)
+
+        return stored
+
+    def incr(self, key, delta=1):
+        key, key_hash, stripe, first = self._locate(key)
+
+        #allocated up front, since it can't be with the stripe locked
+        chunk = self._new_chunk(key, FLAG_INTEGER, b'', None, size=MAX_INTEGER_LENGTH)
+
+        if chunk is None:
+            return None
+
+        old = chunk
+
+        try:
+            with self._stripe_locks[stripe]:
+                index, offset = self._probe(key, key_hash, stripe, first)
+                value = self._read_chunk(offset) if index is not None else None
+
+                if isinstance(value, _Pickled):
+                    value = pickle.loads(value.data)
+
+                if value is None:
+                    return None
+
+                value += delta
+
+                #the counter keeps its expiry
+                expires_at = CHUNK.unpack_from(self._map, offset)[4]
+                size_class = CHUNK.unpack_from(self._map, chunk)[3]
+
+                self._write_chunk(chunk, key, FLAG_INTEGER, str(value).encode('ascii'), expires_at,
+                                  size_class)
+                self._install(key, key_hash, stripe, first, chunk)
+
+                old = offset
+        finally:
+            self._release(chunk, old)
+
+        return value
+
+    def delete(self, key):
+        key, key_hash, stripe, first = self._locate(key)
+
+        with self._stripe_locks[stripe]:
+            index, offset = self._probe(key, key_hash, stripe, first)
+
+            if index is None:
+                return False
+
+            self._bump(stripe)
+            SLOT.pack_into(self._map, self._slot_offset(index), 0, TOMBSTONE, 0)
+            self._count(stripe, 1, -1)
+            self._bump(stripe)
+
+        self._free(offset)
+
+        return True
+
+    def exists(self, key):
+        return self.get(key) is not None
+
+    def multi_get(self, keys):
+
+        values = {}
+
+        for key in keys:
+            value = self.get(key)
+
+            if value is not None:
+                values[key] = value
+
+        return values
+
+    def clear(self):
+        """Drops every entry, in every process. Waits for the writes in
+        flight to be over first, since their chunks can't be taken back."""
+
+        while True:
+            for lock in self._stripe_locks:
+                lock.__enter__()
+
+            try:
+                with self._alloc_lock:
+                    if not self._in_flight():
+                        self._reset()
+                        return
+            finally:
+                for lock in reversed(self._stripe_locks):
+                    lock.__exit__(None, None, None)
+
+            time.sleep(0.001)
+
+    def _in_flight(self):
+        return sum(PAGE.unpack_from(self._map, self._page_entry(page))[2]
+                   for page in range(self.pages))
+
+    def _reset(self):
+        """Empties the table and the allocator. Must be called with every
+        lock held."""
+
+        for stripe in range(self.stripes):
+            self._bump(stripe)
+
+        self._map[self.free_lists_offset:self.slab_offset] = \
+                bytes(self.slab_offset - self.free_lists_offset)
+        U64.pack_into(self._map, NEXT_PAGE_OFFSET, 0)
+
+        for stripe in range(self.stripes):
+            offset = STRIPES_OFFSET + stripe * STRIPE.size
+            STRIPE.pack_into(self._map, offset, self._seq(stripe) + 1, 0, 0)
+
+    def get_stats(self):
+        """Returns a snapshot of the counters shared by all the processes.
+
+        Example usage::
+
+            backend.get_stats()
+            >> {'items': 120, 'evictions': 10, 'pages': 256, 'used_pages': 12,
+                'page_moves': 0}
+
+        """
+
+        items = evictions = 0
+
+        for stripe in range(self.stripes):
+            seq, stripe_items, stripe_evictions = STRIPE.unpack_from(self._map,
+                                                                     STRIPES_OFFSET + stripe * STRIPE.size)
+            items += stripe_items
+            evictions += stripe_evictions
+
+        return {
+            'items': items,
+            'evictions': evictions,
+            'pages': self.pages,
+            'used_pages': U64.unpack_from(self._map, NEXT_PAGE_OFFSET)[0],
+            'page_moves': U64.unpack_from(self._map, PAGE_MOVES_OFFSET)[0],
+        }
+
+class _Pickled(object):
+    """A pickled value read from a chunk, unpickled after the read is
+    validated, since unpickling torn data could do anything."""
+
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
@@ -0,0 +1,148 @@
+"""
+
+    This module contains the building blocks used to protect cached functions
+    against cache stampedes, i.e. many callers recomputing the same missing key
+    at the same time.
+
+    `SingleFlight` coalesces concurrent computations within a process, while
+    `Lease` elects a single computing process through the backend's `add`.
+
+"""
+
+import os
+import binascii
+import threading
+import time
+
+from .utils import hash_long_key
+
+class _Flight(object):
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+class SingleFlight(object):
+    """Makes sure that only one thread at a time runs the computation of a key.
+
+    Example usage::
+
+        flights = SingleFlight()
+
+        #Concurrent callers with the same key share the first caller's result.
+        value = flights.do('some-key', compute)
+
+    Threads that arrive while a computation of the same key is in flight wait
+    for it (at most `timeout` seconds, if given) and get its value, or its
+    exception. A follower whose wait times out runs `fn` itself.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, fn, timeout=None):
+
+        with self._lock:
+            flight = self._flights.get(key)
+
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            if not flight.event.wait(timeout):
+                return fn()
+
+            if flight.error is not None:
+                raise flight.error
+
+            return flight.value
+
+        try:
+            flight.value = fn()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+
+            flight.event.set()
+
+        return flight.value
+
+    def in_flight(self, key):
+        return key in self._flights
+
+class Lease(object):
+    """A best-effort, cross-process lock on a cache key built on the backend's
+    atomic `add`.
+
+    Example usage::
+
+        lease = Lease(backend, cache_key, timeout=10)
+
+        if lease.acquire():
+            try:
+                value = compute()
+                backend.set(cache_key, value)
+            finally:
+                lease.release()
+        else:
+            value = lease.wait(5)
+
+    The lease key expires after `timeout` seconds, so a crashed holder can't
+    block the key forever. It is hashed when the suffix pushes it past the
+    backend's key length limit.
+    """
+
+    suffix = ':lease'
+
+    def __init__(self, backend, key, timeout=10, poll_interval=0.05):
+        self.backend = backend
+        self.key = key
+        self.lease_key = hash_long_key(key + self.suffix)
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+
+        self._token = binascii.hexlify(os.urandom(8))
+        self._acquired = False
+
+    def acquire(self):
+        self._acquired = bool(self.backend.add(self.lease_key, self._token, expires=self.timeout))
+        return self._acquired
+
+    def release(self):
+        """Releases the lease, unless it expired and was taken over meanwhile."""
+
+        if self._acquired and self.backend.get(self.lease_key) == self._token:
+            self.backend.delete(self.lease_key)
+
+        self._acquired = False
+
+    def wait(self, timeout=None):
+        """Polls the backend for the key until it's populated by the lease
+        holder, or until `timeout` seconds (defaults to the lease timeout)
+        have passed. Returns the raw stored value, or None."""
+
+        if timeout is None:
+            timeout = self.timeout
+
+        deadline = time.time() + timeout
+
+        while True:
+            value = self.backend.get(self.key)
+
+            if value is not None or time.time() >= deadline:
+                return value
+
+            #Nobody holds the lease anymore. Either the holder stored the value
+            #right after we looked, or it failed; no point in waiting any longer.
+            if self.backend.get(self.lease_key) is None:
+                return self.backend.get(self.key)
+
+            time.sleep(self.poll_interval)
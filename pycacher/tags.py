@@ -0,0 +1,64 @@
+"""
+
+    This module contains the envelope stored by cached functions that depend
+    on tags (see `Cacher.invalidate_tags`).
+
+"""
+
+import binascii
+import os
+
+def new_tag_version():
+    """Returns a random tag version. Random versions, unlike counters, can't
+    come back to a previous value after a tag key gets evicted."""
+    return binascii.hexlify(os.urandom(8))
+
+def version_id(version):
+    """Versions are stored in the cached values as text, which every
+    serializer supports."""
+
+    if isinstance(version, bytes):
+        return version.decode('ascii')
+
+    return version
+
+#First item of a dumped TaggedValue.
+MARKER = '__pycacher_tagged_value__'
+
+class TaggedValue(object):
+    """A cached return value along with the versions its tags had right
+    before it was computed, keyed by tag key.
+
+    It's stored as a plain list (see `dump`), which every serializer
+    supports.
+    """
+
+    def __init__(self, value, versions):
+        self.value = value
+        self.versions = dict((key, version_id(version)) for key, version in versions.items())
+
+    def dump(self):
+        return [MARKER, self.versions, self.value]
+
+    @classmethod
+    def load(cls, data):
+        """Returns the TaggedValue dumped as `data`, or None if `data` isn't
+        one. Instances pickled by older versions are returned as is."""
+
+        if isinstance(data, cls):
+            return data
+
+        if isinstance(data, (list, tuple)) and len(data) == 3 and data[0] == MARKER:
+            return cls(data[2], data[1])
+
+        return None
+
+    def is_valid(self, versions):
+        """Checks the versions against the current ones. A tag that's missing
+        from `versions` (e.g. evicted) invalidates the value too."""
+
+        for key, version in self.versions.items():
+            if version_id(versions.get(key)) != version_id(version):
+                return False
+
+        return True
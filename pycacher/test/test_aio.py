@@ -0,0 +1,399 @@
+import unittest
+import asyncio
+import time
+
+from mock import Mock
+
+from pycacher.aio import AsyncCacher
+from pycacher.aio.backends import AsyncLocalBackend
+from pycacher.aio.stampede import AsyncSingleFlight
+from pycacher.aio.client import MemcacheClient
+from pycacher.fakememcache import FakeMemcacheServer
+from pycacher.exceptions import MemcacheProtocolException
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+class AsyncCachedFunctionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cacher = AsyncCacher(backend=AsyncLocalBackend())
+        self.calls = Mock()
+
+        @self.cacher.cache()
+        async def cached_function(a, b):
+            self.calls(a, b)
+            await asyncio.sleep(0.01)
+            return a + b
+
+        self.cached_function = cached_function
+
+    def test_correct_return_value(self):
+        self.assertEqual(run(self.cached_function(1, 2)), 3)
+
+    def test_only_called_once(self):
+
+        async def test():
+            await self.cached_function(1, 2)
+            await self.cached_function(1, 2)
+
+        run(test())
+
+        self.assertEqual(self.calls.call_count, 1)
+
+    def test_concurrent_awaits_are_coalesced(self):
+
+        async def test():
+            return await asyncio.gather(*[self.cached_function(1, 2) for i in range(5)])
+
+        self.assertEqual(run(test()), [3] * 5)
+        self.assertEqual(self.calls.call_count, 1)
+
+    def test_invalidate(self):
+
+        on_invalidate = Mock()
+        self.cacher.add_hook('invalidate', on_invalidate)
+
+        async def test():
+            await self.cached_function(1, 2)
+            await self.cached_function.invalidate(1, 2)
+
+            return await self.cached_function.is_cached(1, 2)
+
+        self.assertFalse(run(test()))
+        self.assertEqual(on_invalidate.call_count, 1)
+
+    def test_plain_function(self):
+
+        @self.cacher.cache()
+        def plain_function(a):
+            return a * 2
+
+        self.assertEqual(run(plain_function(2)), 4)
+
+    def test_no_list_caching(self):
+        self.assertFalse(hasattr(self.cacher, 'cache_list'))
+
+    def test_invalidate_namespace(self):
+
+        async def test():
+            generations = await self.cacher.get_generations(['user:42', 'user:43'])
+
+            self.assertEqual(await self.cacher.get_generations(['user:42', 'user:43']), generations)
+
+            await self.cacher.invalidate_namespace('user:42')
+
+            return generations, await self.cacher.get_generations(['user:42', 'user:43'])
+
+        generations, new_generations = run(test())
+
+        self.assertNotEqual(new_generations['user:42'], generations['user:42'])
+        self.assertEqual(new_generations['user:43'], generations['user:43'])
+
+    def test_invalidate_tags(self):
+        keys = [self.cacher.tag_key('user:42'), self.cacher.tag_key('board:7')]
+
+        async def test():
+            versions = await self.cacher.get_tag_versions(keys)
+
+            self.assertEqual(await self.cacher.get_tag_versions(keys), versions)
+
+            await self.cacher.invalidate_tags('user:42')
+
+            return versions, await self.cacher.get_tag_versions(keys)
+
+        versions, new_versions = run(test())
+
+        self.assertNotEqual(new_versions[keys[0]], versions[keys[0]])
+        self.assertEqual(new_versions[keys[1]], versions[keys[1]])
+
+class AsyncBatcherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = AsyncLocalBackend()
+        self.cacher = AsyncCacher(backend=self.backend)
+
+        @self.cacher.cache()
+        async def cached_function(a, b):
+            return a + b
+
+        self.cached_function = cached_function
+
+    def test_batch(self):
+
+        batcher = self.cacher.create_batcher()
+
+        async def test():
+            await self.cached_function.warm(1, 2)
+
+            async with batcher:
+                self.cached_function.register(1, 2)
+                self.cached_function.register(1, 3)
+
+            return await batcher.batch()
+
+        values = run(test())
+
+        self.assertTrue(values[self.cached_function.build_cache_key(1, 2)] is not None)
+        self.assertEqual(values[self.cached_function.build_cache_key(1, 3)], None)
+
+    def test_sync_context_is_rejected(self):
+
+        batcher = self.cacher.create_batcher(write_back=True)
+
+        def enter():
+            with batcher:
+                pass
+
+        self.assertRaises(TypeError, enter)
+        self.assertEqual(self.cacher.get_current_batcher(), None)
+
+    def test_autobatch(self):
+
+        batcher = self.cacher.create_batcher()
+
+        async def test():
+            async with batcher.autobatch():
+                self.cached_function.register(1, 2)
+
+        run(test())
+
+        self.assertTrue(batcher.is_batched(self.cached_function.build_cache_key(1, 2)))
+
+    def test_write_back(self):
+
+        batcher = self.cacher.create_batcher(write_back=True)
+        cache_key = self.cached_function.build_cache_key(1, 2)
+
+        async def test():
+            async with batcher:
+                await self.cached_function(1, 2)
+                assert await self.backend.get(cache_key) is None
+
+            return await self.backend.get(cache_key)
+
+        self.assertTrue(run(test()) is not None)
+
+    def test_batcher_context_is_task_local(self):
+
+        batcher = self.cacher.create_batcher()
+
+        async def in_batcher():
+            async with batcher:
+                await asyncio.sleep(0.01)
+                return self.cacher.get_current_batcher()
+
+        async def outside_batcher():
+            await asyncio.sleep(0.005)
+            return self.cacher.get_current_batcher()
+
+        async def test():
+            return await asyncio.gather(in_batcher(), outside_batcher())
+
+        self.assertEqual(run(test()), [batcher, None])
+
+class AutoBatcherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = AsyncLocalBackend()
+        self.cacher = AsyncCacher(backend=self.backend)
+
+        @self.cacher.cache()
+        async def cached_function(a, b):
+            return a + b
+
+        self.cached_function = cached_function
+
+        run(self.cached_function.warm_multi([(1, 2), (1, 3), (1, 4)]))
+
+        self.backend.multi_get = Mock(wraps=self.backend.multi_get)
+        self.backend.get = Mock(wraps=self.backend.get)
+
+    def test_single_multi_get_per_tick(self):
+
+        async def test():
+            async with self.cacher.create_autobatcher():
+                return await asyncio.gather(self.cached_function(1, 2),
+                                            self.cached_function(1, 3),
+                                            self.cached_function(1, 4),
+                                            self.cached_function(1, 5))
+
+        self.assertEqual(run(test()), [3, 4, 5, 6])
+        self.assertEqual(self.backend.multi_get.call_count, 1)
+        self.assertEqual(self.backend.get.call_count, 0)
+
+    def test_keys_are_fetched_once_per_context(self):
+
+        async def test():
+            async with self.cacher.create_autobatcher():
+                await self.cached_function(1, 2)
+                await self.cached_function(1, 2)
+
+        run(test())
+
+        self.assertEqual(self.backend.multi_get.call_count, 1)
+
+    def test_deleted_keys_are_fetched_again(self):
+
+        calls = []
+
+        @self.cacher.cache()
+        async def get_user(uid):
+            calls.append(uid)
+            return {'id': uid, 'version': len(calls)}
+
+        async def test():
+            await get_user(1)
+
+            async with self.cacher.create_autobatcher():
+                await get_user(1)
+                await self.cacher.delete(get_user.build_cache_key(1))
+
+                return await get_user(1)
+
+        self.assertEqual(run(test()), {'id': 1, 'version': 2})
+        self.assertEqual(calls, [1, 1])
+
+    def test_max_batch_size(self):
+
+        async def test():
+            async with self.cacher.create_autobatcher(max_batch_size=2):
+                return await asyncio.gather(self.cached_function(1, 2),
+                                            self.cached_function(1, 3),
+                                            self.cached_function(1, 4))
+
+        self.assertEqual(run(test()), [3, 4, 5])
+        self.assertEqual(self.backend.multi_get.call_count, 2)
+
+    def test_fetches_are_referenced_until_done(self):
+
+        batcher = self.cacher.create_autobatcher()
+
+        async def test():
+            async with batcher:
+                future = batcher.load(self.cached_function.build_cache_key(1, 2))
+                batcher.dispatch()
+
+                in_flight = len(batcher._tasks)
+                await future
+
+            return in_flight
+
+        self.assertEqual(run(test()), 1)
+        self.assertEqual(batcher._tasks, set())
+
+class AsyncSingleFlightTestCase(unittest.TestCase):
+
+    def test_errors_are_shared(self):
+
+        flights = AsyncSingleFlight()
+
+        async def compute():
+            await asyncio.sleep(0.01)
+            raise ValueError()
+
+        async def test():
+            return await asyncio.gather(flights.do('key', compute), flights.do('key', compute),
+                                        return_exceptions=True)
+
+        errors = run(test())
+
+        self.assertTrue(all(isinstance(error, ValueError) for error in errors))
+        self.assertFalse(flights.in_flight('key'))
+
+class MemcacheClientTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeMemcacheServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.server.flush()
+        self.server.latency = 0
+        self.server.failure_rate = 0
+
+        self.client = MemcacheClient(self.server.host, self.server.port, pool_size=4)
+
+    def run_client(self, coroutine):
+
+        async def test():
+            try:
+                return await coroutine
+            finally:
+                await self.client.close()
+
+        return run(test())
+
+    def test_text_protocol(self):
+
+        async def test():
+            await self.client.set(b'testkey', b'testvalue')
+            await self.client.set_multi({b'testkey1': b'1', b'testkey2': b'2'})
+
+            values = await self.client.get_multi([b'testkey', b'testkey1', b'testkey2', b'testkey3'])
+
+            added = await self.client.add(b'testkey', b'othervalue')
+            counter = await self.client.incr(b'testkey1', 10)
+
+            await self.client.delete_multi([b'testkey2'])
+
+            return values, added, counter, await self.client.get(b'testkey2')
+
+        values, added, counter, deleted = self.run_client(test())
+
+        self.assertEqual(values, {b'testkey': b'testvalue', b'testkey1': b'1', b'testkey2': b'2'})
+        self.assertFalse(added)
+        self.assertEqual(counter, 11)
+        self.assertEqual(deleted, None)
+
+    def test_cas(self):
+
+        async def test():
+            await self.client.set(b'testkey', b'a')
+
+            value, cas_unique = await self.client.gets(b'testkey')
+
+            return (await self.client.cas(b'testkey', b'b', cas_unique),
+                    await self.client.cas(b'testkey', b'c', cas_unique),
+                    await self.client.get(b'testkey'))
+
+        self.assertEqual(self.run_client(test()), (True, False, b'b'))
+
+    def test_meta_protocol(self):
+
+        async def test():
+            await self.client.meta_set(b'testkey', b'testvalue', expires=60)
+
+            hit = await self.client.meta_get(b'testkey')
+            deleted = await self.client.meta_delete(b'testkey')
+
+            return hit, deleted, await self.client.meta_get(b'testkey')
+
+        self.assertEqual(self.run_client(test()), ((b'testvalue', 60), True, (None, None)))
+
+    def test_pool_runs_commands_in_parallel(self):
+        self.server.latency = 0.05
+
+        async def test():
+            start = time.time()
+
+            await asyncio.gather(*[self.client.get(b'testkey%d' % i) for i in range(8)])
+
+            return time.time() - start
+
+        #two rounds of four connections
+        self.assertTrue(0.1 <= self.run_client(test()) < 0.3)
+
+    def test_server_errors(self):
+        self.server.failure_rate = 1
+
+        self.assertRaises(MemcacheProtocolException, self.run_client, self.client.get(b'testkey'))
@@ -1,13 +1,13 @@
 import unittest
 import memcache
 import random
+import time
 
 from mock import Mock
 
-from pycacher.backends import LocalBackend, MemcacheBackend
-
-#create the client
-client = memcache.Client(['localhost:11211'])
+from pycacher.backends import (LocalBackend, MemcacheBackend, TieredBackend, ChunkedBackend, LFUPolicy,
+                               PycacherBackendArgumentException)
+from pycacher.fakememcache import FakeMemcacheServer
 
 class BaseBackendTestCaseMixin(object):
 
@@ -39,18 +39,246 @@ class BaseBackendTestCaseMixin(object):
 
         assert self.backend.get('testkey1') == None
 
+    def test_multi_set(self):
+
+        self.backend.multi_set({'testkey1': 'testvalue1', 'testkey2': 'testvalue2'})
+
+        assert self.backend.get('testkey1') == 'testvalue1'
+        assert self.backend.get('testkey2') == 'testvalue2'
+
+    def test_multi_delete(self):
+
+        self.backend.multi_set({'testkey1': 'testvalue1', 'testkey2': 'testvalue2'})
+        self.backend.multi_delete(['testkey1', 'testkey2'])
+
+        assert self.backend.get('testkey1') == None
+        assert self.backend.get('testkey2') == None
+
+    def test_incr(self):
+
+        self.backend.delete('testcounter')
+        self.assertEqual(self.backend.incr('testcounter'), None)
+
+        self.backend.set('testcounter', 10)
+
+        self.assertEqual(self.backend.incr('testcounter'), 11)
+        self.assertEqual(self.backend.incr('testcounter', 5), 16)
+        self.assertEqual(self.backend.get('testcounter'), 16)
+
 class LocalBackendTestCase(unittest.TestCase, BaseBackendTestCaseMixin):
     
     def setUp(self):
         self.backend = LocalBackend()
 
+class BoundedLocalBackendTestCase(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        backend = LocalBackend(max_items=2)
+
+        backend.set('testkey1', 'testvalue1')
+        backend.set('testkey2', 'testvalue2')
+
+        #touch testkey1 so that testkey2 becomes the least recently used
+        backend.get('testkey1')
+        backend.set('testkey3', 'testvalue3')
+
+        self.assertEqual(backend.get('testkey1'), 'testvalue1')
+        self.assertEqual(backend.get('testkey2'), None)
+        self.assertEqual(backend.get('testkey3'), 'testvalue3')
+        self.assertEqual(backend.get_stats()['evictions'], 1)
+
+    def test_lfu_eviction(self):
+        backend = LocalBackend(max_items=2, policy='lfu')
+
+        backend.set('testkey1', 'testvalue1')
+        backend.set('testkey2', 'testvalue2')
+
+        backend.get('testkey1')
+        backend.get('testkey1')
+        backend.get('testkey2')
+
+        backend.set('testkey3', 'testvalue3')
+
+        self.assertEqual(backend.get('testkey1'), 'testvalue1')
+        self.assertEqual(backend.get('testkey2'), None)
+
+    def test_lfu_victim_after_remove(self):
+        policy = LFUPolicy()
+
+        for key in ('testkey1', 'testkey2', 'testkey3'):
+            policy.insert(key)
+
+        for i in range(3):
+            policy.touch('testkey2')
+
+        policy.touch('testkey3')
+
+        #empties the lowest frequency, leaving testkey3 as the next victim
+        policy.remove('testkey1')
+        self.assertEqual(policy.victim(), 'testkey3')
+
+        policy.remove('testkey3')
+        self.assertEqual(policy.victim(), 'testkey2')
+
+        policy.insert('testkey4')
+        self.assertEqual(policy.victim(), 'testkey4')
+
+    def test_max_bytes(self):
+        backend = LocalBackend(max_bytes=10)
+
+        backend.set('testkey1', b'12345')
+        backend.set('testkey2', b'12345')
+        backend.set('testkey3', b'12345')
+
+        self.assertEqual(backend.get('testkey1'), None)
+        self.assertEqual(backend.get_stats()['bytes'], 10)
+
+        #payloads bigger than the whole cap are never stored
+        self.assertFalse(backend.set('testkey4', b'x' * 11))
+        self.assertEqual(backend.get('testkey4'), None)
+
+    def test_expires(self):
+        backend = LocalBackend()
+
+        backend.set('testkey1', 'testvalue1', expires=0.01)
+        backend.set('testkey2', 'testvalue2')
+
+        time.sleep(0.02)
+
+        self.assertEqual(backend.multi_get(['testkey1', 'testkey2']),
+                         {'testkey1': None, 'testkey2': 'testvalue2'})
+        self.assertEqual(backend.get_stats()['expirations'], 1)
+
+    def test_invalid_policy(self):
+        self.assertRaises(PycacherBackendArgumentException, LocalBackend, policy='fifo')
+
+class TieredBackendTestCase(unittest.TestCase, BaseBackendTestCaseMixin):
+
+    def setUp(self):
+        self.l2 = LocalBackend()
+        self.backend = TieredBackend(self.l2, l1_expires=60)
+
+    def test_read_through(self):
+        self.l2.set('testkey', 'testvalue')
+
+        self.assertEqual(self.backend.get('testkey'), 'testvalue')
+        self.assertEqual(self.backend.l1.get('testkey'), 'testvalue')
+
+    def test_served_from_l1(self):
+        self.backend.set('testkey', 'testvalue')
+        self.l2.delete('testkey')
+
+        self.assertEqual(self.backend.get('testkey'), 'testvalue')
+
+    def test_multi_get_fills_l1(self):
+        self.backend.set('testkey1', 'testvalue1')
+        self.l2.set('testkey2', 'testvalue2')
+
+        self.assertEqual(self.backend.multi_get(['testkey1', 'testkey2']),
+                         {'testkey1': 'testvalue1', 'testkey2': 'testvalue2'})
+        self.assertEqual(self.backend.l1.get('testkey2'), 'testvalue2')
+
+    def test_purge_local(self):
+        self.backend.set('testkey', 'testvalue')
+        self.backend.purge_local('testkey')
+
+        self.assertEqual(self.backend.l1.get('testkey'), None)
+        self.assertEqual(self.backend.get('testkey'), 'testvalue')
+
+class ChunkedBackendTestCase(unittest.TestCase, BaseBackendTestCaseMixin):
+
+    def setUp(self):
+        self.inner = LocalBackend()
+        self.backend = ChunkedBackend(self.inner, chunk_size=10)
+
+    def test_large_value_is_chunked(self):
+        self.backend.set('testkey', b'x' * 25)
+
+        self.assertEqual(self.backend.get('testkey'), b'x' * 25)
+
+        #a manifest and 3 chunks
+        self.assertEqual(self.inner.get_stats()['items'], 4)
+
+    def test_missing_chunk_is_a_miss(self):
+        self.backend.set('testkey', b'x' * 25)
+
+        chunk_key = [key for key in self.inner._dict if ':chunk:' in key][0]
+        self.inner.delete(chunk_key)
+
+        self.assertEqual(self.backend.get('testkey'), None)
+
+    def test_overwrite_never_mixes_chunks(self):
+        self.backend.set('testkey', b'a' * 25)
+        old_manifest = self.inner.get('testkey')
+
+        self.backend.set('testkey', b'b' * 25)
+
+        #the new manifest points to chunks of its own
+        self.assertNotEqual(self.backend._chunk_keys('testkey', old_manifest),
+                            self.backend._chunk_keys('testkey', self.inner.get('testkey')))
+        self.assertEqual(self.backend.get('testkey'), b'b' * 25)
+
+    def test_multi_get_mixed(self):
+        self.backend.multi_set({'testkey1': b'small', 'testkey2': b'y' * 35})
+
+        self.assertEqual(self.backend.multi_get(['testkey1', 'testkey2', 'testkey3']),
+                         {'testkey1': b'small', 'testkey2': b'y' * 35, 'testkey3': None})
+
+    def test_multi_set_failures(self):
+        #fail the chunks of testkey2, but not its manifest
+        self.inner.multi_set = lambda mapping, expires=None: [key for key, value in mapping.items()
+                                                              if value.startswith(b'y')]
+
+        failed = self.backend.multi_set({'testkey1': b'small', 'testkey2': b'y' * 35,
+                                         'testkey22': b'small'})
+
+        self.assertEqual(failed, ['testkey2'])
+
 class MemcacheBackendTestCase(unittest.TestCase, BaseBackendTestCaseMixin):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeMemcacheServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
     
     def setUp(self):
+        self.server.flush()
+
+        client = memcache.Client(['%s:%s' % (self.server.host, self.server.port)])
         self.backend = MemcacheBackend(client)
 
+    def tearDown(self):
+        self.backend.client.disconnect_all()
+
     def create_mock(self, *args, **kwargs):
         mock = Mock(*args, **kwargs)
         mock.__name__ = str(random.random() * 10)
 
         return mock
+
+    def test_chunked_long_key(self):
+        backend = ChunkedBackend(self.backend, chunk_size=10)
+        key = 'k' * 250
+
+        self.assertEqual(backend.multi_set({key: b'x' * 25}), [])
+        self.assertEqual(backend.get(key), b'x' * 25)
+
+    def test_set_expires(self):
+        client = Mock()
+        backend = MemcacheBackend(client)
+
+        backend.set('testkey', 'testvalue', expires=59.5)
+        client.set.assert_called_with('testkey', 'testvalue', time=60)
+
+        backend.set('testkey', 'testvalue')
+        client.set.assert_called_with('testkey', 'testvalue', time=0)
+
+    def test_multi_set_uses_set_multi(self):
+        client = Mock()
+        backend = MemcacheBackend(client)
+
+        backend.multi_set({'testkey': 'testvalue'}, expires=10)
+        client.set_multi.assert_called_with({'testkey': 'testvalue'}, time=10)
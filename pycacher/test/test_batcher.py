@@ -1,6 +1,7 @@
 from __future__ import with_statement
 
 import unittest
+import threading
 
 from mock import Mock
 
@@ -170,3 +171,101 @@ class BatcherTestCase(unittest.TestCase):
     def test_should_raise_out_of_context_exception(self):
         self.assertRaises(OutOfBatcherContextRegistrationException,
                           self.cached_function.register, 1, 2)
+
+    def test_write_back(self):
+
+        batcher = self.cacher.create_batcher(write_back=True)
+        cache_key = self.cached_function.build_cache_key(1, 2)
+
+        self.cacher.backend = Mock(wraps=self.cacher.backend)
+
+        with batcher:
+            self.cached_function(1, 2)
+            self.cached_function(1, 3)
+
+            #buffered, but already visible to the batcher
+            self.assertEqual(self.cacher.backend.set.call_count, 0)
+            self.assertTrue(cache_key in batcher.get_pending_writes())
+
+        self.assertEqual(self.cacher.backend.multi_set.call_count, 1)
+        self.assertEqual(batcher.get_pending_writes(), {})
+        self.assertTrue(self.cacher.backend.exists(cache_key))
+
+    def test_write_back_buffered_value_is_reused(self):
+
+        func = Mock(return_value=3)
+        func.__name__ = 'write_back_func'
+
+        cached_function = self.cacher.cache()(func)
+        batcher = self.cacher.create_batcher(write_back=True)
+
+        with batcher:
+            cached_function(1, 2)
+            cached_function(1, 2)
+
+        self.assertEqual(func.call_count, 1)
+
+    def test_batcher_context_is_thread_local(self):
+
+        seen = []
+
+        def other_thread():
+            seen.append(self.cacher.get_current_batcher())
+
+        with self.batcher:
+            thread = threading.Thread(target=other_thread)
+            thread.start()
+            thread.join()
+
+            self.assertTrue(self.cacher.get_current_batcher() is self.batcher)
+
+        self.assertEqual(seen, [None])
+        self.assertEqual(self.cacher.get_batcher_stack_depth(), 0)
+
+    def test_nested_batchers(self):
+
+        other_batcher = self.cacher.create_batcher()
+
+        with self.batcher:
+            with other_batcher:
+                self.assertTrue(self.cacher.get_current_batcher() is other_batcher)
+                self.assertEqual(self.cacher.get_batcher_stack_depth(), 2)
+
+            self.assertTrue(self.cacher.get_current_batcher() is self.batcher)
+
+    def test_batched_miss_is_not_looked_up_again(self):
+
+        func = Mock(return_value=3)
+        func.__name__ = 'batched_miss_func'
+
+        cached_function = self.cacher.cache()(func)
+        self.cacher.backend = Mock(wraps=self.cacher.backend)
+
+        with self.batcher:
+            cached_function.register(1, 2)
+
+        self.batcher.batch()
+
+        with self.batcher:
+            cached_function(1, 2)
+            cached_function(1, 2)
+
+        #computed once, straight from the batched miss, and then served from
+        #the batcher
+        self.assertEqual(func.call_count, 1)
+        self.assertEqual(self.cacher.backend.get.call_count, 0)
+        self.assertTrue(cached_function.is_cached(1, 2))
+
+    def test_invalidated_key_is_forgotten(self):
+
+        with self.batcher:
+            self.cached_function.register(1, 2)
+
+        self.batcher.batch()
+
+        with self.batcher:
+            self.cached_function(1, 2)
+            self.cached_function.invalidate(1, 2)
+
+            self.assertFalse(self.batcher.is_miss(self.cached_function.build_cache_key(1, 2)))
+            self.assertEqual(self.batcher.get(self.cached_function.build_cache_key(1, 2)), None)
@@ -1,9 +1,11 @@
 import unittest
+import gc
+import weakref
 
 from mock import Mock
 
 from pycacher import Cacher
-from pycacher.backends import MemcacheBackend, LocalBackend
+from pycacher.backends import MemcacheBackend, LocalBackend, TieredBackend
 
 class CacherTestCase(unittest.TestCase):
     
@@ -25,3 +27,38 @@ class CacherTestCase(unittest.TestCase):
 
         self.assertTrue(isinstance(cacher.backend, MemcacheBackend))
 
+    def test_tiered_backend_purged_on_invalidate(self):
+
+        backend = TieredBackend(LocalBackend())
+        cacher = Cacher(backend=backend)
+
+        backend.set('testkey', 'testvalue')
+        cacher.trigger_hooks('invalidate', 'testkey')
+
+        self.assertEqual(backend.l1.get('testkey'), None)
+
+    def test_batcher_stacks_are_per_cacher(self):
+
+        cacher = Cacher(backend=LocalBackend())
+        other = Cacher(backend=LocalBackend())
+
+        batcher = cacher.create_batcher()
+
+        with batcher:
+            self.assertEqual(cacher.get_current_batcher(), batcher)
+            self.assertEqual(other.get_current_batcher(), None)
+
+        self.assertEqual(cacher.get_batcher_stack_depth(), 0)
+
+    def test_batchers_dont_keep_the_cacher_alive(self):
+
+        cacher = Cacher(backend=LocalBackend())
+
+        with cacher.create_batcher():
+            pass
+
+        ref = weakref.ref(cacher)
+        del cacher
+        gc.collect()
+
+        self.assertEqual(ref(), None)
@@ -0,0 +1,211 @@
+import unittest
+import socket
+
+from pycacher.ketama import HashRing
+from pycacher.cluster import MemcacheClusterBackend, MemcacheConnection, encode_value, decode_value
+from pycacher.fakememcache import FakeMemcacheServer
+from pycacher.backends import PycacherBackendArgumentException
+from pycacher.exceptions import MemcacheProtocolException
+
+SERVERS = ['10.0.0.1:11211', '10.0.0.2:11211', '10.0.0.3:11211']
+
+#per server storage shared by all the fake connections to it
+stores = {}
+down = set()
+
+class FakeConnection(object):
+
+    def __init__(self, host, port, timeout):
+        self.server = '%s:%s' % (host, port)
+        self.store_ = stores.setdefault(self.server, {})
+
+    def _check(self):
+        if self.server in down:
+            raise socket.error("connection refused")
+
+    def get_multi(self, keys):
+        self._check()
+        return dict((key, self.store_[key]) for key in keys if key in self.store_)
+
+    def set_multi(self, mapping, expires=None):
+        self._check()
+        self.store_.update(mapping)
+        return []
+
+    def store(self, command, key, value, expires=None):
+        self._check()
+
+        if command == b'add' and key in self.store_:
+            return False
+
+        self.store_[key] = value
+        return True
+
+    def incr(self, key, delta=1):
+        self._check()
+
+        if key not in self.store_:
+            return None
+
+        self.store_[key] += delta
+        return self.store_[key]
+
+    def delete_multi(self, keys):
+        self._check()
+
+        for key in keys:
+            self.store_.pop(key, None)
+
+        return True
+
+    def close(self):
+        pass
+
+class HashRingTestCase(unittest.TestCase):
+
+    def test_keys_are_spread(self):
+        ring = HashRing(SERVERS)
+
+        nodes = [ring.get_node('key-%s' % i) for i in range(3000)]
+
+        for server in SERVERS:
+            self.assertTrue(700 < nodes.count(server) < 1300)
+
+    def test_removal_only_remaps_the_removed_node_keys(self):
+        ring = HashRing(SERVERS)
+        keys = ['key-%s' % i for i in range(1000)]
+
+        before = dict((key, ring.get_node(key)) for key in keys)
+
+        ring.remove_node(SERVERS[0])
+
+        for key in keys:
+            if before[key] != SERVERS[0]:
+                self.assertEqual(ring.get_node(key), before[key])
+
+        ring.add_node(SERVERS[0])
+
+        self.assertEqual(dict((key, ring.get_node(key)) for key in keys), before)
+
+class MemcacheClusterBackendTestCase(unittest.TestCase):
+
+    def setUp(self):
+        stores.clear()
+        down.clear()
+
+        self.backend = MemcacheClusterBackend(SERVERS, connection_factory=FakeConnection)
+
+    def test_get_set(self):
+        self.backend.set('testkey', 'testvalue')
+
+        self.assertEqual(self.backend.get('testkey'), 'testvalue')
+        self.assertEqual(stores[self.backend.ring.get_node('testkey')]['testkey'], 'testvalue')
+
+    def test_multi_get_is_split_per_server(self):
+        mapping = dict(('testkey%s' % i, 'testvalue%s' % i) for i in range(50))
+
+        self.assertEqual(self.backend.multi_set(mapping), [])
+        self.assertEqual(self.backend.multi_get(list(mapping)), mapping)
+
+        #every server got its own share
+        self.assertEqual(sorted(stores), sorted(SERVERS))
+
+    def test_add(self):
+        self.assertTrue(self.backend.add('testkey', 'testvalue'))
+        self.assertFalse(self.backend.add('testkey', 'testvalue'))
+
+    def test_incr(self):
+        self.assertEqual(self.backend.incr('testcounter'), None)
+
+        self.backend.set('testcounter', 1)
+
+        self.assertEqual(self.backend.incr('testcounter', 2), 3)
+        self.assertEqual(self.backend.get('testcounter'), 3)
+
+    def test_multi_delete(self):
+        self.backend.multi_set({'testkey1': 'testvalue1', 'testkey2': 'testvalue2'})
+        self.backend.multi_delete(['testkey1', 'testkey2'])
+
+        self.assertEqual(self.backend.multi_get(['testkey1', 'testkey2']), {})
+
+    def test_no_servers(self):
+        self.assertRaises(PycacherBackendArgumentException, MemcacheClusterBackend, [])
+
+    def test_failing_node_is_ejected(self):
+        key = 'testkey'
+        server = self.backend.ring.get_node(key)
+
+        down.add(server)
+
+        #a failed read is a miss, and takes the server out of the ring
+        self.assertEqual(self.backend.get(key), None)
+        self.assertFalse(server in self.backend.ring)
+
+        self.backend.set(key, 'testvalue')
+        self.assertEqual(self.backend.get(key), 'testvalue')
+
+        down.clear()
+        self.backend.add_node(server)
+
+        self.assertTrue(server in self.backend.ring)
+
+    def test_ejected_node_is_readded_after_retry(self):
+        server = SERVERS[0]
+
+        self.backend.eject_node(server, retry_after=-1)
+        self.backend.get('testkey')
+
+        self.assertTrue(server in self.backend.ring)
+
+class MemcacheConnectionTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeMemcacheServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.server.flush()
+        self.server.failure_rate = 0
+
+        self.conn = MemcacheConnection(self.server.host, self.server.port)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_round_trips(self):
+        self.assertEqual(self.conn.set_multi({'testkey1': 'testvalue1', 'testkey2': 42}), [])
+        self.assertTrue(self.conn.store(b'add', 'testkey3', b'testvalue3'))
+        self.assertFalse(self.conn.store(b'add', 'testkey3', b'testvalue3'))
+
+        self.assertEqual(self.conn.get_multi(['testkey1', 'testkey2', 'testkey3', 'testkey4']),
+                         {'testkey1': 'testvalue1', 'testkey2': 42, 'testkey3': b'testvalue3'})
+
+        self.assertEqual(self.conn.incr('testkey2', 8), 50)
+        self.assertEqual(self.conn.incr('testkey4'), None)
+
+        self.conn.delete_multi(['testkey1', 'testkey2'])
+
+        self.assertEqual(self.conn.get_multi(['testkey1', 'testkey2']), {})
+
+    def test_backend_over_a_real_connection(self):
+        server = '%s:%s' % (self.server.host, self.server.port)
+        backend = MemcacheClusterBackend([server])
+
+        backend.set('testkey', {'a': 1})
+
+        self.assertEqual(backend.get('testkey'), {'a': 1})
+
+    def test_server_errors(self):
+        self.server.failure_rate = 1
+
+        self.assertRaises(MemcacheProtocolException, self.conn.get_multi, ['testkey'])
+
+class ValueEncodingTestCase(unittest.TestCase):
+
+    def test_round_trip(self):
+        for value in [b'bytes', 'text', 42, {'a': [1, 2]}]:
+            self.assertEqual(decode_value(*encode_value(value)), value)
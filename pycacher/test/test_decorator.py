@@ -5,6 +5,8 @@ import unittest
 import pickle
 import memcache
 import random
+import time
+import threading
 
 
 from mock import Mock
@@ -12,6 +14,8 @@ from mock import Mock
 from pycacher.backends import LocalBackend
 from pycacher.cacher import Cacher, CachedFunctionDecorator
 from pycacher.decorators import CachedListFunctionDecorator
+from pycacher.exceptions import NotNamespacedFunctionException
+from pycacher.utils import MISSING
 
 class CachedDecoratorClassTestCase(unittest.TestCase):
     
@@ -70,12 +74,101 @@ class CachedDecoratorClassTestCase(unittest.TestCase):
         
         assert func.call_count == 3
 
+    def test_expires(self):
+        func = self.create_mock(return_value='testing')
+        decorated_func = CachedFunctionDecorator(func, cacher=self.cacher, expires=0.01)
+
+        decorated_func(1)
+        time.sleep(0.02)
+        decorated_func(1)
+
+        assert func.call_count == 2
+
+    def test_default_expires(self):
+        backend = Mock()
+        backend.get.return_value = None
+
+        cacher = Cacher(backend=backend, default_expires=60)
+
+        decorated_func = CachedFunctionDecorator(self.create_mock(return_value='testing'),
+                                                 cacher=cacher)
+        decorated_func(1)
+
+        self.assertEqual(backend.set.call_args[1]['expires'], 60)
+
+    def test_jittered_expires(self):
+        cacher = Cacher(backend=LocalBackend(), default_expires=100, expires_jitter=0.5)
+        decorated_func = CachedFunctionDecorator(self.create_mock(), cacher=cacher)
+
+        for i in range(20):
+            self.assertTrue(50 <= decorated_func.get_expires() <= 100)
+
+        #the decorator's own settings take precedence
+        decorated_func = CachedFunctionDecorator(self.create_mock(), cacher=cacher,
+                                                 expires=10, jitter=0)
+        self.assertEqual(decorated_func.get_expires(), 10)
+
+    def test_warm_multi(self):
+        backend = Mock(wraps=LocalBackend())
+        cacher = Cacher(backend=backend)
+
+        func = self.create_mock(return_value='testing')
+        decorated_func = CachedFunctionDecorator(func, cacher=cacher)
+
+        decorated_func.warm_multi([(1,), (2,), (3,)])
+
+        self.assertEqual(backend.multi_set.call_count, 1)
+        self.assertTrue(decorated_func.is_cached(2))
+
+    def test_none_is_cached(self):
+        func = self.create_mock(return_value=None)
+        decorated_func = CachedFunctionDecorator(func, cacher=self.cacher)
+
+        self.assertEqual(decorated_func(1), None)
+        self.assertEqual(decorated_func(1), None)
+
+        self.assertEqual(func.call_count, 1)
+        self.assertEqual(self.cacher.get(decorated_func.build_cache_key(1), MISSING), None)
+        self.assertEqual(self.cacher.get(decorated_func.build_cache_key(2), MISSING), MISSING)
+
+    def test_negative_expires(self):
+        backend = Mock(wraps=LocalBackend())
+        cacher = Cacher(backend=backend)
+
+        func = self.create_mock(side_effect=lambda a: a or None)
+        decorated_func = CachedFunctionDecorator(func, cacher=cacher, expires=600,
+                                                 negative_expires=30)
+
+        decorated_func(0)
+        self.assertEqual(backend.set.call_args[1]['expires'], 30)
+
+        decorated_func(1)
+        self.assertEqual(backend.set.call_args[1]['expires'], 600)
+
+        decorated_func.warm_multi([(0,), (2,)])
+
+        self.assertEqual(sorted(call[1]['expires'] for call in backend.multi_set.call_args_list),
+                         [30, 600])
+
+    def test_kwargs_are_part_of_the_key(self):
+        func = self.create_mock(side_effect=lambda a, b=0: a + b)
+        decorated_func = CachedFunctionDecorator(func, cacher=self.cacher)
+
+        self.assertEqual(decorated_func(1, b=1), 2)
+        self.assertEqual(decorated_func(1, b=2), 3)
+        self.assertEqual(decorated_func(1, b=2), 3)
+
+        self.assertEqual(func.call_count, 2)
+        self.assertTrue(decorated_func.is_cached(1, b=2))
+        self.assertFalse(decorated_func.is_cached(1))
+
 class CachedListFunctionDecoratorTestCase(unittest.TestCase):
     
     def setUp(self):
         self.cacher = Cacher(backend=LocalBackend())
 
-        self.func = self.create_mock(return_value=[1, 2, 3, 4, 5])
+        #a list of 23 items
+        self.func = self.create_mock(side_effect=lambda uid, skip, limit: list(range(23))[skip:skip + limit])
         self.decorated_func = CachedListFunctionDecorator(self.func, cacher=self.cacher, range=5) 
 
     def create_mock(self, *args, **kwargs):
@@ -84,49 +177,131 @@ class CachedListFunctionDecoratorTestCase(unittest.TestCase):
 
         return mock
 
-    def test_called_the_correct_n_times(self):
+    def test_adjacent_misses_are_merged(self):
         
         self.decorated_func(1, skip=0, limit=15)
 
-        self.assertEqual(self.func.call_count, 3)
+        self.assertEqual(self.func.call_count, 1)
+        self.func.assert_called_with(1, skip=0, limit=15)
 
     def test_called_with_correct_values(self):
         
+        self.decorated_func(1, skip=5, limit=5)
         self.decorated_func(1, skip=0, limit=15)
 
-        self.func.assert_any_call(1, skip=0, limit=5)
+        #only the chunks around the cached one are computed
         self.func.assert_any_call(1, skip=5, limit=5)
+        self.func.assert_any_call(1, skip=0, limit=5)
         self.func.assert_any_call(1, skip=10, limit=5)
 
+        self.assertEqual(self.func.call_count, 3)
+
     def test_return_correct_value(self):
 
-        self.assertEqual(self.decorated_func(1, skip=0, limit=8),
-                         [1, 2, 3, 4, 5, 1, 2, 3])
-        
-        self.assertEqual(self.decorated_func(1, skip=0, limit=15),
-                         [1, 2, 3, 4, 5, 1, 2, 3, 4, 5, 1, 2, 3, 4, 5])
+        self.assertEqual(self.decorated_func(1, skip=0, limit=8), list(range(8)))
+        self.assertEqual(self.decorated_func(1, skip=0, limit=15), list(range(15)))
+        self.assertEqual(self.decorated_func(1, skip=3, limit=9), list(range(3, 12)))
+        self.assertEqual(self.decorated_func(1, skip=18, limit=10), list(range(18, 23)))
+        self.assertEqual(self.decorated_func(1, skip=30, limit=10), [])
+        self.assertEqual(self.decorated_func(1, skip=0, limit=0), [])
+
+    def test_stops_at_the_end_of_the_list(self):
+
+        self.assertEqual(self.decorated_func(1, skip=0, limit=100), list(range(23)))
+
+        self.func.reset_mock()
+
+        #everything up to the last, short, chunk is cached
+        self.assertEqual(self.decorated_func(1, skip=0, limit=100), list(range(23)))
+        self.assertEqual(self.func.call_count, 0)
+
+    def test_single_round_trip(self):
+        self.cacher.backend = Mock(wraps=self.cacher.backend)
+
+        self.decorated_func(1, skip=0, limit=15)
+        self.decorated_func(1, skip=0, limit=15)
+
+        self.assertEqual(self.cacher.backend.get.call_count, 0)
+        self.assertEqual(self.cacher.backend.multi_get.call_count, 2)
 
     def test_get_ranged_cache_keys(self):
         
         self.assertEqual(self.decorated_func.get_ranged_cache_keys(1, skip=0, limit=9),
-                         ['mock.testing:1[0:5]', 'mock.testing:1[6:10]'])
+                         ['mock.testing:1[0:5]', 'mock.testing:1[5:10]'])
 
         self.assertEqual(self.decorated_func.get_ranged_cache_keys(1, skip=4, limit=5),
-                         ['mock.testing:1[0:5]', 'mock.testing:1[6:10]'])
+                         ['mock.testing:1[0:5]', 'mock.testing:1[5:10]'])
 
         self.assertEqual(self.decorated_func.get_ranged_cache_keys(1, skip=12, limit=5),
-                         ['mock.testing:1[11:15]', 'mock.testing:1[16:20]'])
+                         ['mock.testing:1[10:15]', 'mock.testing:1[15:20]'])
 
         self.assertEqual(self.decorated_func.get_ranged_cache_keys(1, skip=10, limit=5),
-                         ['mock.testing:1[11:15]'])
+                         ['mock.testing:1[10:15]'])
+
+    def test_extra_kwargs(self):
+
+        @self.cacher.cache_list(range=5)
+        def get_ids(uid, skip=0, limit=10, sort='asc'):
+            ids = list(range(23))
+
+            if sort == 'desc':
+                ids.reverse()
+
+            return ids[skip:skip + limit]
+
+        self.assertEqual(get_ids(1, skip=0, limit=5), [0, 1, 2, 3, 4])
+        self.assertEqual(get_ids(1, skip=0, limit=5, sort='desc'), [22, 21, 20, 19, 18])
+
+        get_ids.invalidate(1, sort='desc')
+
+        self.assertEqual(self.cacher.backend.get(get_ids.get_ranged_cache_keys(1, skip=0, limit=5,
+                                                                               sort='desc')[0]), None)
+        self.assertTrue(self.cacher.backend.get(get_ids.get_ranged_cache_keys(1, skip=0, limit=5)[0])
+                        is not None)
+
+        batcher = self.cacher.create_batcher()
+
+        with batcher:
+            get_ids.register(1, skip=0, limit=5, sort='desc')
+
+        self.assertTrue(get_ids.build_ranged_cache_key(1, start=0, end=5, sort='desc')
+                        in batcher.get_keys())
+
+    def test_long_keys_stay_valid(self):
+
+        arg = 'x' * 235
+
+        keys = (self.decorated_func.get_ranged_cache_keys(arg, skip=0, limit=5) +
+                list(self.decorated_func.get_meta_keys(arg)))
+
+        for key in keys:
+            self.assertTrue(len(key) <= 250)
+
+        self.assertEqual(len(set(keys)), 3)
+        self.assertEqual(self.decorated_func(arg, skip=0, limit=5), list(range(5)))
 
     def test_cache_stores_correct_values(self):
         
         self.decorated_func(1, skip=0, limit=15)
         
-        self.assertEqual(self.cacher.get("mock.testing:1[0:5]"), [1, 2, 3, 4, 5])
-        self.assertEqual(self.cacher.get("mock.testing:1[6:10]"), [1, 2, 3, 4, 5])
-        self.assertEqual(self.cacher.get("mock.testing:1[11:15]"), [1, 2, 3, 4, 5])
+        #chunks are stored along with the version of the list
+        self.assertEqual(self.cacher.get("mock.testing:1[0:5]")[1], [0, 1, 2, 3, 4])
+        self.assertEqual(self.cacher.get("mock.testing:1[5:10]")[1], [5, 6, 7, 8, 9])
+        self.assertEqual(self.cacher.get("mock.testing:1[10:15]")[1], [10, 11, 12, 13, 14])
+
+        self.assertEqual(self.cacher.get("mock.testing:1[meta]")['chunks'], 3)
+
+    def test_meta_knows_the_end_of_the_list(self):
+
+        self.decorated_func(1, skip=20, limit=5)
+
+        self.assertEqual(self.cacher.get("mock.testing:1[meta]")['length'], 23)
+
+        self.func.reset_mock()
+
+        #nothing is computed past the end
+        self.assertEqual(self.decorated_func(1, skip=25, limit=10), [])
+        self.assertEqual(self.func.call_count, 0)
 
     def test_register(self):
         
@@ -141,7 +316,7 @@ class CachedListFunctionDecoratorTestCase(unittest.TestCase):
             
         #Test the internal ranged cache keys
         self.assertTrue('mock.testing:1[0:5]' in batcher.get_keys())
-        self.assertTrue('mock.testing:1[6:10]' in batcher.get_keys())
+        self.assertTrue('mock.testing:1[5:10]' in batcher.get_keys())
 
         hook_mock.assert_called_with('mock.testing:1', batcher)
 
@@ -158,10 +333,43 @@ class CachedListFunctionDecoratorTestCase(unittest.TestCase):
         
         #After invalidation, the backend shouldn't have anything.
         self.assertEqual(self.cacher.backend.get('mock.testing:1[0:5]'), None)
-        self.assertEqual(self.cacher.backend.get('mock.testing:1[6:10]'), None)
+        self.assertEqual(self.cacher.backend.get('mock.testing:1[5:10]'), None)
 
         hook_mock.assert_called_with('mock.testing:1')
 
+    def test_invalidate_deep_pages(self):
+
+        self.decorated_func(1, skip=0, limit=5)
+        self.decorated_func(1, skip=15, limit=5)
+
+        self.cacher.backend = Mock(wraps=self.cacher.backend)
+
+        self.decorated_func.invalidate(1)
+
+        self.assertEqual(self.cacher.backend.multi_delete.call_count, 1)
+        self.assertEqual(self.cacher.backend.get('mock.testing:1[15:20]'), None)
+
+        self.func.reset_mock()
+        self.decorated_func(1, skip=0, limit=20)
+
+        self.assertEqual(self.func.call_count, 1)
+
+    def test_chunks_of_an_invalidated_version_are_misses(self):
+
+        self.decorated_func(1, skip=0, limit=5)
+
+        chunk = self.cacher.backend.get('mock.testing:1[0:5]')
+
+        self.decorated_func.invalidate(1)
+
+        #e.g. stored by a call that started before the invalidation
+        self.cacher.backend.set('mock.testing:1[0:5]', chunk)
+
+        self.func.reset_mock()
+        self.decorated_func(1, skip=0, limit=5)
+
+        self.assertEqual(self.func.call_count, 1)
+
 class DecoratedFunctionsTestCase(unittest.TestCase):
     
     def setUp(self):
@@ -199,3 +407,201 @@ class DecoratedFunctionsTestCase(unittest.TestCase):
         self.decorated_function.invalidate(1, 2)
 
         assert on_invalidate.call_count == 1
+
+class NamespaceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = Mock(wraps=LocalBackend())
+        self.cacher = Cacher(backend=self.backend)
+
+        self.func = Mock(side_effect=lambda uid, bid: uid + bid)
+        self.func.__name__ = 'get_user_board'
+
+        self.decorated_func = CachedFunctionDecorator(self.func, cacher=self.cacher,
+                                                      namespaces=lambda uid, bid: ['user:%s' % uid])
+
+    def test_invalidate_all(self):
+        self.decorated_func(1, 2)
+        self.decorated_func(2, 2)
+
+        self.decorated_func.invalidate_all()
+
+        self.decorated_func(1, 2)
+        self.decorated_func(2, 2)
+
+        self.assertEqual(self.func.call_count, 4)
+
+    def test_invalidate_namespace(self):
+        self.decorated_func(1, 2)
+        self.decorated_func(2, 2)
+
+        self.cacher.invalidate_namespace('user:1')
+
+        self.decorated_func(1, 2)
+        self.decorated_func(2, 2)
+
+        #only user 1's value was recomputed
+        self.assertEqual(self.func.call_count, 3)
+
+    def test_evicted_generation_never_goes_back(self):
+        self.decorated_func(1, 2)
+
+        key = self.cacher.generation_key('user:1')
+        generation = self.backend.get(key)
+
+        self.backend.delete(key)
+        time.sleep(0.002)
+        self.decorated_func(1, 2)
+
+        self.assertTrue(self.backend.get(key) > generation)
+        self.assertEqual(self.func.call_count, 2)
+
+    def test_not_namespaced(self):
+        decorated_func = CachedFunctionDecorator(self.func, cacher=self.cacher)
+
+        self.assertRaises(NotNamespacedFunctionException, decorated_func.invalidate_all)
+
+    def test_batched_generations(self):
+        self.decorated_func(1, 2)
+        self.backend.reset_mock()
+
+        batcher = self.cacher.create_batcher()
+
+        with batcher:
+            for uid in range(5):
+                self.decorated_func.register(uid, 2)
+
+        batcher.batch()
+
+        #the generations first, then the values
+        self.assertEqual(self.backend.multi_get.call_count, 2)
+
+        with batcher:
+            self.assertEqual(self.decorated_func(1, 2), 3)
+
+        self.assertEqual(self.backend.get.call_count, 0)
+        self.assertEqual(self.func.call_count, 1)
+
+class TagsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = Mock(wraps=LocalBackend())
+        self.cacher = Cacher(backend=self.backend)
+
+        self.func = Mock(side_effect=lambda uid, bid: uid + bid)
+        self.func.__name__ = 'is_user_board_subscriber'
+
+        self.decorated_func = CachedFunctionDecorator(
+                self.func, cacher=self.cacher,
+                tags=lambda uid, bid: ['user:%s' % uid, 'board:%s' % bid])
+
+    def test_cached(self):
+        self.decorated_func(1, 2)
+        self.backend.reset_mock()
+
+        self.assertEqual(self.decorated_func(1, 2), 3)
+
+        #the value and its tag versions in one round-trip
+        self.assertEqual(self.backend.multi_get.call_count, 1)
+        self.assertEqual(self.backend.get.call_count, 0)
+        self.assertEqual(self.func.call_count, 1)
+
+    def test_invalidate_tags(self):
+        self.decorated_func(1, 2)
+        self.decorated_func(1, 3)
+        self.decorated_func(2, 3)
+
+        hook = Mock()
+        self.cacher.add_hook('invalidate', hook)
+
+        self.cacher.invalidate_tags('board:3')
+
+        hook.assert_called_with(self.cacher.tag_key('board:3'))
+
+        self.decorated_func(1, 2)
+        self.decorated_func(1, 3)
+        self.decorated_func(2, 3)
+
+        self.assertEqual(self.func.call_count, 5)
+
+    def test_missing_tag_is_invalid(self):
+        self.decorated_func(1, 2)
+
+        self.backend.delete(self.cacher.tag_key('user:1'))
+
+        self.decorated_func(1, 2)
+        self.decorated_func(1, 2)
+
+        self.assertEqual(self.func.call_count, 2)
+
+    def test_batched_tags(self):
+        self.decorated_func(1, 2)
+        self.backend.reset_mock()
+
+        batcher = self.cacher.create_batcher()
+
+        with batcher:
+            self.decorated_func.register(1, 2)
+
+        batcher.batch()
+
+        with batcher:
+            self.assertEqual(self.decorated_func(1, 2), 3)
+
+        self.assertEqual(self.backend.multi_get.call_count, 1)
+
+class RefreshAheadTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cacher = Cacher(backend=LocalBackend())
+        self.counter = [0]
+
+        def func(a):
+            time.sleep(0.01)
+            self.counter[0] += 1
+            return self.counter[0]
+
+        self.func = func
+
+    def wait_for_refreshes(self):
+        for thread in threading.enumerate():
+            if thread is not threading.current_thread() and thread.daemon:
+                thread.join(1)
+
+    def test_stale_while_revalidate(self):
+        decorated_func = self.cacher.cache(stale_after=0.01)(self.func)
+
+        self.assertEqual(decorated_func(1), 1)
+
+        time.sleep(0.02)
+
+        #the stale value is served while the refresh runs in the background
+        self.assertEqual(decorated_func(1), 1)
+
+        self.wait_for_refreshes()
+
+        self.assertEqual(decorated_func(1), 2)
+        self.assertEqual(self.counter[0], 2)
+
+    def test_fresh_value_is_not_refreshed(self):
+        decorated_func = self.cacher.cache(stale_after=60)(self.func)
+
+        decorated_func(1)
+        decorated_func(1)
+
+        self.assertEqual(self.counter[0], 1)
+
+    def test_early_refresh(self):
+        #a huge beta makes the early refresh certain
+        decorated_func = self.cacher.cache(expires=60, early_refresh=1e9)(self.func)
+
+        self.assertEqual(decorated_func(1), 1)
+        self.assertEqual(decorated_func(1), 2)
+
+    def test_no_early_refresh_far_from_expiry(self):
+        decorated_func = self.cacher.cache(expires=60, early_refresh=1.0)(self.func)
+
+        decorated_func(1)
+        decorated_func(1)
+
+        self.assertEqual(self.counter[0], 1)
@@ -0,0 +1,154 @@
+import unittest
+import socket
+import time
+
+from pycacher.fakememcache import FakeMemcacheServer, _Item
+
+class FakeMemcacheServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeMemcacheServer().start()
+
+        self.socket = socket.create_connection((self.server.host, self.server.port), timeout=5)
+        self.file = self.socket.makefile('rb')
+
+    def tearDown(self):
+        self.file.close()
+        self.socket.close()
+        self.server.stop()
+
+    def command(self, data, lines=1):
+        self.socket.sendall(data)
+        return b''.join(self.file.readline() for i in range(lines))
+
+    def test_set_get(self):
+        self.assertEqual(self.command(b'set testkey 5 0 9\r\ntestvalue\r\n'), b'STORED\r\n')
+        self.assertEqual(self.command(b'get testkey otherkey\r\n', 3),
+                         b'VALUE testkey 5 9\r\ntestvalue\r\nEND\r\n')
+
+    def test_add_replace(self):
+        self.assertEqual(self.command(b'replace testkey 0 0 1\r\na\r\n'), b'NOT_STORED\r\n')
+        self.assertEqual(self.command(b'add testkey 0 0 1\r\na\r\n'), b'STORED\r\n')
+        self.assertEqual(self.command(b'add testkey 0 0 1\r\nb\r\n'), b'NOT_STORED\r\n')
+
+    def test_incr_decr_delete(self):
+        self.assertEqual(self.command(b'incr testkey 1\r\n'), b'NOT_FOUND\r\n')
+
+        self.command(b'set testkey 0 0 1\r\n5\r\n')
+
+        self.assertEqual(self.command(b'incr testkey 10\r\n'), b'15\r\n')
+        self.assertEqual(self.command(b'decr testkey 20\r\n'), b'0\r\n')
+        self.assertEqual(self.command(b'delete testkey\r\n'), b'DELETED\r\n')
+        self.assertEqual(self.command(b'delete testkey\r\n'), b'NOT_FOUND\r\n')
+
+    def test_expired_item(self):
+        self.command(b'set testkey 0 %d 1\r\na\r\n' % (time.time() - 1))
+
+        self.assertEqual(self.command(b'get testkey\r\n'), b'END\r\n')
+
+    def test_gets_cas(self):
+        self.command(b'set testkey 0 0 1\r\na\r\n')
+
+        header = self.command(b'gets testkey\r\n', 3).split(b'\r\n')[0]
+        cas_unique = header.split()[4]
+
+        self.assertEqual(self.command(b'cas testkey 0 0 1 %s\r\nb\r\n' % cas_unique), b'STORED\r\n')
+        self.assertEqual(self.command(b'cas testkey 0 0 1 %s\r\nc\r\n' % cas_unique), b'EXISTS\r\n')
+        self.assertEqual(self.command(b'cas otherkey 0 0 1 1\r\nc\r\n'), b'NOT_FOUND\r\n')
+        self.assertEqual(self.command(b'get testkey\r\n', 3), b'VALUE testkey 0 1\r\nb\r\nEND\r\n')
+
+    def test_append_prepend_touch(self):
+        self.command(b'set testkey 0 0 1\r\nb\r\n')
+        self.command(b'append testkey 0 0 1\r\nc\r\n')
+        self.command(b'prepend testkey 0 0 1\r\na\r\n')
+
+        self.assertEqual(self.command(b'get testkey\r\n', 3), b'VALUE testkey 0 3\r\nabc\r\nEND\r\n')
+        self.assertEqual(self.command(b'touch testkey -1\r\n'), b'TOUCHED\r\n')
+        self.assertEqual(self.command(b'get testkey\r\n'), b'END\r\n')
+
+    def test_meta_commands(self):
+        self.assertEqual(self.command(b'mg testkey v\r\n'), b'EN\r\n')
+        self.assertEqual(self.command(b'ms testkey 2 T60 F3\r\nhi\r\n'), b'HD\r\n')
+        self.assertEqual(self.command(b'mg testkey v f t\r\n', 2), b'VA 2 f3 t60\r\nhi\r\n')
+        self.assertEqual(self.command(b'ms testkey 2 ME\r\nho\r\n'), b'NS\r\n')
+        self.assertEqual(self.command(b'md testkey q\r\nmn\r\n'), b'MN\r\n')
+        self.assertEqual(self.command(b'md testkey\r\n'), b'NF\r\n')
+
+    def test_meta_arithmetic(self):
+        self.assertEqual(self.command(b'ma testcounter\r\n'), b'NF\r\n')
+        self.assertEqual(self.command(b'ma testcounter N0 J10 v\r\n', 2), b'VA 2\r\n10\r\n')
+        self.assertEqual(self.command(b'ma testcounter D5 MD v\r\n', 2), b'VA 1\r\n5\r\n')
+
+    def test_lru_eviction(self):
+        server = FakeMemcacheServer(max_bytes=1000)
+
+        for i in range(10):
+            server.store.set(b'key%d' % i, _Item(0, 0, b'x' * 100))
+
+            #key0 stays the most recently used
+            server.store.get(b'key0')
+
+        self.assertTrue(server.store.bytes <= 1000)
+        self.assertTrue(server.store.get(b'key0') is not None)
+        self.assertEqual(server.store.get(b'key1'), None)
+        self.assertTrue(server.store.evictions > 0)
+
+    def test_too_large_item(self):
+        self.server.max_item_size = 100
+
+        self.assertEqual(self.command(b'set testkey 0 0 200\r\n%s\r\n' % (b'x' * 200)),
+                         b'SERVER_ERROR object too large for cache\r\n')
+
+    def test_invalid_keys(self):
+        long_key = b'k' * 251
+
+        self.assertEqual(self.command(b'set %s 0 0 1\r\na\r\n' % long_key),
+                         b'CLIENT_ERROR bad command line format\r\n')
+        self.assertEqual(self.command(b'get testkey %s\r\n' % long_key),
+                         b'CLIENT_ERROR bad command line format\r\n')
+        self.assertEqual(self.command(b'mg test\x01key v\r\n'),
+                         b'CLIENT_ERROR bad command line format\r\n')
+
+        #the data block of the refused set was swallowed, and a key at the limit works
+        self.assertEqual(self.command(b'set %s 0 0 1\r\na\r\n' % long_key[1:]), b'STORED\r\n')
+
+    def test_latency(self):
+        self.server.latency = 0.05
+
+        start = time.time()
+
+        #pipelined commands are delayed together
+        self.command(b'get a\r\nget b\r\nget c\r\n', 3)
+
+        self.assertTrue(0.05 <= time.time() - start < 0.15)
+
+    def test_injected_errors(self):
+        self.server.failure_rate = 1
+
+        self.assertEqual(self.command(b'set testkey 0 0 1\r\na\r\n'),
+                         b'SERVER_ERROR injected failure\r\n')
+
+        self.server.failure_rate = 0
+
+        self.assertEqual(self.command(b'get testkey\r\n'), b'END\r\n')
+        self.assertEqual(self.server.stats()['injected_failures'], 1)
+
+    def test_injected_disconnects(self):
+        self.server.failure_rate = 1
+        self.server.failure_mode = 'disconnect'
+
+        self.assertEqual(self.command(b'get testkey\r\n'), b'')
+
+    def test_stats(self):
+        self.command(b'set testkey 0 0 1\r\na\r\n')
+        self.command(b'get testkey otherkey\r\n', 3)
+
+        self.socket.sendall(b'stats\r\n')
+        stats = b''.join(iter(self.file.readline, b'END\r\n'))
+
+        self.assertTrue(b'STAT get_hits 1\r\n' in stats)
+        self.assertTrue(b'STAT get_misses 1\r\n' in stats)
+        self.assertTrue(b'STAT curr_items 1\r\n' in stats)
+
+    def test_unknown_command(self):
+        self.assertEqual(self.command(b'frobnicate\r\n'), b'ERROR\r\n')
@@ -0,0 +1,120 @@
+import unittest
+
+from mock import Mock
+
+from pycacher import Cacher
+from pycacher.backends import LocalBackend
+from pycacher.hooks import Hooks, SamplingProfiler, PHASES
+from pycacher.exceptions import InvalidHookEventException
+
+class HooksTestCase(unittest.TestCase):
+
+    def test_no_dispatcher_without_hooks(self):
+        hooks = Hooks()
+
+        self.assertEqual(hooks.on_call, None)
+
+        hooks.trigger('call', 'testkey')
+
+    def test_single_hook_is_the_dispatcher(self):
+        hooks = Hooks()
+        hook = Mock()
+
+        hooks.add('call', hook)
+
+        self.assertTrue(hooks.on_call is hook)
+
+    def test_dispatch_to_all_hooks(self):
+        hooks = Hooks()
+        first, second = Mock(), Mock()
+
+        hooks.add('invalidate', first)
+        hooks.add('invalidate', second)
+
+        hooks.trigger('invalidate', 'testkey')
+
+        first.assert_called_with('testkey')
+        second.assert_called_with('testkey')
+
+        hooks.remove('invalidate', first)
+        self.assertTrue(hooks.on_invalidate is second)
+
+        hooks.remove_all('invalidate')
+        self.assertEqual(hooks.on_invalidate, None)
+
+    def test_invalid_event(self):
+        hooks = Hooks()
+
+        self.assertRaises(InvalidHookEventException, hooks.add, 'wrong', Mock())
+        self.assertRaises(InvalidHookEventException, hooks.trigger, 'wrong')
+
+    def test_decorator_runs_call_hooks(self):
+        cacher = Cacher(backend=LocalBackend())
+        hook = Mock()
+
+        @cacher.cache()
+        def test_func(a):
+            return a
+
+        cacher.add_hook('call', hook)
+        test_func(1)
+
+        hook.assert_called_with(test_func.build_cache_key(1))
+
+        cacher.remove_hook('call', hook)
+        test_func(1)
+
+        self.assertEqual(hook.call_count, 1)
+
+class SamplingProfilerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.callback = Mock()
+        self.profiler = SamplingProfiler(sample_rate=1, callback=self.callback)
+        self.cacher = Cacher(backend=LocalBackend(), profiler=self.profiler)
+
+        @self.cacher.cache()
+        def get_user(uid):
+            return {'id': uid}
+
+        self.get_user = get_user
+
+    def test_phases_of_a_miss_and_a_hit(self):
+        self.get_user(1)
+
+        name, timings = self.callback.call_args[0]
+
+        self.assertEqual(name, self.get_user.namespace)
+        self.assertEqual(sorted(timings), sorted(['key_build', 'lookup', 'compute', 'store']))
+
+        self.get_user(1)
+
+        name, timings = self.callback.call_args[0]
+
+        self.assertEqual(sorted(timings), sorted(['key_build', 'lookup', 'deserialize']))
+
+        snapshot = self.profiler.snapshot()[self.get_user.namespace]
+
+        self.assertEqual(sorted(snapshot), sorted(PHASES))
+        self.assertEqual(snapshot['lookup']['count'], 2)
+        self.assertEqual(snapshot['compute']['count'], 1)
+
+    def test_nested_functions_are_timed_separately(self):
+
+        @self.cacher.cache()
+        def get_profile(uid):
+            return {'user': self.get_user(uid)}
+
+        get_profile(1)
+
+        names = [args[0][0] for args in self.callback.call_args_list]
+
+        self.assertEqual(names, [self.get_user.namespace, get_profile.namespace])
+
+    def test_sample_rate(self):
+        self.profiler.sample_rate = 0
+
+        self.get_user(1)
+
+        self.assertFalse(self.callback.called)
+        self.assertEqual(self.profiler.snapshot(), {})
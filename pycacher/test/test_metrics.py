@@ -0,0 +1,93 @@
+import unittest
+import threading
+
+from pycacher import Cacher
+from pycacher.backends import LocalBackend
+from pycacher.metrics import Metrics, MeteredBackend, BackendStats
+
+class MetricsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics()
+        self.cacher = Cacher(backend=LocalBackend(), metrics=self.metrics)
+
+        @self.cacher.cache()
+        def get_user(uid):
+            return {'id': uid}
+
+        self.get_user = get_user
+
+    def test_function_stats(self):
+        self.get_user(1)
+        self.get_user(1)
+        self.get_user(1)
+        self.get_user(2)
+
+        stats = self.metrics.snapshot()['functions'][self.get_user.namespace]
+
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['hit_ratio'], 0.5)
+        self.assertEqual(stats['compute_seconds']['count'], 2)
+        self.assertTrue(stats['bytes_read'] > 0)
+        self.assertTrue(stats['bytes_written'] > 0)
+
+    def test_backend_stats(self):
+        self.get_user(1)
+
+        self.cacher.backend.multi_get(['a', 'b', 'c'])
+
+        stats = self.metrics.snapshot()['backends']['LocalBackend']
+
+        self.assertEqual(stats['get_seconds']['count'], 1)
+        self.assertEqual(stats['set_seconds']['count'], 1)
+        self.assertEqual(stats['multi_get_seconds']['count'], 1)
+        self.assertEqual(stats['batch_size']['sum'], 3)
+
+    def test_counts_from_all_threads(self):
+        stats = BackendStats('test')
+
+        def record():
+            for i in range(1000):
+                stats.incr('bytes_read')
+
+        threads = [threading.Thread(target=record) for i in range(4)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(stats.snapshot()['bytes_read'], 4000)
+
+        #the slots of the exited threads were folded together
+        self.assertEqual(len(stats._shards._shards), 0)
+
+    def test_histogram_buckets_are_cumulative(self):
+        stats = BackendStats('test')
+
+        for size in [1, 3, 3, 2000000]:
+            stats.observe('batch_size', size)
+
+        buckets = dict(stats.snapshot()['batch_size']['buckets'])
+
+        self.assertEqual(buckets[1], 1)
+        self.assertEqual(buckets[5], 3)
+        self.assertEqual(buckets[float('inf')], 4)
+
+    def test_prometheus(self):
+        self.get_user(1)
+        self.get_user(1)
+
+        text = self.metrics.to_prometheus()
+
+        self.assertTrue('pycacher_function_hits_total{function="%s"} 1' % self.get_user.namespace in text)
+        self.assertTrue('# TYPE pycacher_backend_operation_seconds histogram' in text)
+        self.assertTrue('pycacher_backend_operation_seconds_bucket{backend="LocalBackend",operation="get",le="+Inf"} 2'
+                        in text)
+
+    def test_metered_backend_delegates(self):
+        backend = MeteredBackend(LocalBackend(), BackendStats('test'))
+
+        self.assertEqual(backend.get_stats()['items'], 0)
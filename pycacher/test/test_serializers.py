@@ -0,0 +1,152 @@
+import unittest
+import pickle
+
+from pycacher import Cacher
+from pycacher.backends import LocalBackend
+from pycacher.exceptions import UnknownSerializerException, UnknownCompressorException
+from pycacher.compression import ZlibCompressor, LZMACompressor, get_compressor
+from pycacher import serializers
+from pycacher.serializers import (PickleSerializer, MarshalSerializer, JSONSerializer,
+                                  MsgpackSerializer, get_serializer)
+
+VALUE = {'ids': [1, 2, 3], 'name': 'test', 'score': 1.5, 'active': True, 'parent': None}
+
+class SerializersTestCase(unittest.TestCase):
+
+    def assertRoundTrips(self, serializer):
+        data = serializers.dumps(VALUE, serializer)
+
+        self.assertEqual(data[0], serializer.format_id)
+        self.assertEqual(serializers.loads(data), VALUE)
+
+    def test_pickle(self):
+        self.assertRoundTrips(PickleSerializer())
+
+    def test_marshal(self):
+        self.assertRoundTrips(MarshalSerializer())
+
+    def test_json(self):
+        self.assertRoundTrips(JSONSerializer())
+
+    def test_msgpack(self):
+        if serializers.msgpack is None:
+            self.assertRaises(UnknownSerializerException, MsgpackSerializer)
+        else:
+            self.assertRoundTrips(MsgpackSerializer())
+
+    def test_headerless_pickles_are_readable(self):
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            self.assertEqual(serializers.loads(pickle.dumps(VALUE, protocol)), VALUE)
+
+    def test_get_serializer(self):
+        self.assertTrue(isinstance(get_serializer('json'), JSONSerializer))
+
+        serializer = MarshalSerializer()
+        self.assertTrue(get_serializer(serializer) is serializer)
+
+        self.assertRaises(UnknownSerializerException, get_serializer, 'yaml')
+
+class CacherSerializerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cacher = Cacher(backend=LocalBackend(), serializer='json')
+
+    def test_cacher_serializer(self):
+        self.cacher.set('testkey', VALUE)
+
+        self.assertEqual(self.cacher.backend.get('testkey')[0], JSONSerializer.format_id)
+        self.assertEqual(self.cacher.get('testkey'), VALUE)
+
+    def test_function_serializer(self):
+
+        @self.cacher.cache(serializer='marshal')
+        def cached_function(a):
+            return [a]
+
+        cached_function(1)
+
+        data = self.cacher.backend.get(cached_function.build_cache_key(1))
+
+        self.assertEqual(data[0], MarshalSerializer.format_id)
+        self.assertEqual(cached_function(1), [1])
+
+class EnvelopeSerializerTestCase(unittest.TestCase):
+    """Values with refresh metadata or tags are readable with every
+    serializer."""
+
+    def serializer_names(self):
+        names = ['pickle', 'marshal', 'json']
+
+        if serializers.msgpack is not None:
+            names.append('msgpack')
+
+        return names
+
+    def assertCachedOnce(self, serializer, **options):
+        cacher = Cacher(backend=LocalBackend(), serializer=serializer)
+        calls = []
+
+        @cacher.cache(**options)
+        def cached_function(a):
+            calls.append(a)
+            return {'ids': [a, a + 1]}
+
+        self.assertEqual(cached_function(1), {'ids': [1, 2]})
+        self.assertEqual(cached_function(1), {'ids': [1, 2]})
+        self.assertEqual(calls, [1])
+
+        return cacher, cached_function, calls
+
+    def test_stale_after(self):
+        for serializer in self.serializer_names():
+            self.assertCachedOnce(serializer, stale_after=60)
+
+    def test_early_refresh(self):
+        for serializer in self.serializer_names():
+            self.assertCachedOnce(serializer, expires=60, early_refresh=0.0)
+
+    def test_tags(self):
+        for serializer in self.serializer_names():
+            cacher, cached_function, calls = self.assertCachedOnce(
+                    serializer, stale_after=60, tags=lambda a: ['user:%s' % a])
+
+            cacher.invalidate_tags('user:1')
+
+            self.assertEqual(cached_function(1), {'ids': [1, 2]})
+            self.assertEqual(calls, [1, 1])
+
+class CompressionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.value = list(range(10000))
+
+    def test_compressed_round_trip(self):
+        for compressor in (ZlibCompressor(), LZMACompressor()):
+            data = serializers.dumps(self.value, PickleSerializer(), compressor)
+
+            self.assertEqual(data[0] >> 3, compressor.compressor_id)
+            self.assertTrue(len(data) < len(serializers.dumps(self.value, PickleSerializer())))
+            self.assertEqual(serializers.loads(data), self.value)
+
+    def test_threshold(self):
+        data = serializers.dumps([1, 2, 3], PickleSerializer(), ZlibCompressor(threshold=1024))
+
+        self.assertEqual(data[0], PickleSerializer.format_id)
+
+    def test_function_compressor(self):
+        cacher = Cacher(backend=LocalBackend())
+
+        @cacher.cache(compressor=ZlibCompressor(level=9, threshold=16))
+        def cached_function(n):
+            return list(range(n))
+
+        cached_function(1000)
+
+        data = cacher.backend.get(cached_function.build_cache_key(1000))
+
+        self.assertEqual(data[0] >> 3, ZlibCompressor.compressor_id)
+        self.assertEqual(cached_function(1000), list(range(1000)))
+
+    def test_get_compressor(self):
+        self.assertTrue(isinstance(get_compressor('lzma'), LZMACompressor))
+        self.assertRaises(UnknownCompressorException, get_compressor, 'snappy')
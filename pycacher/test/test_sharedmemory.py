@@ -0,0 +1,138 @@
+import unittest
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from pycacher import Cacher
+from pycacher.sharedmemory import SharedMemoryBackend
+
+from .test_backends import BaseBackendTestCaseMixin
+
+def _incr_many(path, times):
+    backend = SharedMemoryBackend(path)
+
+    for i in range(times):
+        backend.incr('testcounter')
+
+    backend.close()
+
+class SharedMemoryBackendTestCase(unittest.TestCase, BaseBackendTestCaseMixin):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache')
+
+        self.backend = self.open()
+
+    def tearDown(self):
+        self.backend.close()
+        shutil.rmtree(self.directory)
+
+    def open(self, **kwargs):
+        options = {'size': 4 * 1024 * 1024, 'max_items': 1000, 'stripes': 8,
+                   'page_size': 64 * 1024}
+        options.update(kwargs)
+
+        return SharedMemoryBackend(self.path, **options)
+
+    def test_value_types(self):
+        for value in [b'bytes', 'text', 42, {'a': [1, 2]}, None]:
+            self.backend.set('testkey', value)
+            self.assertEqual(self.backend.get('testkey'), value)
+
+    def test_add(self):
+        self.assertTrue(self.backend.add('testkey', 'testvalue'))
+        self.assertFalse(self.backend.add('testkey', 'othervalue'))
+        self.assertEqual(self.backend.get('testkey'), 'testvalue')
+
+    def test_expires(self):
+        self.backend.set('testkey', 'testvalue', expires=-1)
+
+        self.assertEqual(self.backend.get('testkey'), None)
+        self.assertTrue(self.backend.add('testkey', 'testvalue'))
+
+    def test_values_are_copied(self):
+        self.backend.set('testkey', b'x' * 2000)
+
+        self.assertTrue(isinstance(self.backend.get('testkey'), bytes))
+
+    def test_too_large_value(self):
+        self.assertFalse(self.backend.set('testkey', b'x' * (64 * 1024)))
+        self.assertEqual(self.backend.get('testkey'), None)
+
+    def test_eviction(self):
+        for i in range(2000):
+            self.assertTrue(self.backend.set('testkey%s' % i, b'x' * 4000))
+
+        stats = self.backend.get_stats()
+
+        self.assertTrue(stats['evictions'] > 0)
+        self.assertEqual(stats['used_pages'], stats['pages'])
+
+        #the latest entries are still there
+        self.assertEqual(self.backend.get('testkey1999'), b'x' * 4000)
+
+    def test_pages_move_to_the_classes_that_need_them(self):
+        self.backend.close()
+        os.remove(self.path)
+
+        self.backend = self.open(size=512 * 1024, max_items=8000, page_size=4096)
+
+        #small values take every page
+        for i in range(3000):
+            self.assertTrue(self.backend.set('testkey%s' % i, b'x' * 10))
+
+        stats = self.backend.get_stats()
+        self.assertEqual(stats['used_pages'], stats['pages'])
+
+        self.assertTrue(self.backend.set('bigkey', b'y' * 4000))
+        self.assertEqual(self.backend.get('bigkey'), b'y' * 4000)
+        self.assertEqual(self.backend.get_stats()['page_moves'], 1)
+
+        #only the small values of the moved page were evicted
+        values = self.backend.multi_get(['testkey%s' % i for i in range(3000)])
+        self.assertEqual(len(values), stats['items'] - 64)
+        self.assertTrue(self.backend.set('testkey0', b'x' * 10))
+
+    def test_shared_with_another_instance(self):
+        self.backend.set('testkey', 'testvalue')
+
+        other = SharedMemoryBackend(self.path)
+
+        self.assertEqual(other.get('testkey'), 'testvalue')
+        self.assertEqual(other.stripes, 8)
+
+        other.delete('testkey')
+
+        self.assertEqual(self.backend.get('testkey'), None)
+
+        self.backend.set('testkey', 'testvalue')
+        self.backend.clear()
+
+        self.assertEqual(other.get('testkey'), None)
+
+    def test_incr_across_processes(self):
+        self.backend.set('testcounter', 0)
+
+        processes = [multiprocessing.Process(target=_incr_many, args=(self.path, 200))
+                     for i in range(4)]
+
+        for process in processes:
+            process.start()
+
+        for process in processes:
+            process.join()
+
+        self.assertEqual(self.backend.get('testcounter'), 800)
+
+    def test_cached_function(self):
+        cacher = Cacher(backend=self.backend)
+
+        @cacher.cache()
+        def get_rows(n):
+            return [{'id': i, 'name': 'row%s' % i} for i in range(n)]
+
+        rows = get_rows(100)
+
+        self.assertEqual(get_rows(100), rows)
@@ -0,0 +1,158 @@
+import unittest
+import pickle
+import threading
+import time
+
+import memcache
+from mock import Mock
+
+from pycacher import Cacher
+from pycacher.backends import LocalBackend, MemcacheBackend
+from pycacher.fakememcache import FakeMemcacheServer
+from pycacher.stampede import SingleFlight, Lease
+
+class SingleFlightTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.flights = SingleFlight()
+
+    def run_concurrently(self, fn, n=5):
+        results = []
+
+        def target():
+            results.append(fn())
+
+        threads = [threading.Thread(target=target) for i in range(n)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        return results
+
+    def test_coalesces_concurrent_calls(self):
+
+        compute = Mock(side_effect=lambda: time.sleep(0.05) or 'value')
+
+        results = self.run_concurrently(lambda: self.flights.do('key', compute))
+
+        self.assertEqual(results, ['value'] * 5)
+        self.assertEqual(compute.call_count, 1)
+        self.assertFalse(self.flights.in_flight('key'))
+
+    def test_followers_share_errors(self):
+
+        def compute():
+            time.sleep(0.05)
+            raise ValueError()
+
+        errors = []
+
+        def call():
+            try:
+                self.flights.do('key', compute)
+            except ValueError:
+                errors.append(True)
+
+        self.run_concurrently(call, n=3)
+
+        self.assertEqual(len(errors), 3)
+
+class LeaseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = LocalBackend()
+
+    def test_only_one_holder(self):
+        lease = Lease(self.backend, 'key', timeout=10)
+        other_lease = Lease(self.backend, 'key', timeout=10)
+
+        self.assertTrue(lease.acquire())
+        self.assertFalse(other_lease.acquire())
+
+        lease.release()
+
+        self.assertTrue(other_lease.acquire())
+
+    def test_wait_for_holder(self):
+        lease = Lease(self.backend, 'key', timeout=10)
+        lease.acquire()
+
+        def hold():
+            time.sleep(0.05)
+            self.backend.set('key', 'value')
+            lease.release()
+
+        threading.Thread(target=hold).start()
+
+        self.assertEqual(Lease(self.backend, 'key', timeout=10).wait(1), 'value')
+
+    def test_key_at_length_limit(self):
+        server = FakeMemcacheServer().start()
+        client = memcache.Client(['%s:%s' % (server.host, server.port)])
+
+        try:
+            backend = MemcacheBackend(client)
+            key = 'k' * 250
+
+            lease = Lease(backend, key, timeout=10)
+
+            self.assertTrue(len(lease.lease_key) <= 250)
+            self.assertTrue(lease.acquire())
+            self.assertFalse(Lease(backend, key, timeout=10).acquire())
+
+            lease.release()
+
+            self.assertTrue(Lease(backend, key, timeout=10).acquire())
+        finally:
+            client.disconnect_all()
+            server.stop()
+
+class StampedeProtectedFunctionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cacher = Cacher(backend=LocalBackend())
+        self.func = Mock(side_effect=lambda a: time.sleep(0.05) or a * 2)
+        self.func.__name__ = 'testing'
+
+    def test_single_flight(self):
+        decorated_func = self.cacher.cache(single_flight=True)(self.func)
+
+        threads = [threading.Thread(target=decorated_func, args=(1,)) for i in range(5)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.func.call_count, 1)
+        self.assertEqual(decorated_func(1), 2)
+
+    def test_waits_for_lease_holder(self):
+        decorated_func = self.cacher.cache(lease_timeout=10, lease_wait=1)(self.func)
+        cache_key = decorated_func.build_cache_key(1)
+
+        #simulate another process holding the lease on the key
+        lease = Lease(self.cacher.backend, cache_key, timeout=10)
+        lease.acquire()
+
+        def hold():
+            time.sleep(0.05)
+            self.cacher.backend.set(cache_key, pickle.dumps('from-other-process'))
+            lease.release()
+
+        threading.Thread(target=hold).start()
+
+        self.assertEqual(decorated_func(1), 'from-other-process')
+        self.assertEqual(self.func.call_count, 0)
+
+    def test_computes_when_lease_wait_runs_out(self):
+        decorated_func = self.cacher.cache(lease_timeout=10, lease_wait=0.05)(self.func)
+
+        Lease(self.cacher.backend, decorated_func.build_cache_key(1), timeout=10).acquire()
+
+        self.assertEqual(decorated_func(1), 2)
+        self.assertEqual(self.func.call_count, 1)
@@ -0,0 +1,56 @@
+import unittest
+import gc
+import weakref
+
+from pycacher.utils import default_cache_key_func, canonical_cache_key_func, hash_long_key
+
+def get_user(*args, **kwargs):
+    pass
+
+class CacheKeyFuncTestCase(unittest.TestCase):
+
+    def test_default_key(self):
+        self.assertEqual(default_cache_key_func(get_user, 1, 2),
+                         'pycacher.test.test_utils.get_user:1:2')
+        self.assertEqual(default_cache_key_func(get_user, 1, fields='name', active=True),
+                         'pycacher.test.test_utils.get_user:1:active=True:fields=name')
+
+    def test_canonical_key_has_no_collisions(self):
+        keys = set([
+            canonical_cache_key_func(get_user, 'a:b'),
+            canonical_cache_key_func(get_user, 'a', 'b'),
+            canonical_cache_key_func(get_user, 1),
+            canonical_cache_key_func(get_user, '1'),
+            canonical_cache_key_func(get_user, a=1),
+            canonical_cache_key_func(get_user, 'a=1'),
+        ])
+
+        self.assertEqual(len(keys), 6)
+
+    def test_canonical_key_sorts_kwargs(self):
+        self.assertEqual(canonical_cache_key_func(get_user, 1, a=1, b=2),
+                         canonical_cache_key_func(get_user, 1, b=2, a=1))
+
+    def test_canonical_key_doesnt_keep_functions_alive(self):
+        func = lambda a: a
+        ref = weakref.ref(func)
+
+        canonical_cache_key_func(func, 1)
+
+        del func
+        gc.collect()
+
+        self.assertEqual(ref(), None)
+        self.assertEqual(canonical_cache_key_func(len, 1), 'builtins.len:1')
+
+    def test_long_keys_are_hashed(self):
+        key = default_cache_key_func(get_user, 'x' * 300)
+
+        self.assertTrue(key.startswith('pycacher.test.test_utils.get_user#'))
+        self.assertTrue(len(key) <= 250)
+        self.assertNotEqual(key, default_cache_key_func(get_user, 'x' * 301))
+
+    def test_invalid_keys_are_hashed(self):
+        self.assertTrue(hash_long_key('get_user:a b').startswith('get_user#'))
+        self.assertFalse(' ' in hash_long_key('get_user:a b'))
+        self.assertFalse('\n' in hash_long_key('get_user:a\nb'))
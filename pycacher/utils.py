@@ -1,5 +1,104 @@
+import hashlib
+import random
+import weakref
 
+#memcached refuses longer keys, and keys with whitespace or control characters
+MAX_KEY_LENGTH = 250
 
-def default_cache_key_func(func, *args):
-    """The default cache key function."""
-    return func.__module__ + '.' + func.__name__ + ':' + ':'.join([str(arg) for arg in args])
+#Weak, so that closures and lambdas don't leak.
+_key_prefixes = weakref.WeakKeyDictionary()
+
+class _Missing(object):
+    """The type of `MISSING`."""
+
+    def __repr__(self):
+        return 'MISSING'
+
+    def __bool__(self):
+        return False
+
+#Tells a miss apart from a cached None.
+MISSING = _Missing()
+
+def default_cache_key_func(func, *args, **kwargs):
+    """The default cache key function.
+
+    Example::
+
+        default_cache_key_func(get_user, 1, fields='name')
+        >> 'app.models.get_user:1:fields=name'
+
+    """
+
+    key = func.__module__ + '.' + func.__name__ + ':' + ':'.join(map(str, args))
+
+    if kwargs:
+        key += ':' + ':'.join(['%s=%s' % (name, kwargs[name]) for name in sorted(kwargs)])
+
+    return hash_long_key(key)
+
+def canonical_cache_key_func(func, *args, **kwargs):
+    """A collision-safe cache key function.
+
+    Example usage::
+
+        cacher = Cacher(cache_key_func=canonical_cache_key_func)
+
+    Args are encoded with `repr`, so that `f('a:b')` and `f('a', 'b')`, or
+    `f(1)` and `f('1')`, get different keys (unlike with the default key
+    function). kwargs are encoded sorted by name. Note that `f(1, b=2)` and
+    `f(1, 2)` still get different keys, since binding them to the function
+    signature on every call would be too slow.
+
+    The args of a cached function need a `repr` that's stable across
+    processes, which objects with the default `repr` don't have.
+    """
+
+    try:
+        prefix = _key_prefixes[func]
+    except (KeyError, TypeError):
+        prefix = '%s.%s:' % (func.__module__, getattr(func, '__qualname__', func.__name__))
+
+        try:
+            _key_prefixes[func] = prefix
+        except TypeError:
+            #not weakly referenceable, e.g. a builtin
+            pass
+
+    key = prefix + ':'.join(map(repr, args))
+
+    if kwargs:
+        key += '|' + ':'.join(['%s=%r' % (name, kwargs[name]) for name in sorted(kwargs)])
+
+    return hash_long_key(key)
+
+def hash_long_key(key):
+    """Returns `key` if it's a valid memcached key, otherwise its prefix (up
+    to the first ':') followed by a blake2b hash of the whole key."""
+
+    if key.isascii():
+        if len(key) <= MAX_KEY_LENGTH and key.isprintable() and ' ' not in key:
+            return key
+    elif len(key.encode('utf-8')) <= MAX_KEY_LENGTH and key.isprintable() and ' ' not in key:
+        return key
+
+    prefix = key.split(':', 1)[0]
+
+    if len(prefix) > 200 or not prefix.isascii() or not prefix.isprintable() or ' ' in prefix:
+        prefix = ''
+
+    return prefix + '#' + hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+
+def jittered_expires(expires, jitter=None):
+    """Returns `expires` shortened by a random fraction of up to `jitter`, so
+    that keys written together don't all expire at the same moment.
+
+    Example::
+
+        jittered_expires(600, 0.1) #somewhere between 540 and 600
+    """
+
+    if not expires or not jitter:
+        return expires
+
+    return expires - expires * jitter * random.random()
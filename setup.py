@@ -16,7 +16,7 @@ setup(
 
     name="pycacher",
     version=__version__,
-    packages=['pycacher'],
+    packages=['pycacher', 'pycacher.aio'],
     author="Garindra Prahandono",
     install_requires=['python-memcached'],
     author_email="garindraprahandono@gmail.com",